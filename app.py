@@ -1,12 +1,147 @@
-from flask import Flask, request, render_template
+import os
+import sys
+import time
 
+from flask import Flask, Response, request, render_template, url_for, stream_with_context, g, abort
+
+import metrics
+
+from datasource.async_rest import AsyncRestDataSource
+from datasource.base import Range, InvalidPageError
+from datasource.expression import compile_filter, all_of, FilterSyntaxError
 from datasource.rest import RestDataSource
+from datasource.search import search_plan
+from datasource.shared import CatalogPublisher, SharedCatalogDataSource
 from models.product import ProductStatus
-from utils import parse_sort_by_arg
+from rendering import render_rows, dumps, products_to_dict, iter_csv, iter_ndjson
+from utils import parse_sort_by_arg, iter_chunks, iter_gzip
 
 app = Flask(__name__)
 
 
+def stream_template(template_name, **context):
+    """
+    renders a template lazily, like render_template() but without building the whole string in memory
+    :param template_name: name of the template to render
+    :param context: variables of the template
+    :return: generator of rendered chunks of at least STREAM_CHUNK_SIZE characters
+    """
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return metrics.timed_iter("render", iter_chunks(template.generate(context), STREAM_CHUNK_SIZE))
+
+
+def get_filter_args():
+    """
+    gets the filter arguments of the request. Allows to filter on "product status", "brand_name" and on a price range
+    given by "min_price" and/or "max_price". A filter expression in "filter" (see datasource/expression.py) and a
+    search query in "q" (see datasource/search.py) are combined with them, e.g. filter=brand_name IN (Acme, Zed) OR
+    price >= 100, q=acme anv
+    :return: dict of filter args as expected by datasource.filter(), or the compiled plan of a filter expression
+    or search which can not be expressed as such a dict
+    """
+    filter_args = {}
+    status_str = request.args.get("status")
+    if status_str is not None:
+        status = ProductStatus[status_str.upper()]
+        filter_args["status"] = status
+
+    brand_name = request.args.get("brand_name")
+    if brand_name is not None:
+        filter_args["brand_name"] = brand_name
+
+    min_price = request.args.get("min_price", type=float)
+    max_price = request.args.get("max_price", type=float)
+    if min_price is not None or max_price is not None:
+        filter_args["price"] = Range(min_price, max_price)
+
+    plans = []
+    expression = request.args.get("filter")
+    if expression is not None:
+        # plans are compiled once per distinct expression
+        plans.append(compile_filter(expression))
+    search = search_plan(request.args.get("q", ""))
+    if search is not None:
+        plans.append(search)
+    if plans:
+        plan = all_of(plans).combine(filter_args)
+        return plan if plan.filter_by is None else plan.filter_by
+    return filter_args
+
+
+def get_page_args():
+    """
+    gets the pagination arguments of the request: "limit" (page size), "offset" and "cursor" (from the link to the
+    next page, takes precedence over offset)
+    :return: dict of limit, offset and cursor as expected by datasource.get_products()
+    """
+    return {
+        "limit": request.args.get("limit", type=int),
+        "offset": request.args.get("offset", default=0, type=int),
+        "cursor": request.args.get("cursor"),
+    }
+
+
+def get_next_page_url(page):
+    """
+    :param page: page of products returned by datasource.get_products()
+    :return: url of the current endpoint with the same args pointing to the next page, None if there is none
+    """
+    if page.next_cursor is None:
+        return None
+    args = request.args.to_dict()
+    args.pop("offset", None)
+    args["cursor"] = page.next_cursor
+    return url_for(request.endpoint, **args)
+
+
+def get_catalog_etag(snapshot):
+    """
+    :param snapshot: catalog snapshot the response is built from
+    :return: strong ETag of the responses built from the snapshot. It is derived from the content of the catalog, so
+    the same url gives the same body for equal catalogs, in every worker and after a restart
+    """
+    return "catalog-{}".format(snapshot.digest)
+
+
+def get_not_modified_response(snapshot):
+    """
+    :param snapshot: current catalog snapshot
+    :return: empty 304 response if the client already has the response for the snapshot (If-None-Match), else None
+    """
+    etag = get_catalog_etag(snapshot)
+    if not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def get_json_cache_key(filter_args, sort_args=None, page_args=None):
+    """
+    only the unfiltered response and the responses filtered on status alone are serialized once and kept with the
+    catalog snapshot, so a snapshot keeps at most one of them per status
+    :return: name of the kept response or None if the response is serialized per request
+    """
+    if sort_args or not isinstance(filter_args, dict) or set(filter_args) - {"status"}:
+        return None
+    if page_args and (page_args["limit"] is not None or page_args["offset"] or page_args["cursor"]):
+        return None
+    status = filter_args.get("status")
+    return "all" if status is None else status.name.lower()
+
+
+def json_response(body, snapshot):
+    """
+    :param body: serialized JSON
+    :param snapshot: catalog snapshot the body was built from
+    :return: JSON response with the ETag of the snapshot
+    """
+    response = Response(body, mimetype="application/json")
+    response.set_etag(get_catalog_etag(snapshot))
+    return response
+
+
 def get_stats_for_filtered_and_org_products(org_products=None, filtered_products=None):
     """
     gets statistics for both filtered and original products. If they are not provided get a whole
@@ -15,12 +150,7 @@ def get_stats_for_filtered_and_org_products(org_products=None, filtered_products
     :param filtered_products: filtered products list on filter_args
     :return: dict of stats and stats template
     """
-    # Get filter arguments. Allow to filter only on "product status"
-    filter_args = {}
-    status_str = request.args.get("status")
-    if status_str is not None:
-        status = ProductStatus[status_str.upper()]
-        filter_args["status"] = status
+    filter_args = get_filter_args()
 
     stats = datasource.get_statistics(filter_args, org_products, filtered_products)
     return {'stats': stats, 'stats_template': "statistics.html"}
@@ -32,22 +162,16 @@ def get_org_products_and_filtered_sorted_products():
     :return: dict of original_products which are unfiltered and unsorted, filtered_sorted_products lst,
     products template name, column names var
     """
-    # Get filter arguments. Allow to filter only on "product status"
-    filter_args = {}
-    status_str = request.args.get("status")
-    if status_str is not None:
-        status = ProductStatus[status_str.upper()]
-        filter_args["status"] = status
+    filter_args = get_filter_args()
 
     # Get sort param
     sort_by_str = request.args.get("sort_by")
     # form the sort dict
     sort_args = parse_sort_by_arg(sort_by_str)
-    # get products filtered and sorted
-    filtered_sorted_products, org_products = datasource.get_products(filter_args, sort_args)
-    # convert Enum values to represent only name
-    for product in filtered_sorted_products:
-        product['status'] = product['status'].name
+    # get products filtered and sorted, or only the requested page of them
+    filtered_sorted_products, org_products = datasource.get_products(filter_args, sort_args, **get_page_args())
+    # products are shared with the catalog cache, so they must not be modified here. The template shows
+    # only the name of the status Enum
 
     col_names = [
         "product_id",
@@ -57,7 +181,55 @@ def get_org_products_and_filtered_sorted_products():
         "status",
     ]
     return {'org_products': org_products, 'filtered_sorted_products': filtered_sorted_products,
-            'products_template': 'products_table.html', 'col_names': col_names}
+            'products_template': 'products_table.html', 'col_names': col_names,
+            'next_url': get_next_page_url(filtered_sorted_products)}
+
+
+@app.errorhandler(FilterSyntaxError)
+def filter_syntax_error(error):
+    """
+    :return: 400 response with the reason a filter expression was rejected
+    """
+    return Response(str(error), status=400, mimetype="text/plain")
+
+
+@app.errorhandler(InvalidPageError)
+def invalid_page_error(error):
+    """
+    :return: 400 response for a malformed cursor or a negative limit or offset
+    """
+    return Response(str(error), status=400, mimetype="text/plain")
+
+
+@app.before_request
+def start_request_metrics():
+    """
+    starts timing the request and collecting its stages for the Server-Timing header
+    """
+    if metrics.REGISTRY.enabled:
+        g.started_at = time.perf_counter()
+        metrics.start_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    records the duration and status of the request and adds the Server-Timing header with the time of every stage
+    of the request. Streamed responses are timed until their body starts, the rendering of the body is only in the
+    histograms
+    """
+    started_at = g.pop("started_at", None)
+    if started_at is None:
+        return response
+    seconds = time.perf_counter() - started_at
+    endpoint = request.endpoint or "unknown"
+    REQUEST_SECONDS.observe(endpoint, value=seconds)
+    REQUESTS.inc(endpoint, str(response.status_code))
+    timing = metrics.server_timing()
+    metrics.end_request()
+    total = "total;dur={:.3f}".format(seconds * 1000)
+    response.headers["Server-Timing"] = total if timing is None else "{}, {}".format(timing, total)
+    return response
 
 
 @app.route("/statistics", methods=["GET"])
@@ -69,10 +241,65 @@ def get_statistics():
     :return: html template that shows the statistics of the filtered and unfiltered products
     """
     result_context = get_stats_for_filtered_and_org_products()
-    return render_template(
-        result_context.get('stats_template', 'statistics.html'),
-        stats=result_context['stats']
-    )
+    with metrics.stage("render"):
+        return render_template(
+            result_context.get('stats_template', 'statistics.html'),
+            stats=result_context['stats']
+        )
+
+
+@app.route("/statistics.json", methods=["GET"])
+def get_statistics_json():
+    """
+    gets invoked when opened https://<host>:<port>/statistics.json
+    same statistics as /statistics, as JSON. Unchanged catalogs are answered with 304 Not Modified.
+    :return: JSON of the statistics of the filtered and unfiltered products
+    """
+    filter_args = get_filter_args()
+    snapshot = datasource.get_snapshot()
+    not_modified = get_not_modified_response(snapshot)
+    if not_modified is not None:
+        return not_modified
+
+    def serialize():
+        filtered_products = datasource.filter(snapshot.products, filter_args)
+        stats = datasource.get_statistics(filter_args, snapshot.raw_products, filtered_products)
+        with metrics.stage("serialize"):
+            return dumps(stats)
+
+    cache_key = get_json_cache_key(filter_args)
+    body = serialize() if cache_key is None else snapshot.derive("statistics.json:" + cache_key, serialize)
+    return json_response(body, snapshot)
+
+
+@app.route("/products.json", methods=["GET"])
+def get_products_json():
+    """
+    gets invoked when opened https://<host>:<port>/products.json
+    same products as /products (filter, sort and page args), as JSON with the total no of products and the cursor of
+    the next page. Unchanged catalogs are answered with 304 Not Modified.
+    :return: JSON of the products
+    """
+    filter_args = get_filter_args()
+    sort_args = parse_sort_by_arg(request.args.get("sort_by"))
+    page_args = get_page_args()
+    snapshot = datasource.get_snapshot()
+    not_modified = get_not_modified_response(snapshot)
+    if not_modified is not None:
+        return not_modified
+
+    def serialize(products):
+        with metrics.stage("serialize"):
+            return dumps(products_to_dict(products))
+
+    cache_key = get_json_cache_key(filter_args, sort_args, page_args)
+    if cache_key is not None:
+        # built from the same snapshot as the ETag, even if a newer one was fetched meanwhile
+        body = snapshot.derive("products.json:" + cache_key, lambda: serialize(
+            datasource.filter(snapshot.products, filter_args)))
+        return json_response(body, snapshot)
+    page, _ = datasource.get_products(filter_args, sort_args, **page_args)
+    return json_response(serialize(page), getattr(page, "snapshot", snapshot))
 
 
 @app.route("/products", methods=["GET"])
@@ -84,11 +311,82 @@ def get_products():
     :return: html template that shows the table of products
     """
     result_context = get_org_products_and_filtered_sorted_products()
-    return render_template(
+    # the table is sent in chunks while it is rendered
+    return Response(stream_with_context(stream_template(
         result_context.get('products_template', 'products_table.html'),
         records=result_context['filtered_sorted_products'],
-        col_names=result_context['col_names']
-    )
+        rows=render_rows(result_context['filtered_sorted_products'], result_context['col_names'], STREAM_CHUNK_SIZE),
+        col_names=result_context['col_names'],
+        next_url=result_context['next_url']
+    )), mimetype="text/html")
+
+
+@app.route("/export", methods=["GET"])
+def export():
+    """
+    gets invoked when opened https://<host>:<port>/export
+    the products of /products.json (filter, sort and page args) as CSV (format=csv, the default) or NDJSON
+    (format=ndjson), gzip compressed if the client accepts it. The products are serialized batch by batch while the
+    response is sent, so the whole export is never held in memory. An interrupted export is resumed with
+    offset=<no of received products>, with If-Match: <ETag of the interrupted response> it is refused (412) if the
+    catalog changed since. A limited export links the next one in its Link header.
+    :return: streamed CSV or NDJSON of the products
+    """
+    export_format = request.args.get("format", "csv").lower()
+    if export_format not in EXPORT_FORMATS:
+        return Response("Unknown export format {!r}".format(export_format), status=400, mimetype="text/plain")
+    write, mimetype = EXPORT_FORMATS[export_format]
+    filter_args = get_filter_args()
+    sort_args = parse_sort_by_arg(request.args.get("sort_by"))
+    snapshot = datasource.get_snapshot()
+    batches = datasource.get_product_batches(filter_args, sort_args, batch_size=EXPORT_BATCH_SIZE, **get_page_args())
+    compress = request.accept_encodings.quality("gzip") > 0
+    etag = get_catalog_etag(getattr(batches, "snapshot", snapshot))
+    if compress:
+        # the gzip body is another representation, so it needs another strong ETag
+        etag += "-gzip"
+    if request.if_match and not request.if_match.contains(etag):
+        return Response("The catalog changed since the export started", status=412, mimetype="text/plain")
+
+    chunks = (chunk.encode() for chunk in metrics.timed_iter("serialize", write(batches)))
+    headers = {
+        "Content-Disposition": "attachment; filename=products.{}".format(export_format),
+        "X-Total-Count": str(batches.total),
+    }
+    if compress:
+        chunks = iter_gzip(chunks, EXPORT_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    next_url = get_next_page_url(batches)
+    if next_url is not None:
+        headers["Link"] = '<{}>; rel="next"'.format(next_url)
+    response = Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """
+    gets invoked when opened https://<host>:<port>/health
+    :return: JSON with the version, age in seconds and no of products of the cached catalog
+    """
+    snapshot = datasource.cache.peek()
+    if snapshot is None:
+        return {"status": "loading", "catalog_version": None, "catalog_age": None, "products": 0}
+    return {"status": "ok", "catalog_version": snapshot.version, "catalog_age": datasource.get_snapshot_age(),
+            "products": len(snapshot)}
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    gets invoked when opened https://<host>:<port>/metrics
+    :return: the metrics of the process in the Prometheus text format, 404 if the metrics are disabled
+    """
+    if not metrics.REGISTRY.enabled:
+        abort(404)
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route("/")
@@ -100,34 +398,172 @@ def index():
     """
     # get products filtered and sorted
     products_context = get_org_products_and_filtered_sorted_products()
-    # get statistics for original unfiltered and filtered products
-    stats_context = get_stats_for_filtered_and_org_products(
-        org_products=products_context['org_products'],
-        filtered_products=products_context['filtered_sorted_products']
-    )
-    return render_template(
-        products_context.get('products_template', 'products_table.html'),
-        records=products_context['filtered_sorted_products'],
-        col_names=products_context['col_names']
-    ) + render_template(
-        stats_context.get('stats_template', 'statistics.html'),
-        stats=stats_context['stats']
-    )
+    filtered_sorted_products = products_context['filtered_sorted_products']
+
+    def generate():
+        # the table is sent in chunks while it is rendered, the statistics follow it
+        yield from stream_template(
+            products_context.get('products_template', 'products_table.html'),
+            records=filtered_sorted_products,
+            rows=render_rows(filtered_sorted_products, products_context['col_names'], STREAM_CHUNK_SIZE),
+            col_names=products_context['col_names'],
+            next_url=products_context['next_url']
+        )
+        # get statistics for original unfiltered and filtered products. A page of the filtered products is not
+        # enough for the statistics, then they are computed on the whole filtered list
+        is_complete = filtered_sorted_products.total == len(filtered_sorted_products)
+        stats_context = get_stats_for_filtered_and_org_products(
+            org_products=products_context['org_products'],
+            filtered_products=filtered_sorted_products if is_complete else None
+        )
+        yield from stream_template(
+            stats_context.get('stats_template', 'statistics.html'),
+            stats=stats_context['stats']
+        )
+
+    return Response(stream_with_context(generate()), mimetype="text/html")
 
 
 # Globals
 PORT = 5001
+# flask debug mode, with the reloader which restarts the server when a source file changes
+DEBUG = True
+# min no of characters sent at once by streamed responses
+STREAM_CHUNK_SIZE = 16 * 1024
 BEAUTYLISH_REST_API_URL = "https://www.beautylish.com/rest/interview-product/list/"
-datasource = RestDataSource(BEAUTYLISH_REST_API_URL)
+# seconds the catalog is served from the cache, and seconds after that it is served stale while refreshing
+CATALOG_CACHE_TTL = 60
+CATALOG_STALE_TTL = 300
+# (connect, read) timeouts in seconds and max no of retries of the upstream requests
+UPSTREAM_TIMEOUT = (3.05, 30)
+UPSTREAM_RETRIES = 3
+# parse the upstream payload item by item while it is downloaded
+CATALOG_STREAMING = True
+# mean seconds between background refreshes of the catalog (below CATALOG_CACHE_TTL) and their random deviation
+CATALOG_REFRESH_INTERVAL = 30
+CATALOG_REFRESH_JITTER = 0.1
+# max no of filtered and sorted product lists kept per catalog version
+QUERY_CACHE_SIZE = 128
+# file the last fetched catalog is saved to and restored from at startup, None disables it
+CATALOG_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.snapshot")
+# urls of the pages/shards of the product list, if it is spread over several urls, and how many are fetched at once
+BEAUTYLISH_REST_API_SHARD_URLS = []
+UPSTREAM_CONCURRENCY = 8
+# file in shared memory (e.g. datasource.shared.default_shared_path()) the catalog is published to by a single
+# `python app.py publish` process. If set, the workers of the server attach to it instead of fetching the upstream
+CATALOG_SHARED_PATH = None
+# seconds between two checks of the shared catalog for a new version
+CATALOG_SHARED_CHECK_INTERVAL = 1.0
+# build the search index (q=) of every catalog version when it is loaded instead of on the first search. A publisher
+# of a shared catalog always builds it, the workers map it from the published file
+CATALOG_SEARCH_INDEX = False
+# products serialized at a time by /export, and the zlib level of its gzip encoding (fast rather than small)
+EXPORT_BATCH_SIZE = 1000
+EXPORT_GZIP_LEVEL = 1
+# writer and mimetype of every /export format
+EXPORT_FORMATS = {"csv": (iter_csv, "text/csv"), "ndjson": (iter_ndjson, "application/x-ndjson")}
+# record metrics (/metrics, Server-Timing header). Disabled they cost about nothing
+METRICS_ENABLED = True
+if CATALOG_SHARED_PATH:
+    datasource = SharedCatalogDataSource(CATALOG_SHARED_PATH, check_interval=CATALOG_SHARED_CHECK_INTERVAL,
+                                         query_cache_size=QUERY_CACHE_SIZE, search_index=CATALOG_SEARCH_INDEX)
+elif BEAUTYLISH_REST_API_SHARD_URLS:
+    datasource = AsyncRestDataSource(BEAUTYLISH_REST_API_SHARD_URLS, max_concurrency=UPSTREAM_CONCURRENCY,
+                                     cache_ttl=CATALOG_CACHE_TTL, stale_ttl=CATALOG_STALE_TTL,
+                                     timeout=UPSTREAM_TIMEOUT, retries=UPSTREAM_RETRIES,
+                                     query_cache_size=QUERY_CACHE_SIZE, snapshot_path=CATALOG_SNAPSHOT_PATH,
+                                     search_index=CATALOG_SEARCH_INDEX)
+else:
+    datasource = RestDataSource(BEAUTYLISH_REST_API_URL, cache_ttl=CATALOG_CACHE_TTL, stale_ttl=CATALOG_STALE_TTL,
+                                timeout=UPSTREAM_TIMEOUT, retries=UPSTREAM_RETRIES, stream=CATALOG_STREAMING,
+                                query_cache_size=QUERY_CACHE_SIZE, snapshot_path=CATALOG_SNAPSHOT_PATH,
+                                search_index=CATALOG_SEARCH_INDEX)
+
+metrics.REGISTRY.enabled = METRICS_ENABLED
+
+
+def get_catalog_metrics():
+    """
+    :return: no of raw and distinct products of the cached catalog by kind, for the catalog size gauge
+    """
+    snapshot = datasource.cache.peek()
+    if snapshot is None:
+        return {}
+    return {("raw",): len(snapshot.raw_products), ("distinct",): len(snapshot.products)}
+
+
+def get_cache_metrics(cache, names):
+    """
+    :param cache: catalog or query cache of the datasource
+    :param names: dict of the result label of every counted key of cache.stats()
+    :return: value of every result label
+    """
+    stats = cache.stats()
+    return {(label,): stats[key] for key, label in names.items()}
+
+
+REQUEST_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "beautylish_http_request_duration_seconds", "Time until the response (or its streamed body) starts",
+    ("endpoint",)))
+REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "beautylish_http_requests_total", "Requests by endpoint and status code", ("endpoint", "status")))
+metrics.REGISTRY.register(metrics.Gauge(
+    "beautylish_catalog_products", "Products of the cached catalog, with (raw) and without (distinct) duplicates",
+    ("kind",), callback=get_catalog_metrics))
+metrics.REGISTRY.register(metrics.Gauge(
+    "beautylish_catalog_age_seconds", "Seconds since the cached catalog was fetched or revalidated",
+    callback=lambda: {} if datasource.get_snapshot_age() is None else {(): datasource.get_snapshot_age()}))
+metrics.REGISTRY.register(metrics.CallbackCounter(
+    "beautylish_catalog_cache_requests_total", "Catalog lookups answered fresh (hit), stale while revalidating "
+    "(stale) or by waiting for a load (miss)", ("result",),
+    callback=lambda: get_cache_metrics(datasource.cache, {"hits": "hit", "stale_hits": "stale", "misses": "miss"})))
+metrics.REGISTRY.register(metrics.CallbackCounter(
+    "beautylish_catalog_loads_total", "Loads of the catalog from the upstream, including revalidations",
+    callback=lambda: {(): datasource.cache.stats()["loads"]}))
+metrics.REGISTRY.register(metrics.CallbackCounter(
+    "beautylish_query_cache_requests_total", "Product queries answered from the query cache (hit) or computed "
+    "(miss)", ("result",),
+    callback=lambda: get_cache_metrics(datasource.query_cache, {"hits": "hit", "misses": "miss"})))
+metrics.REGISTRY.register(metrics.CallbackCounter(
+    "beautylish_query_cache_evictions_total", "Query results evicted from the query cache",
+    callback=lambda: {(): datasource.query_cache.stats()["evictions"]}))
 
 
 def main():
     """
-    runs the flask server on the provided host and port
+    runs the flask server on the provided host and port, after loading the catalog. The catalog saved by the last
+    run is served right away if there is one. The catalog is refreshed in the background, requests do not wait for
+    the upstream
+    :return:
+    """
+    # in debug mode the reloader runs main() in a parent process which only watches the source files, the server runs
+    # in a child process (WERKZEUG_RUN_MAIN set). Only the server loads and refreshes the catalog
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        datasource.load_persisted_snapshot()
+        # workers of a shared catalog only check the published file
+        interval = CATALOG_SHARED_CHECK_INTERVAL if CATALOG_SHARED_PATH else CATALOG_REFRESH_INTERVAL
+        datasource.start_refresher(interval, CATALOG_REFRESH_JITTER)
+    app.run(host="0.0.0.0", port=PORT, debug=DEBUG)
+
+
+def publish():
+    """
+    fetches the catalog in the background and publishes every new version to CATALOG_SHARED_PATH, until the
+    process is stopped
     :return:
     """
-    app.run(host="0.0.0.0", port=PORT, debug=True)
+    if not CATALOG_SHARED_PATH:
+        sys.exit("CATALOG_SHARED_PATH is not set")
+    publisher = CatalogPublisher(BEAUTYLISH_REST_API_URL, CATALOG_SHARED_PATH, cache_ttl=CATALOG_CACHE_TTL,
+                                 stale_ttl=CATALOG_STALE_TTL, timeout=UPSTREAM_TIMEOUT, retries=UPSTREAM_RETRIES,
+                                 stream=CATALOG_STREAMING, query_cache_size=0)
+    publisher.load_persisted_snapshot()
+    publisher.start_refresher(CATALOG_REFRESH_INTERVAL, CATALOG_REFRESH_JITTER)
+    publisher.refresher.join()
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:] == ["publish"]:
+        publish()
+    else:
+        main()
@@ -0,0 +1,95 @@
+# seeded synthetic catalogs in the format of the upstream product list, for the benchmarks
+
+import json
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+ADJECTIVES = ("Velvet", "Matte", "Radiant", "Hydrating", "Silk", "Glow", "Pure", "Nourishing", "Bold", "Soft",
+              "Luminous", "Daily", "Intense", "Gentle", "Satin", "Ultra")
+NOUNS = ("Lipstick", "Serum", "Foundation", "Mascara", "Cleanser", "Toner", "Blush", "Palette", "Brush", "Primer",
+         "Moisturizer", "Concealer", "Eyeliner", "Mist", "Balm", "Mask")
+# share of the products which are deleted and hidden
+DELETED_RATE = 0.05
+HIDDEN_RATE = 0.08
+# rows generated at once, bounds the memory of very large catalogs
+BLOCK_SIZE = 100000
+
+
+def _brand_count(size: int) -> int:
+    # a few dozen brands for small catalogs, a few thousand for the largest ones
+    return int(min(5000, max(20, size ** 0.5)))
+
+
+def iter_catalog(size: int, seed: int = 0, duplicate_rate: float = 0.1) -> Iterator[Dict[str, Any]]:
+    """
+    generates the items of a catalog as the upstream returns them. Brands follow a Zipf like distribution (few
+    brands have most of the products), prices a log-normal one around $25 with charm prices (.99, .00), and
+    duplicate_rate of the rows repeat one of the last BLOCK_SIZE distinct rows. The same seed always gives the same
+    catalog.
+    :param size: no of rows, including duplicates
+    :param seed: seed of the random generator
+    :param duplicate_rate: share of the rows which are duplicates of an earlier row
+    :return: generator of product dicts
+    """
+    rng = np.random.default_rng(seed)
+    nbrands = _brand_count(size)
+    weights = 1.0 / np.arange(1, nbrands + 1) ** 1.1
+    weights /= weights.sum()
+    brands = ["Brand {:04d}".format(code) for code in range(nbrands)]
+    ndistinct = max(1, size - int(size * duplicate_rate))
+    # ring of the last BLOCK_SIZE distinct rows, which duplicates are copied from
+    recent = []  # type: List[Dict[str, Any]]
+    next_id = 1000
+    remaining = size
+    while remaining > 0:
+        block = min(BLOCK_SIZE, remaining)
+        brand_codes = rng.choice(nbrands, size=block, p=weights)
+        cents = np.clip(np.round(rng.lognormal(np.log(25), 0.9, size=block) * 100), 100, 500000).astype(np.int64)
+        charm = rng.random(block)
+        cents = np.where(charm < 0.3, cents // 100 * 100 + 99, np.where(charm < 0.5, cents // 100 * 100, cents))
+        flags = rng.random(block)
+        names = rng.integers(0, len(ADJECTIVES) * len(NOUNS), size=block)
+        duplicate = rng.random(block) < (size - ndistinct) / size
+        picks = rng.random(block)
+        for row in range(block):
+            if recent and duplicate[row]:
+                yield recent[int(picks[row] * len(recent))]
+                continue
+            name = names[row]
+            item = {
+                "deleted": bool(flags[row] < DELETED_RATE),
+                "price": "${:,}.{:02d}".format(*divmod(int(cents[row]), 100)),
+                "brand_name": brands[brand_codes[row]],
+                "id": next_id,
+                "hidden": bool(DELETED_RATE <= flags[row] < DELETED_RATE + HIDDEN_RATE),
+                "product_name": "{} {} {}".format(ADJECTIVES[name % len(ADJECTIVES)], NOUNS[name // len(ADJECTIVES)],
+                                                  next_id),
+            }
+            if len(recent) < BLOCK_SIZE:
+                recent.append(item)
+            else:
+                recent[next_id % BLOCK_SIZE] = item
+            next_id += 1
+            yield item
+        remaining -= block
+
+
+def generate_catalog(size: int, seed: int = 0, duplicate_rate: float = 0.1) -> List[Dict[str, Any]]:
+    """
+    :return: list of the items of iter_catalog()
+    """
+    return list(iter_catalog(size, seed=seed, duplicate_rate=duplicate_rate))
+
+
+def write_catalog(path: str, size: int, seed: int = 0, duplicate_rate: float = 0.1):
+    """
+    writes {"products": [...]} of a synthetic catalog to path, item by item, e.g. for catalogs too large to be
+    kept in memory
+    """
+    with open(path, "w") as file:
+        file.write('{"products": [')
+        for position, item in enumerate(iter_catalog(size, seed=seed, duplicate_rate=duplicate_rate)):
+            file.write(", " if position else "")
+            file.write(json.dumps(item))
+        file.write("]}")
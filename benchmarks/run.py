@@ -0,0 +1,240 @@
+# runs the benchmark suite against a local stand-in of the upstream and compares the results with a baseline
+#
+#   python -m benchmarks.run                                  # sizes 10^3, 10^4 and 10^5, compared to baseline.json
+#   python -m benchmarks.run --sizes 1000000 10000000 --output results.json
+#   python -m benchmarks.run --save-baseline                  # stores the results as the new baseline
+#
+# exits with status 1 if a benchmark got slower than its baseline by more than the tolerance, or has no baseline, and
+# with status 2 without comparing if the baseline was recorded with other versions of python or numpy
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Iterator, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.catalog import write_catalog
+from datasource.expression import compile_filter
+from datasource.rest import RestDataSource
+from datasource.search import search_plan, SearchIndex
+from models.product import ProductStatus
+from tests.upstream import UpstreamServer
+from rendering import iter_csv, iter_ndjson
+from utils import parse_sort_by_arg
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = (1000, 10000, 100000)
+# a benchmark is a regression if its fastest run is more than TOLERANCE slower than the fastest run of the baseline.
+# The fastest run is the least disturbed by the machine (other processes, gc), medians are reported for reading
+TOLERANCE = 0.5
+# timings below this many seconds are too noisy to be compared
+MIN_COMPARED_SECONDS = 50e-6
+# entries of the meta data of the results which must be equal to compare them with a baseline
+ENVIRONMENT = ("python", "numpy")
+
+SORT_BY = OrderedDict([("price", False), ("brand_name", True)])
+FILTER_BY = {"status": ProductStatus.ACTIVE}
+FILTER_EXPRESSION = 'status = active AND (brand_name IN ("Brand 0001", "Brand 0007") OR price BETWEEN 20 AND 40)'
+SEARCH_QUERY = "soft 0007"
+
+
+def _benchmarks(data_source: RestDataSource, client) -> Iterator[Tuple[str, Callable[[], Any]]]:
+    """
+    :return: name and callable of every benchmark on a catalog, the data source is warm except where noted
+    """
+    def cold_raw_product_data():
+        data_source.invalidate()
+        return data_source.get_raw_product_data()
+
+    products = data_source.get_processed_product_data()
+    filtered = data_source.filter(products, FILTER_BY)
+    yield "get_raw_product_data.cold", cold_raw_product_data
+    data_source.get_raw_product_data()
+    yield "get_raw_product_data", data_source.get_raw_product_data
+    yield "get_processed_product_data", data_source.get_processed_product_data
+    yield "filter", lambda: data_source.filter(data_source.get_processed_product_data(), FILTER_BY)
+    yield "filter.list", lambda: data_source.filter(list(products), FILTER_BY)
+    plan = compile_filter(FILTER_EXPRESSION)
+    yield "filter.expression", lambda: data_source.filter(data_source.get_processed_product_data(), plan)
+    yield "filter.expression.list", lambda: data_source.filter(list(products), plan)
+    indexes = data_source.get_snapshot().indexes
+    yield "search.index", lambda: SearchIndex(indexes)
+    search = search_plan(SEARCH_QUERY)
+    yield "search", lambda: data_source.filter(data_source.get_processed_product_data(), search)
+    yield "search.list", lambda: data_source.filter(list(products), search)
+
+    def export(write):
+        return sum(len(chunk) for chunk in write(data_source.get_product_batches(FILTER_BY, SORT_BY)))
+
+    yield "export.csv", lambda: export(iter_csv)
+    yield "export.ndjson", lambda: export(iter_ndjson)
+    yield "sort", lambda: data_source.sort(filtered, SORT_BY)
+    yield "sort.list", lambda: data_source.sort(list(filtered), SORT_BY)
+    yield "get_statistics", lambda: data_source.get_statistics(FILTER_BY)
+
+    def get(path, **args):
+        response = client.get(path, query_string=args)
+        assert response.status_code == 200, "GET {} answered {}".format(path, response.status_code)
+        return response.data
+
+    yield "app./", lambda: get("/", status="active", sort_by="-price", limit=50)
+    yield "app./products", lambda: get("/products", status="active", sort_by="-price,+brand_name")
+    yield "app./statistics", lambda: get("/statistics", status="active")
+    yield "app./products.json?filter", lambda: get("/products.json", filter=FILTER_EXPRESSION, sort_by="-price",
+                                                   limit=50)
+    yield "app./export", lambda: get("/export", status="active", sort_by="-price,+brand_name")
+    yield "app./products.json?q", lambda: get("/products.json", q=SEARCH_QUERY, status="active", sort_by="-price",
+                                              limit=50)
+
+
+def measure(function: Callable[[], Any], repeat: int = 5, min_time: float = 0.2) -> Dict[str, Any]:
+    """
+    times function like timeit: every run calls it as often as needed to take min_time
+    :return: dict of the no of calls per run and the min, median and mean seconds per call
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time and number < 10 ** 6:
+        number *= 10
+    runs = [seconds / number for seconds in timer.repeat(repeat, number)]
+    return {"number": number, "min": min(runs), "median": statistics.median(runs), "mean": statistics.mean(runs)}
+
+
+def run(sizes=DEFAULT_SIZES, seed: int = 0, repeat: int = 5, min_time: float = 0.2,
+        log: Callable[[str], None] = lambda line: None) -> Dict[str, Any]:
+    """
+    runs every benchmark on a synthetic catalog of each size, served by a local upstream. The catalogs are written
+    to a temporary file item by item and streamed from there, only the data source holds them in memory
+    :param sizes: no of rows of the catalogs
+    :param seed: seed of the catalog generator
+    :param repeat: no of timed runs per benchmark
+    :param min_time: min seconds of a timed run
+    :param log: callable receiving a line per finished benchmark
+    :return: results, see the README
+    """
+    import app
+
+    results = OrderedDict()  # type: Dict[str, Dict[str, Any]]
+
+    def record(name, size, function):
+        result = measure(function, repeat=repeat, min_time=min_time)
+        result.update(benchmark=name, size=size)
+        results["{}[{}]".format(name, size)] = result
+        log("{:<40} {:>12.6f} s".format("{}[{}]".format(name, size), result["median"]))
+
+    record("parse_sort_by_arg", 0, lambda: parse_sort_by_arg("+price,-brand_name,+product_name"))
+    # parsing without the cache of compiled plans
+    record("compile_filter", 0, lambda: compile_filter.__wrapped__(FILTER_EXPRESSION))
+    app_data_source = app.datasource
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            catalog_path = os.path.join(directory, "catalog.json")
+            for size in sizes:
+                write_catalog(catalog_path, size, seed=seed)
+                with UpstreamServer() as server:
+                    server.add_file_route("/", catalog_path)
+                    data_source = RestDataSource(server.url, stream=app.CATALOG_STREAMING,
+                                                 query_cache_size=app.QUERY_CACHE_SIZE)
+                    app.datasource = data_source
+                    for name, function in _benchmarks(data_source, app.app.test_client()):
+                        record(name, size, function)
+                    data_source.transport.close()
+    finally:
+        app.datasource = app_data_source
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "seed": seed,
+            "sizes": list(sizes),
+        },
+        "results": results,
+    }
+
+
+def environment_mismatch(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[Tuple[str, Any, Any]]:
+    """
+    :return: name, baseline value and current value of every ENVIRONMENT entry which differs, the results can only
+    be compared with the baseline if there is none. A baseline without the entry differs as well
+    """
+    meta, expected = results.get("meta", {}), baseline.get("meta", {})
+    return [(name, expected.get(name), meta.get(name)) for name in ENVIRONMENT
+            if expected.get(name) != meta.get(name)]
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = TOLERANCE) -> List[Tuple[str, float, float]]:
+    """
+    :return: name, baseline seconds and current seconds (of the fastest run) of every benchmark which is slower
+    than its baseline by more than tolerance, or which has no baseline (baseline seconds None). Catalog sizes the
+    baseline was not run with are not compared
+    """
+    sizes = baseline.get("meta", {}).get("sizes")
+    regressions = []
+    for name, result in results["results"].items():
+        expected = baseline["results"].get(name)
+        if expected is None:
+            if sizes is None or result.get("size", 0) in sizes + [0]:
+                regressions.append((name, None, result["min"]))
+            continue
+        if expected["min"] < MIN_COMPARED_SECONDS:
+            continue
+        if result["min"] > expected["min"] * (1 + tolerance):
+            regressions.append((name, expected["min"], result["min"]))
+    return regressions
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="no of catalog rows")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the catalog generator")
+    parser.add_argument("--repeat", type=int, default=5, help="no of timed runs per benchmark")
+    parser.add_argument("--output", help="file the JSON results are written to")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="results to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, e.g. 0.5 for 50%%")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    options = parser.parse_args(args)
+
+    results = run(options.sizes, seed=options.seed, repeat=options.repeat, log=print)
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if options.save_baseline:
+        with open(options.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        return 0
+    if not os.path.exists(options.baseline):
+        print("No baseline at {}, nothing compared".format(options.baseline))
+        return 0
+    with open(options.baseline) as file:
+        baseline = json.load(file)
+    mismatch = environment_mismatch(results, baseline)
+    for name, expected, found in mismatch:
+        print("ENVIRONMENT MISMATCH {}: baseline {}, current {}".format(name, expected, found))
+    if mismatch:
+        print("NOT COMPARED: record a baseline with --save-baseline in this environment")
+        return 2
+    regressions = compare(results, baseline, options.tolerance)
+    for name, expected, found in regressions:
+        if expected is None:
+            print("MISSING BASELINE {}: {:.6f} s, run with --save-baseline to record it".format(name, found))
+        else:
+            print("REGRESSION {}: {:.6f} s -> {:.6f} s ({:+.0%})".format(name, expected, found,
+                                                                      found / expected - 1))
+    if regressions:
+        print("FAILED: {} benchmarks are slower than the baseline or have none".format(len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+from collections import Counter
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from datasource.columnar import ColumnarCatalog
+from datasource.normalize import to_cents
+from models.product import Product, ProductStatus
+
+
+class StatisticsAggregate:
+    """
+    running aggregate of the statistics of a set of products: how often every product id and brand occurs, and the
+    sum and no of the prices. Products can be added and removed one by one, the statistics are read in O(1). Prices
+    are summed as integer cents, so the sum stays exact however many products are added and removed. Aggregates
+    built from columns keep the counts as arrays, the counters are only created when a product is added or removed.
+    """
+
+    def __init__(self, ids: Optional[Counter] = None, brands: Optional[Counter] = None, price_cents: int = 0,
+                 count: int = 0):
+        """
+        :param ids: no of occurrences of every product id
+        :param brands: no of occurrences of every brand name
+        :param price_cents: sum of the prices of all occurrences, in cents
+        :param count: no of occurrences
+        """
+        self._ids = Counter() if ids is None else ids
+        self._brands = Counter() if brands is None else brands
+        self.price_cents = price_cents
+        self.count = count
+        # keys and counts of the product ids and of the brands while the counters are not created yet
+        self._arrays = None  # type: Optional[tuple]
+
+    @classmethod
+    def from_columns(cls, columns: ColumnarCatalog, positions: Optional[np.ndarray] = None,
+                     weighted: bool = False) -> "StatisticsAggregate":
+        """
+        builds the aggregate with vectorized counts over the columns of a catalog
+        :param columns: columnar catalog
+        :param positions: (optional) positions of the products, defaults to all products
+        :param weighted: if True every product occurs as often as it occurred in the raw catalog, else once
+        :return: aggregate of the products
+        """
+        if positions is None:
+            positions = slice(None)
+        counts = columns.counts[positions] if weighted else np.ones(len(columns.price[positions]), dtype=np.int64)
+        ids = np.bincount(columns.product_id_code[positions], weights=counts, minlength=len(columns.product_ids))
+        brands = np.bincount(columns.brand_name[positions], weights=counts, minlength=len(columns.brand_names))
+        id_codes, brand_codes = np.flatnonzero(ids), np.flatnonzero(brands)
+        aggregate = cls(None, None, int(np.dot(columns.price_cents[positions], counts)), int(counts.sum()))
+        aggregate._arrays = (columns.product_ids[id_codes], ids[id_codes].astype(np.int64),
+                             [columns.brand_names[code] for code in brand_codes.tolist()],
+                             brands[brand_codes].astype(np.int64))
+        return aggregate
+
+    @property
+    def ids(self) -> Counter:
+        """
+        :return: no of occurrences of every product id
+        """
+        self._create_counters()
+        return self._ids
+
+    @property
+    def brands(self) -> Counter:
+        """
+        :return: no of occurrences of every brand name
+        """
+        self._create_counters()
+        return self._brands
+
+    def _create_counters(self):
+        if self._arrays is not None:
+            id_keys, id_counts, brand_keys, brand_counts = self._arrays
+            self._ids = Counter(dict(zip(id_keys.tolist(), id_counts.tolist())))
+            self._brands = Counter(dict(zip(brand_keys, brand_counts.tolist())))
+            self._arrays = None
+
+    def copy(self) -> "StatisticsAggregate":
+        if self._arrays is not None:
+            # the arrays are not modified, the copy shares them
+            aggregate = StatisticsAggregate(None, None, self.price_cents, self.count)
+            aggregate._arrays = self._arrays
+            return aggregate
+        return StatisticsAggregate(self._ids.copy(), self._brands.copy(), self.price_cents, self.count)
+
+    def add(self, product: Product, count: int = 1):
+        """
+        :param product: product to add
+        :param count: no of occurrences of the product
+        """
+        self.ids[product.product_id] += count
+        self.brands[product.brand_name] += count
+        self.price_cents += to_cents(product.price) * count
+        self.count += count
+
+    def remove(self, product: Product, count: int = 1):
+        """
+        :param product: product that was added before
+        :param count: no of occurrences of the product to remove
+        """
+        for counter, key in ((self.ids, product.product_id), (self.brands, product.brand_name)):
+            counter[key] -= count
+            if counter[key] <= 0:
+                del counter[key]
+        self.count -= count
+        self.price_cents -= to_cents(product.price) * count
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        :return: dict with no of distinct product ids, no of distinct brands and average price (None without
+        products)
+        """
+        arrays = self._arrays
+        if arrays is not None:
+            nids, nbrands = len(arrays[1]), len(arrays[3])
+        else:
+            nids, nbrands = len(self._ids), len(self._brands)
+        return {
+            "nproducts": nids,
+            "nbrands": nbrands,
+            "avg_price": self.price_cents / (self.count * 100) if self.count else None,
+        }
+
+
+class CatalogAggregates:
+    """
+    statistics aggregates of a catalog snapshot: of the raw catalog (each product weighted with its no of
+    duplicates), of all distinct products and of the distinct products of every status. The statistics for no
+    filter or a status filter are read from them without looking at the products.
+    """
+
+    def __init__(self, raw: StatisticsAggregate, distinct: StatisticsAggregate,
+                 status: Dict[ProductStatus, StatisticsAggregate]):
+        self.raw = raw
+        self.distinct = distinct
+        self.status = status
+
+    @classmethod
+    def from_columns(cls, columns: ColumnarCatalog) -> "CatalogAggregates":
+        """
+        :param columns: columnar catalog of the distinct products of a snapshot
+        :return: aggregates of the catalog
+        """
+        return cls(
+            StatisticsAggregate.from_columns(columns, weighted=True),
+            StatisticsAggregate.from_columns(columns),
+            {status: StatisticsAggregate.from_columns(columns, np.flatnonzero(columns.status == status.value))
+             for status in ProductStatus},
+        )
+
+    def copy(self) -> "CatalogAggregates":
+        return CatalogAggregates(self.raw.copy(), self.distinct.copy(),
+                                 {status: aggregate.copy() for status, aggregate in self.status.items()})
+
+    def add(self, product: Product, count: int = 1):
+        """
+        :param product: distinct product which is new in the catalog
+        :param count: no of times it occurs in the raw catalog
+        """
+        self.raw.add(product, count)
+        self.distinct.add(product)
+        self.status[product.status].add(product)
+
+    def remove(self, product: Product, count: int = 1):
+        """
+        :param product: distinct product which is no longer in the catalog
+        :param count: no of times it occurred in the raw catalog
+        """
+        self.raw.remove(product, count)
+        self.distinct.remove(product)
+        self.status[product.status].remove(product)
+
+    def get(self, filter_by: Dict[str, Any]) -> Optional[StatisticsAggregate]:
+        """
+        :param filter_by: dict of filter items
+        :return: aggregate of the distinct products matching filter_by, None if filter_by is not empty or a
+        status filter
+        """
+        if not isinstance(filter_by, dict):
+            # a compiled filter expression
+            return None
+        if not filter_by:
+            return self.distinct
+        if set(filter_by) == {"status"} and isinstance(filter_by["status"], ProductStatus):
+            return self.status[filter_by["status"]]
+        return None
@@ -0,0 +1,155 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Sequence, NamedTuple, Tuple, OrderedDict
+
+import requests
+
+from datasource.base import ProductPage
+from datasource.delta import DeltaCatalogBuilder
+from datasource.rest import RestDataSource, InvalidResponseError
+from datasource.snapshot import CatalogSnapshot
+from metrics import stage, inc, UPSTREAM_RESPONSES, UPSTREAM_BYTES
+from models.product import Product
+
+
+class ShardState(NamedTuple):
+    """
+    what a snapshot remembers of one upstream url, to revalidate it on the next refresh
+    """
+    etag: Optional[str]
+    last_modified: Optional[str]
+    # products of the url, in payload order and with duplicates
+    raw_products: List[Product]
+
+
+class AsyncRestDataSource(RestDataSource):
+    """
+    REST datasource whose catalog is spread over several urls, e.g. the pages or shards of the product list. All urls
+    are fetched concurrently, at most max_concurrency at once over one shared connection pool, so a cold load takes
+    about as long as the slowest url. The products of all urls are merged, in the order of the urls, and
+    deduplicated into one catalog.
+    Coroutines (e.g. async Flask views) must use the *_async methods, which never block the event loop while the
+    catalog is fetched: they await the snapshot and query it, without looking at the cache again. The synchronous
+    methods of RestDataSource work as well, outside of an event loop.
+    """
+    data_source_name = "ASYNC_REST"
+
+    def __init__(self, urls: Sequence[str], max_concurrency: int = 8, **kwargs):
+        """
+        :param urls: urls of the parts of the product list, each returning {"products": [...]}
+        :param max_concurrency: max no of urls fetched at the same time
+        :param kwargs: other args of RestDataSource
+        """
+        if not urls:
+            raise ValueError("At least one url is required")
+        kwargs.setdefault("pool_maxsize", max_concurrency)
+        super().__init__(urls[0], **kwargs)
+        self.urls = list(urls)
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="catalog-fetch")
+
+    def _fetch_shard(self, url: str, etag: Optional[str] = None,
+                     last_modified: Optional[str] = None) -> Optional[Tuple[List[Dict[str, Any]], ShardState]]:
+        """
+        fetches one url of the product list, runs in a thread of the executor
+        :return: items of the url and its validators, None if the url answered 304 Not Modified
+        """
+        try:
+            response = self.transport.get(url, etag=etag, last_modified=last_modified)
+        except requests.RequestException as exc:
+            inc(UPSTREAM_RESPONSES, "error")
+            raise InvalidResponseError("Unable to get products from the URL {}: {}".format(url, exc)) from exc
+        inc(UPSTREAM_RESPONSES, str(response.status_code))
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise InvalidResponseError("Unable to get products from the URL {}".format(url))
+        inc(UPSTREAM_BYTES, amount=len(response.content))
+        try:
+            items = response.json()["products"]
+        except (ValueError, KeyError) as exc:
+            raise InvalidResponseError("Unable to parse products from the URL {}: {}".format(url, exc)) from exc
+        return items, ShardState(response.headers.get("ETag"), response.headers.get("Last-Modified"), [])
+
+    async def fetch_shards(self, previous: Optional[Dict[str, ShardState]] = None) -> List[Optional[Tuple]]:
+        """
+        fetches all urls concurrently, conditional for the urls of the previous snapshot
+        :param previous: (optional) states of the urls in the previous snapshot
+        :return: result of _fetch_shard() of every url, in the order of the urls. Raises the first error
+        """
+        loop = asyncio.get_running_loop()
+        previous = previous or {}
+        fetches = []
+        for url in self.urls:
+            state = previous.get(url)
+            validators = (state.etag, state.last_modified) if state is not None else (None, None)
+            fetches.append(loop.run_in_executor(self.executor, self._fetch_shard, url, *validators))
+        return await asyncio.gather(*fetches)
+
+    def _load_snapshot(self, previous: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+        """
+        loader used by the catalog cache. Urls which answer 304 keep their products of the previous snapshot, if no
+        url changed the previous snapshot is returned
+        :param previous: snapshot that is currently cached, if any
+        :return: new catalog snapshot or previous if it did not change
+        """
+        shards = previous.derive("shards", dict) if previous is not None else {}
+        with stage("upstream"):
+            results = asyncio.run(self.fetch_shards(shards))
+        if previous is not None and all(result is None for result in results):
+            return previous
+
+        normalizer = self._normalizer(previous)
+        builder = DeltaCatalogBuilder(normalizer.product, self._fingerprint, previous)
+        states = {}
+        with stage("ingest"):
+            for url, result in zip(self.urls, results):
+                start = len(builder.raw_products)
+                if result is None:
+                    state = shards[url]
+                    for product in state.raw_products:
+                        builder.add(product)
+                else:
+                    items, state = result
+                    for item in items:
+                        builder.add_item(item)
+                states[url] = state._replace(raw_products=builder.raw_products[start:])
+            snapshot = builder.build()
+        snapshot.derive("shards", lambda: states)
+        snapshot.derive("normalizer", lambda: normalizer)
+        return snapshot
+
+    async def get_snapshot_async(self) -> CatalogSnapshot:
+        """
+        :return: current catalog snapshot, a fetch of the upstream runs in a thread while the caller awaits it
+        """
+        snapshot = self.cache.peek()
+        if snapshot is not None and (self.refresher is not None and self.refresher.running
+                                     or self.cache.age() < self.cache.ttl):
+            return snapshot
+        return await asyncio.to_thread(self.get_snapshot)
+
+    async def get_products_async(self, filter_by: Dict[str, Any], sort_by: OrderedDict[str, bool],
+                                 limit: Optional[int] = None, offset: int = 0,
+                                 cursor: Optional[str] = None) -> Tuple[ProductPage, List[Product]]:
+        """
+        awaitable get_products(), see RestDataSource.get_products()
+        """
+        snapshot = await self.get_snapshot_async()
+        return self.get_products(filter_by, sort_by, limit=limit, offset=offset, cursor=cursor, snapshot=snapshot)
+
+    async def get_statistics_async(self, filter_by: Dict[str, Any], org_products=None,
+                                   filtered_products=None) -> Dict[Any, Any]:
+        """
+        awaitable get_statistics(), see RestDataSource.get_statistics()
+        """
+        snapshot = await self.get_snapshot_async()
+        return self.get_statistics(filter_by, org_products, filtered_products, snapshot=snapshot)
+
+    def close(self):
+        """
+        stops the fetch threads and closes all pooled connections
+        """
+        self.stop_refresher()
+        self.executor.shutdown(wait=False)
+        self.transport.close()
@@ -1,7 +1,107 @@
-from typing import Optional, List, Dict, Any, OrderedDict
+import base64
+from typing import Optional, List, Dict, Any, OrderedDict, NamedTuple, Iterable, Iterator, Tuple
 
 from models.product import Product
 
+_CURSOR_PREFIX = "offset:"
+
+
+def encode_cursor(offset: int) -> str:
+    """
+    :param offset: position of the first product of a page in the filtered and sorted list
+    :return: opaque cursor pointing to offset
+    """
+    return base64.urlsafe_b64encode((_CURSOR_PREFIX + str(offset)).encode()).decode()
+
+
+class InvalidPageError(ValueError):
+    """
+    raised for a malformed cursor or a negative limit or offset
+    """
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    :param cursor: cursor returned by encode_cursor()
+    :return: offset the cursor points to, raises InvalidPageError for a malformed cursor
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeError):
+        raise InvalidPageError("Malformed cursor!")
+    if not decoded.startswith(_CURSOR_PREFIX) or not decoded[len(_CURSOR_PREFIX):].isdigit():
+        raise InvalidPageError("Malformed cursor!")
+    return int(decoded[len(_CURSOR_PREFIX):])
+
+
+class Range(NamedTuple):
+    """
+    filter value matching all values between low and high (both inclusive). None means unbounded.
+    Example: filter_by={"price": Range(10, 100)}
+    """
+    low: Optional[float] = None
+    high: Optional[float] = None
+
+    def includes(self, value) -> bool:
+        if value is None:
+            return False
+        return (self.low is None or self.low <= value) and (self.high is None or value <= self.high)
+
+
+class ProductPage(list):
+    """
+    list of products which is (possibly) one page of a longer filtered and sorted list
+    """
+
+    def __init__(self, products: Iterable[Product] = (), total: Optional[int] = None, offset: int = 0):
+        """
+        :param products: products of the page
+        :param total: no of products of the whole list, defaults to the no of products of the page
+        :param offset: position of the first product of the page in the whole list
+        """
+        super().__init__(products)
+        self.total = len(self) if total is None else total
+        self.offset = offset
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        """
+        :return: cursor of the next page, None if this is the last page or empty (e.g. for limit=0), so a client
+        following the cursors cannot loop on the same offset
+        """
+        end = self.offset + len(self)
+        return encode_cursor(end) if len(self) and end < self.total else None
+
+
+class ProductBatches:
+    """
+    filtered and sorted products like a ProductPage, handed out as consecutive batches instead of one list, so the
+    products of a large export need not be kept in one list. The batches can be iterated once.
+    """
+
+    def __init__(self, batches: Iterable[List[Product]], count: int, total: Optional[int] = None, offset: int = 0):
+        """
+        :param batches: lists of the products, in order
+        :param count: no of products in all batches
+        :param total: no of products of the whole list, defaults to count
+        :param offset: position of the first product in the whole list
+        """
+        self.batches = batches
+        self.count = count
+        self.total = count if total is None else total
+        self.offset = offset
+
+    def __iter__(self) -> Iterator[List[Product]]:
+        return iter(self.batches)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        """
+        :return: cursor of the products after the batches, None if they end the list or are empty
+        """
+        end = self.offset + self.count
+        return encode_cursor(end) if self.count and end < self.total else None
+
 
 class DataSource:
     data_source_name = None  # type: Optional[str]
@@ -18,9 +118,28 @@ class DataSource:
         self,
         filter_by: Dict[str, Any],
         sort_by: OrderedDict[str, bool],
-    ) -> List[Product]:
+        limit: Optional[int] = None,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+    ) -> Tuple[ProductPage, List[Product]]:
         raise NotImplementedError("Method get_products() is not implemented.")
 
+    def get_product_batches(
+        self,
+        filter_by: Dict[str, Any],
+        sort_by: OrderedDict[str, bool],
+        limit: Optional[int] = None,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        batch_size: int = 1000,
+    ) -> ProductBatches:
+        """
+        same products as get_products(), in batches of batch_size products
+        """
+        page, _ = self.get_products(filter_by, sort_by, limit=limit, offset=offset, cursor=cursor)
+        batches = (page[start:start + batch_size] for start in range(0, len(page), batch_size))
+        return ProductBatches(batches, len(page), total=page.total, offset=page.offset)
+
     def get_statistics(self, filter_by: Dict[str, Any],
                        org_products: List[Product],
                        filtered_products: List[Product]) -> Dict[str, Any]:
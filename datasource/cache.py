@@ -0,0 +1,316 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional, Any, Dict, Tuple, Hashable
+
+from datasource.snapshot import CatalogSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """
+    in-process cache holding the current catalog snapshot.
+    * while the snapshot is younger than ttl it is served as it is.
+    * once it is older than ttl but younger than ttl + stale_ttl it is still served, and a refresh is started in
+      the background (stale-while-revalidate).
+    * after that (or when nothing is cached yet) the caller loads a new snapshot synchronously.
+    Loads are single-flight: callers which need a snapshot while another one is loading wait for that load and get
+    its snapshot or its error, so a burst of requests on a cold cache calls the upstream only once.
+    """
+
+    def __init__(self, loader: Callable[[Optional[CatalogSnapshot]], CatalogSnapshot],
+                 ttl: float = 60.0, stale_ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        """
+        :param loader: callable which receives the previous snapshot (or None) and returns the new one. It may
+        return the previous snapshot when the upstream reports that nothing changed
+        :param ttl: seconds a snapshot is considered fresh
+        :param stale_ttl: seconds after ttl in which a stale snapshot is still served while revalidating
+        :param clock: monotonic clock, can be replaced in tests
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._snapshot = None  # type: Optional[CatalogSnapshot]
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._loading = None  # type: Optional[Future]
+        self._refreshing_lock = threading.Lock()
+        self._refreshing = False
+        # get() calls answered with a fresh snapshot, with a stale snapshot, and by loading
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def peek(self) -> Optional[CatalogSnapshot]:
+        """
+        :return: the cached snapshot without checking its age, None if nothing is cached
+        """
+        return self._snapshot
+
+    def age(self) -> Optional[float]:
+        """
+        :return: seconds since the cached snapshot was loaded or revalidated, None if nothing is cached
+        """
+        if self._snapshot is None:
+            return None
+        return self.clock() - self._loaded_at
+
+    def get(self) -> CatalogSnapshot:
+        """
+        gets the current snapshot, loading or revalidating it as described in the class docstring
+        :return: catalog snapshot
+        """
+        snapshot, age = self._snapshot, self.age()
+        if snapshot is not None:
+            if age < self.ttl:
+                self.hits += 1
+                return snapshot
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background()
+                return snapshot
+        self.misses += 1
+        return self.refresh()
+
+    def refresh(self, force: bool = False) -> CatalogSnapshot:
+        """
+        loads a snapshot synchronously and stores it in the cache, unless a fresh one got stored while waiting.
+        If a load is already in progress its result is awaited instead of loading again.
+        :param force: if True the snapshot is loaded even if the cached one is fresh
+        :return: the loaded snapshot
+        """
+        with self._lock:
+            # somebody else may have refreshed while we were waiting for the lock
+            if not force and self._snapshot is not None and self.age() < self.ttl:
+                return self._snapshot
+            leader = self._loading is None
+            if leader:
+                self._loading = Future()
+            loading = self._loading
+        if not leader:
+            return loading.result()
+        try:
+            snapshot = self._load()
+        except BaseException as exc:
+            loading.set_exception(exc)
+            raise
+        else:
+            loading.set_result(snapshot)
+        finally:
+            with self._lock:
+                self._loading = None
+        return snapshot
+
+    def put(self, snapshot: CatalogSnapshot, age: float = 0.0):
+        """
+        stores a snapshot which was not loaded by the loader, e.g. one restored from disk at startup
+        :param snapshot: snapshot to cache
+        :param age: seconds since the snapshot was fetched from the upstream, it is revalidated like a cached
+        snapshot of that age
+        """
+        with self._lock:
+            self._snapshot, self._loaded_at = snapshot, self.clock() - max(age, 0.0)
+
+    def invalidate(self):
+        """
+        drops the cached snapshot. The next get() loads a new one from the upstream
+        """
+        with self._lock:
+            self._snapshot = None
+            self._loaded_at = 0.0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: dict of the no of get() calls answered with a fresh snapshot (hits), with a stale snapshot while
+        revalidating (stale_hits) and by waiting for a load (misses), and the no of loads
+        """
+        return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses, "loads": self.loads}
+
+    def _load(self) -> CatalogSnapshot:
+        self.loads += 1
+        snapshot = self.loader(self._snapshot)
+        self._snapshot, self._loaded_at = snapshot, self.clock()
+        return snapshot
+
+    def _refresh_in_background(self):
+        with self._refreshing_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="catalog-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            # keep serving the stale snapshot, the next request past the ttl tries again
+            logger.exception("Background refresh of the catalog failed")
+        finally:
+            self._refreshing = False
+
+
+class CatalogRefresher:
+    """
+    background thread which refreshes the snapshot of a catalog cache on a jittered interval, so requests find a
+    fresh snapshot and never wait for the upstream. A new snapshot replaces the old one at once, requests that
+    already hold the old one keep using it. Failed refreshes are logged, the old snapshot is served meanwhile.
+    """
+
+    def __init__(self, cache: CatalogCache, interval: float = 30.0, jitter: float = 0.1,
+                 rng: Optional[random.Random] = None):
+        """
+        :param cache: catalog cache to refresh
+        :param interval: mean no of seconds between two refreshes, should be below the ttl of the cache
+        :param jitter: max deviation of an interval from the mean, as a fraction of interval. Spreads the refreshes
+        of many processes so they do not hit the upstream at the same time
+        :param rng: (optional) random generator of the jitter, can be seeded in tests
+        """
+        self.cache = cache
+        self.interval = interval
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self._stopped = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def next_interval(self) -> float:
+        """
+        :return: seconds to wait before the next refresh
+        """
+        return self.interval * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def start(self, warm: bool = True) -> "CatalogRefresher":
+        """
+        starts the refresh thread
+        :param warm: if True and nothing is cached yet the catalog is loaded before returning, e.g. at startup
+        before serving requests. A failed load is logged, requests then load the catalog themselves. If a snapshot is
+        cached already (e.g. restored from disk) it is served right away and refreshed by the thread instead
+        :return: self
+        """
+        restored = self.cache.peek() is not None
+        if warm and not restored:
+            try:
+                self.cache.refresh(force=True)
+            except Exception:
+                logger.exception("Loading the catalog at startup failed")
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(warm and restored,), name="catalog-refresher",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        stops the refresh thread, a refresh in progress is finished first
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def join(self, timeout: Optional[float] = None):
+        """
+        waits until the refresh thread is stopped
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, immediately: bool = False):
+        """
+        :param immediately: if True the first refresh starts without waiting for an interval
+        """
+        while not self._stopped.wait(0 if immediately else self.next_interval()):
+            immediately = False
+            try:
+                self.cache.refresh(force=True)
+            except Exception:
+                logger.exception("Scheduled refresh of the catalog failed")
+
+
+class QueryCache:
+    """
+    bounded LRU cache of query results (e.g. filtered and sorted pages) computed from one catalog version. Results
+    are looked up by the version of the catalog they are computed from, all entries are dropped as soon as a newer
+    version is looked up, so a result never outlives its catalog.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        """
+        :param maxsize: max no of kept results, the least recently used result is evicted first. 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self.version = None  # type: Optional[int]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, Any]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(filter_by: Dict[str, Any], sort_by: Dict[str, bool], *args: Hashable) -> Tuple:
+        """
+        canonical key of a query, equal for equivalent queries: the order of the filter items does not matter, the
+        order of the sort items does
+        :param filter_by: dict of Product attribute names and filter values, or a FilterPlan (which is its own key)
+        :param sort_by: dict of Product attribute names, True for ascending and False for descending
+        :param args: other args of the query, e.g. the page
+        :return: hashable key
+        """
+        if isinstance(filter_by, dict):
+            filter_by = tuple(sorted(filter_by.items(), key=lambda item: item[0]))
+        return (filter_by, tuple(sort_by.items())) + args
+
+    def get(self, version: int, key: Tuple, compute: Callable[[], Any]) -> Any:
+        """
+        :param version: version of the catalog the result is computed from
+        :param key: key of the query, see QueryCache.key()
+        :param compute: callable without args which computes the result on a miss
+        :return: the kept result or the computed one
+        """
+        try:
+            hash(key)
+        except TypeError:
+            # filter values which can not be hashed are not cached
+            return compute()
+        with self._lock:
+            if self.version is None or version > self.version:
+                self._entries.clear()
+                self.version = version
+            if version == self.version and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        result = compute()
+        with self._lock:
+            # results of an older catalog, still in use by a slow request, are not kept
+            if version == self.version and self.maxsize > 0:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def clear(self):
+        """
+        drops all kept results, the counters are kept
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: dict of the no of hits, misses and evictions, and the no of kept results
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._entries),
+                "maxsize": self.maxsize}
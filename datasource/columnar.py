@@ -0,0 +1,381 @@
+import bisect
+import hashlib
+import itertools
+import json
+import sys
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Sequence
+
+import numpy as np
+
+from datasource.base import Range
+from models.product import Product, ProductStatus
+
+# Product attributes which can be filtered and sorted on
+COLUMNS = ("product_id", "price", "brand_name", "product_name", "status")
+# composite sort keys must fit in an int64
+MAX_COMPOSITE_KEY = np.iinfo(np.int64).max
+# status of every status value
+_STATUSES = {status.value: status for status in ProductStatus}
+
+
+def _sort_key(value: Optional[str]) -> Tuple[bool, str]:
+    # a missing name (None) sorts before all names, so it can only be the first category
+    return value is not None, value or ""
+
+
+def _position(categories: List[Optional[str]], value: Optional[str]) -> int:
+    """
+    :return: position of value in the sorted categories, like bisect_left() but without comparing None to names
+    """
+    if value is None:
+        return 0
+    return bisect.bisect_left(categories, value, 1 if categories and categories[0] is None else 0)
+
+
+def _categorical(values: Sequence[Optional[str]]) -> Tuple[List[Optional[str]], np.ndarray]:
+    """
+    encodes values as codes into the sorted list of their distinct (interned) values. As the categories are sorted
+    the codes sort in the same order as the values. None (a missing name) is the first category
+    :param values: list of strings or None
+    :return: categories and int32 array of codes
+    """
+    categories = sorted(set(values), key=_sort_key)
+    lookup = {value: code for code, value in enumerate(categories)}
+    codes = np.fromiter((lookup[value] for value in values), dtype=np.int32, count=len(values))
+    return [value if value is None else sys.intern(value) for value in categories], codes
+
+
+def _merge_categorical(categories: List[str], codes: np.ndarray, new_categories: List[str],
+                       new_codes: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """
+    appends the codes of other values to categorical codes. New categories are merged into the sorted categories
+    and the old codes are shifted accordingly, categories without codes are dropped.
+    :param categories: sorted categories of codes
+    :param codes: int32 array of codes
+    :param new_categories: sorted categories of new_codes
+    :param new_codes: int32 array of codes of the values to append
+    :return: merged categories and int32 array of the codes followed by the new codes
+    """
+    extra = [value for value in new_categories if not _contains(categories, value)]
+    # every old code moves up by the no of extra categories sorting before it
+    shift = np.zeros(len(categories) + 1, dtype=np.int32)
+    for value in extra:
+        shift[_position(categories, value)] += 1
+    merged = sorted(categories + extra, key=_sort_key)
+    moved = np.arange(len(categories), dtype=np.int32) + np.cumsum(shift)[:len(categories)]
+    lookup = np.fromiter((_position(merged, value) for value in new_categories), dtype=np.int32,
+                         count=len(new_categories))
+    codes = np.concatenate([moved[codes], lookup[new_codes]]).astype(np.int32)
+
+    used = np.zeros(len(merged), dtype=bool)
+    used[codes] = True
+    if not used.all():
+        codes = (np.cumsum(used, dtype=np.int32) - 1)[codes]
+        merged = list(itertools.compress(merged, used))
+    return merged, codes
+
+
+def _contains(categories: List[Optional[str]], value: Optional[str]) -> bool:
+    position = _position(categories, value)
+    return position < len(categories) and categories[position] == value
+
+
+class ColumnarCatalog:
+    """
+    column oriented copy of a list of distinct products. Filtering, sorting and statistics work on positions into
+    the product list (numpy int arrays), so they run as vectorized numpy operations instead of python loops.
+    """
+    # numpy columns besides the products themselves (objects) and the categories of the string columns
+    ARRAYS = ("product_id", "price", "price_cents", "status", "brand_name", "product_name", "counts", "product_ids",
+              "product_id_code")
+
+    def __init__(self, products: List[Product], counts: Optional[Sequence[int]] = None):
+        """
+        :param products: distinct products
+        :param counts: (optional) no of times each product occurred in the raw catalog, defaults to 1
+        """
+        n = len(products)
+        self._objects = np.empty(n, dtype=object)
+        self._objects[:] = products
+        self._lock = threading.Lock()
+        self.product_id = np.fromiter((product.product_id for product in products), dtype=np.int64, count=n)
+        self.price = np.fromiter((product.price for product in products), dtype=np.float64, count=n)
+        # exact prices, for sums and averages without rounding errors
+        self.price_cents = np.rint(self.price * 100).astype(np.int64)
+        self.status = np.fromiter((product.status.value for product in products), dtype=np.int8, count=n)
+        self.brand_names, self.brand_name = _categorical([product.brand_name for product in products])
+        self.product_names, self.product_name = _categorical([product.product_name for product in products])
+        self.counts = np.ones(n, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        # dense codes of the product ids, for counting distinct ids without sorting
+        self.product_ids, self.product_id_code = np.unique(self.product_id, return_inverse=True)
+        self._ranks = {}  # type: Dict[str, Tuple[np.ndarray, int]]
+
+    @classmethod
+    def from_arrays(cls, objects: Optional[np.ndarray], brand_names: List[str], product_names: List[str],
+                    **arrays: np.ndarray) -> "ColumnarCatalog":
+        """
+        creates a columnar catalog out of already computed columns, e.g. read from a file
+        :param objects: object array of the products, None to create them from the columns when they are needed
+        :param brand_names: sorted categories of the brand_name codes
+        :param product_names: sorted categories of the product_name codes
+        :param arrays: the columns named in ARRAYS
+        :return: columnar catalog
+        """
+        catalog = cls.__new__(cls)
+        catalog._objects = objects
+        catalog._lock = threading.Lock()
+        catalog.brand_names = brand_names
+        catalog.product_names = product_names
+        for name in cls.ARRAYS:
+            setattr(catalog, name, arrays[name])
+        catalog._ranks = {}
+        return catalog
+
+    def __len__(self):
+        return len(self.product_id)
+
+    @property
+    def objects(self) -> np.ndarray:
+        """
+        :return: object array of the products, created from the columns on first access if the catalog was built
+        without them
+        """
+        if self._objects is None:
+            with self._lock:
+                if self._objects is None:
+                    objects = np.empty(len(self), dtype=object)
+                    objects[:] = self.build_products()
+                    self._objects = objects
+        return self._objects
+
+    def build_products(self, positions: Optional[np.ndarray] = None) -> List[Product]:
+        """
+        creates new product objects out of the columns
+        :param positions: (optional) positions of the products, defaults to all products
+        :return: products at positions
+        """
+        def column(name):
+            return (getattr(self, name) if positions is None else getattr(self, name)[positions]).tolist()
+
+        return list(map(
+            Product,
+            column("product_id"),
+            column("price"),
+            map(self.brand_names.__getitem__, column("brand_name")),
+            map(self.product_names.__getitem__, column("product_name")),
+            map(_STATUSES.__getitem__, column("status")),
+        ))
+
+    def digest(self) -> str:
+        """
+        hashes the content of the columns. Unlike versions, equal catalogs have equal digests in every process.
+        :return: hex digest of the products (in order), their counts and the names
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for name in ("product_id", "price", "status", "counts", "brand_name", "product_name"):
+            digest.update(np.ascontiguousarray(getattr(self, name)))
+        for names in (self.brand_names, self.product_names):
+            digest.update(json.dumps(list(names)).encode())
+        return digest.hexdigest()
+
+    def apply(self, kept: np.ndarray, added: List[Product], counts: Sequence[int]) -> "ColumnarCatalog":
+        """
+        builds the columns of a changed catalog from these columns, without looking at the kept products again
+        :param kept: boolean array, True for the products which are still in the catalog
+        :param added: products which are new in the catalog, they follow the kept products
+        :param counts: no of times each product (kept, then added) occurs in the raw catalog
+        :return: columnar catalog of the kept products followed by the added products
+        """
+        new = ColumnarCatalog(added)
+        arrays = {name: np.concatenate([getattr(self, name)[kept], getattr(new, name)])
+                  for name in ("product_id", "price", "price_cents", "status")}
+        brand_names, arrays["brand_name"] = _merge_categorical(
+            self.brand_names, self.brand_name[kept], new.brand_names, new.brand_name)
+        product_names, arrays["product_name"] = _merge_categorical(
+            self.product_names, self.product_name[kept], new.product_names, new.product_name)
+        arrays["counts"] = np.asarray(counts, dtype=np.int64)
+        arrays["product_ids"], arrays["product_id_code"] = np.unique(arrays["product_id"], return_inverse=True)
+        return ColumnarCatalog.from_arrays(np.concatenate([self.objects[kept], new.objects]), brand_names,
+                                           product_names, **arrays)
+
+    def code(self, name: str, value: Any) -> Optional[Any]:
+        """
+        converts a filter value to the value stored in the column name
+        :return: value (or Range of values) to compare the column with or None if no row can match
+        """
+        if isinstance(value, Range):
+            return value if name in ("product_id", "price") else None
+        if name == "status":
+            return value.value if isinstance(value, ProductStatus) else None
+        if name in ("brand_name", "product_name"):
+            categories = self.brand_names if name == "brand_name" else self.product_names
+            code = _position(categories, value) if value is None or isinstance(value, str) else len(categories)
+            return code if code < len(categories) and categories[code] == value else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        return None
+
+    def mask(self, filter_by: Dict[str, Any], positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        :param filter_by: dict of Product attribute names and the values they must be equal to (or Range of values)
+        :param positions: (optional) positions to check, defaults to all products
+        :return: boolean array, True for the products (at positions) matching all items of filter_by
+        """
+        mask = np.ones(len(self) if positions is None else len(positions), dtype=bool)
+        for name, value in filter_by.items():
+            if name not in COLUMNS:
+                # same as comparing with getattr(product, name, None)
+                if value is not None:
+                    mask[:] = False
+                continue
+            code = self.code(name, value)
+            if code is None:
+                mask[:] = False
+                continue
+            column = getattr(self, name) if positions is None else getattr(self, name)[positions]
+            if isinstance(code, Range):
+                if code.low is not None:
+                    mask &= column >= code.low
+                if code.high is not None:
+                    mask &= column <= code.high
+            else:
+                mask &= column == code
+        return mask
+
+    def select(self, filter_by: Dict[str, Any], positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        :param filter_by: dict of Product attribute names and the values they must be equal to
+        :param positions: (optional) positions to select from, defaults to all products
+        :return: positions of the matching products, in the order of positions
+        """
+        if positions is None:
+            return np.flatnonzero(self.mask(filter_by))
+        if not filter_by:
+            return positions
+        return positions[self.mask(filter_by, positions)]
+
+    def rank(self, name: str) -> Tuple[np.ndarray, int]:
+        """
+        dense rank of every product in the column name (equal values have equal ranks). Ranks are computed once per
+        column and cached, strings are ranked by their sorted categories.
+        :param name: Product attribute name
+        :return: int64 array of ranks and no of distinct ranks
+        """
+        try:
+            return self._ranks[name]
+        except KeyError:
+            pass
+        if name in ("brand_name", "product_name"):
+            ranks, nranks = getattr(self, name), len(getattr(self, name + "s"))
+        elif name == "product_id":
+            ranks, nranks = self.product_id_code, len(self.product_ids)
+        elif name == "status":
+            ranks, nranks = self.status, max(status.value for status in ProductStatus) + 1
+        elif name == "price":
+            prices, ranks = np.unique(self.price, return_inverse=True)
+            nranks = len(prices)
+        else:
+            raise KeyError(name)
+        ranks, nranks = ranks.astype(np.int64), max(nranks, 1)
+        self._ranks[name] = ranks, nranks
+        return ranks, nranks
+
+    def sort_key(self, sort_by: Dict[str, bool], positions: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        builds a single int64 key out of the cached ranks of the sort_by columns, descending columns use inverted
+        ranks. Sorting on the key sorts on all columns at once.
+        :param sort_by: dict of Product attribute names, True for ascending and False for descending
+        :param positions: (optional) positions to build the key for, defaults to all products
+        :return: composite key for every position, None if the key does not fit in an int64
+        """
+        key = np.zeros(len(self) if positions is None else len(positions), dtype=np.int64)
+        size = 1
+        for name, asc in sort_by.items():
+            ranks, nranks = self.rank(name)
+            size *= nranks
+            if size > MAX_COMPOSITE_KEY:
+                return None
+            ranks = ranks if positions is None else ranks[positions]
+            key *= nranks
+            key += ranks if asc else (nranks - 1) - ranks
+        return key
+
+    def argsort(self, sort_by: Dict[str, bool], positions: Optional[np.ndarray] = None,
+                k: Optional[int] = None) -> np.ndarray:
+        """
+        stable multi key sort, like sorting once per key starting with the last key
+        :param sort_by: dict of Product attribute names, True for ascending and False for descending
+        :param positions: (optional) positions to sort, defaults to all products
+        :param k: (optional) only the first k sorted positions are needed. Small k are selected with a partial
+        sort in O(n + k log k) instead of sorting all positions
+        :return: sorted positions (the first k of them if k is provided)
+        """
+        if positions is None:
+            positions = np.arange(len(self))
+        if not sort_by:
+            return positions[:k]
+        key = self.sort_key(sort_by, positions)
+        if key is not None and k is not None and k < len(positions) // 4:
+            top = self._top_k(key, k)
+            if top is not None:
+                return positions[top]
+        if key is not None:
+            return positions[np.argsort(key, kind="stable")][:k]
+        # too many distinct values for a single key, np.lexsort sorts on the last key first
+        keys = []
+        for name, asc in reversed(list(sort_by.items())):
+            ranks, nranks = self.rank(name)
+            keys.append(ranks[positions] if asc else (nranks - 1) - ranks[positions])
+        return positions[np.lexsort(keys)][:k]
+
+    @staticmethod
+    def _top_k(key: np.ndarray, k: int) -> Optional[np.ndarray]:
+        """
+        :return: indexes of the k smallest keys in stable sort order, None if the keys can not be made unique
+        """
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        n = len(key)
+        if int(key.max()) > (MAX_COMPOSITE_KEY - n) // n:
+            return None
+        # the index breaks ties, so the partition selects exactly the products a stable sort puts first
+        unique_key = key * n + np.arange(n)
+        top = np.argpartition(unique_key, k - 1)[:k]
+        return top[np.argsort(unique_key[top])]
+
+    def take(self, positions: Optional[np.ndarray] = None) -> List[Product]:
+        """
+        :return: products at positions. Columns without product objects (e.g. read from a file) create just these
+        products
+        """
+        if self._objects is None:
+            return self.build_products(positions)
+        return self._objects.tolist() if positions is None else self._objects[positions].tolist()
+
+    def statistics(self, positions: Optional[np.ndarray] = None, weighted: bool = False) -> Dict[str, Any]:
+        """
+        :param positions: (optional) positions of the products, defaults to all products
+        :param weighted: if True every product counts as often as it occurred in the raw catalog
+        :return: dict with no of distinct product ids, no of distinct brands and average price (None without
+        products)
+        """
+        if positions is None:
+            positions = slice(None)
+        cents, counts = self.price_cents[positions], self.counts[positions]
+        if weighted:
+            total, size = int(np.dot(cents, counts)), int(counts.sum())
+        else:
+            total, size = int(cents.sum()), len(cents)
+        return {
+            "nproducts": self._count_distinct(self.product_id_code[positions], len(self.product_ids)),
+            "nbrands": self._count_distinct(self.brand_name[positions], len(self.brand_names)),
+            # exact sum of the cents, rounded once
+            "avg_price": total / (size * 100) if size else None,
+        }
+
+    @staticmethod
+    def _count_distinct(codes: np.ndarray, ncodes: int) -> int:
+        seen = np.zeros(ncodes, dtype=bool)
+        seen[codes] = True
+        return int(np.count_nonzero(seen))
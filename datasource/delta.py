@@ -0,0 +1,168 @@
+import itertools
+import logging
+from typing import List, Optional, Dict, Any, Callable, NamedTuple, Set, Tuple
+
+import numpy as np
+
+from datasource.search import apply_delta
+from datasource.snapshot import CatalogSnapshot, CatalogBuilder
+from models.product import Product
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogDelta(NamedTuple):
+    """
+    difference between two catalog snapshots, by distinct product
+    """
+    # distinct products which are new, including the new version of changed products
+    added: List[Product]
+    # distinct products which are gone, including the old version of changed products
+    removed: List[Product]
+    # ids of the products which are both removed and added, i.e. whose content changed
+    changed: Set[int]
+
+    def __len__(self):
+        return len(self.added) + len(self.removed)
+
+
+def _pack_fingerprints(fingerprints: Dict[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param fingerprints: position of the product by fingerprint
+    :return: arrays of the fingerprints and of the positions of their products, kept by the snapshot instead of the
+    dict
+    """
+    return (np.fromiter(fingerprints.keys(), dtype=np.int64, count=len(fingerprints)),
+            np.fromiter(fingerprints.values(), dtype=np.int64, count=len(fingerprints)))
+
+
+class DeltaCatalogBuilder(CatalogBuilder):
+    """
+    catalog builder which ingests the upstream items of a refresh against the previous snapshot. Items whose
+    fingerprint (a 64-bit digest of the id and the content) is known from the previous snapshot reuse its product
+    instead of building a new one. The distinct products keep their previous positions, new products follow them.
+    The columns, aggregates and broad search terms of the previous snapshot are patched with the added and removed
+    products instead of being rebuilt, so no product is converted, encoded or aggregated again. A refresh still
+    costs time linear in the catalog size: the positions, fingerprints and aggregate counters of the previous
+    snapshot are copied (they are shared by requests still reading it), and the columns of the ids are recomputed.
+    """
+
+    def __init__(self, build_product: Callable[[Dict[str, Any]], Product],
+                 fingerprint: Callable[[Dict[str, Any]], int], previous: Optional[CatalogSnapshot] = None):
+        """
+        :param build_product: callable which converts an upstream item to a product
+        :param fingerprint: callable which returns a 64-bit digest of an upstream item, equal for equal items
+        :param previous: (optional) currently cached snapshot
+        """
+        super().__init__()
+        self.build_product = build_product
+        self.fingerprint = fingerprint
+        self.previous = previous
+        # position of the product of every known fingerprint, the snapshot keeps them as arrays
+        self.fingerprints = {}  # type: Dict[int, int]
+        self.nprevious = 0
+        self.delta = None  # type: Optional[CatalogDelta]
+        if previous is not None:
+            distinct = previous.distinct
+            # the previous products start with no occurrences, the ones still in the catalog are counted again
+            self.products = list(distinct.products)
+            self.counts = [0] * len(distinct.products)
+            self.positions = dict(distinct.positions)
+            digests, positions = previous.derive("fingerprints", lambda: _pack_fingerprints({}))
+            self.fingerprints = dict(zip(digests.tolist(), positions.tolist()))
+            self.nprevious = len(distinct.products)
+
+    def add_item(self, item: Dict[str, Any]) -> Optional[Product]:
+        """
+        :param item: next item of the upstream product list
+        :return: product of the item, shared with the previous snapshot if the item did not change. None if the item
+        can not be converted (build_product raises ValueError, e.g. for an invalid price), it is logged and skipped
+        so one bad item does not fail the whole catalog
+        """
+        key = self.fingerprint(item)
+        position = self.fingerprints.get(key)
+        if position is None:
+            try:
+                product = self.build_product(item)
+            except ValueError as exc:
+                logger.warning("Skipping upstream product %r: %s", item.get("id"), exc)
+                return None
+            product = self.add(product)
+            self.fingerprints[key] = self.positions[product]
+            return product
+        # a known item, neither converted nor compared again
+        product = self.products[position]
+        self.counts[position] += 1
+        self.raw_products.append(product)
+        return product
+
+    def build(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> CatalogSnapshot:
+        """
+        :return: snapshot of the collected catalog, with columns and aggregates patched from the previous snapshot
+        """
+        previous, self.previous = self.previous, None
+        if previous is None:
+            self.delta = CatalogDelta(list(self.products), [], set())
+            fingerprints, self.fingerprints = _pack_fingerprints(self.fingerprints), {}
+            snapshot = super().build(etag, last_modified)
+            snapshot.derive("fingerprints", lambda: fingerprints)
+            return snapshot
+
+        counts = np.asarray(self.counts, dtype=np.int64)
+        kept = counts[:self.nprevious] > 0
+        previous_products = previous.distinct.products
+        removed = list(itertools.compress(previous_products, ~kept))
+        added = self.products[self.nprevious:]
+        changed = {product.product_id for product in added} & {product.product_id for product in removed}
+        self.delta = CatalogDelta(added, removed, changed)
+        digests, positions = _pack_fingerprints(self.fingerprints)
+        self.fingerprints = {}
+        # position of every collected product in the snapshot, -1 for the removed ones
+        present = counts > 0
+        moved = np.where(present, np.cumsum(present) - 1, -1)
+        if removed:
+            # close the gaps of the removed products
+            self.products = list(itertools.compress(self.products, present))
+            self.counts = counts[present].tolist()
+            self.positions = dict(zip(self.products, range(len(self.products))))
+            positions = moved[positions]
+            digests, positions = digests[positions >= 0], positions[positions >= 0]
+        fingerprints = digests, positions
+
+        snapshot = super().build(etag, last_modified)
+        snapshot.derive("fingerprints", lambda: fingerprints)
+        columns = previous.peek("columns")
+        if columns is not None:
+            snapshot.derive("columns", lambda: columns.apply(kept, added, self.counts))
+        aggregates = previous.peek("aggregates")
+        if aggregates is not None:
+            snapshot.derive("aggregates", lambda: self._apply_to_aggregates(aggregates, previous, counts, kept))
+        indexes = previous.peek("indexes")
+        if indexes is not None and indexes.broad_terms:
+            broad_terms = dict(indexes.broad_terms)
+            snapshot.derive("broad_terms", lambda: apply_delta(broad_terms, moved[:self.nprevious], added,
+                                                               moved[self.nprevious:]))
+        return snapshot
+
+    def _apply_to_aggregates(self, aggregates, previous: CatalogSnapshot, counts: np.ndarray, kept: np.ndarray):
+        """
+        :param aggregates: aggregates of the previous snapshot, left unchanged
+        :param counts: no of occurrences of every collected product, by position before closing the gaps
+        :param kept: whether every product of the previous snapshot is still in the catalog
+        :return: copy of aggregates with the removed products taken out and the added ones put in
+        """
+        previous_counts = np.asarray(previous.distinct.counts, dtype=np.int64)
+        previous_products = previous.distinct.products
+        aggregates = aggregates.copy()
+        for position in np.flatnonzero(~kept).tolist():
+            aggregates.remove(previous_products[position], int(previous_counts[position]))
+        for product, count in zip(self.delta.added, counts[self.nprevious:].tolist()):
+            aggregates.add(product, count)
+        # kept products whose no of duplicates changed only change the raw aggregate
+        difference = counts[:self.nprevious] - previous_counts
+        for position in np.flatnonzero(kept & (difference != 0)).tolist():
+            if difference[position] > 0:
+                aggregates.raw.add(previous_products[position], int(difference[position]))
+            else:
+                aggregates.raw.remove(previous_products[position], int(-difference[position]))
+        return aggregates
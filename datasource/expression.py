@@ -0,0 +1,469 @@
+import functools
+import operator
+import re
+from typing import Dict, Any, Optional, List, Callable, Tuple, Sequence, Iterable
+
+import numpy as np
+
+from datasource.base import Range
+from models.product import Product, ProductStatus
+
+# max no of compiled filter expressions kept
+FILTER_CACHE_SIZE = 256
+
+_TOKEN = re.compile(r"""\s*(?:(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|(?P<op><=|>=|!=|=|<|>|\(|\)|,)|"""
+                    r"""(?P<word>[^\s()=!<>,'"]+))""")
+_ESCAPE = re.compile(r"\\(.)")
+_KEYWORDS = ("and", "or", "not", "in", "between")
+
+
+class FilterSyntaxError(ValueError):
+    """
+    raised for a filter expression which does not follow the grammar
+    """
+
+
+def _parse_price(text: str) -> float:
+    return float(text.replace("$", "").replace(",", ""))
+
+
+def _parse_status(text: str) -> ProductStatus:
+    try:
+        return ProductStatus[text.upper()]
+    except KeyError:
+        raise ValueError(text)
+
+
+# filterable Product attributes and the conversion of their values
+FIELDS = {
+    "product_id": int,
+    "price": _parse_price,
+    "status": _parse_status,
+    "brand_name": str,
+    "product_name": str,
+}
+# attributes which can be compared with <, <=, > and >=
+NUMERIC_FIELDS = ("product_id", "price")
+
+
+class FilterPlan:
+    """
+    compiled filter expression, a tree of conditions. A plan runs as vectorized numpy operations on the columns
+    (and indexes) of a catalog snapshot, and as a predicate built once out of closures on other lists of products.
+    Plans are immutable, equal plans are equal and hash alike, so they can be part of the key of the query cache.
+    """
+    # dict of the same filter as expected by datasource.filter(), None if the plan can not be expressed as one
+    filter_by = None  # type: Optional[Dict[str, Any]]
+    # True if select() costs in proportion to the no of matches (e.g. a search) instead of the catalog size
+    selective = False
+
+    def __init__(self, key: Tuple):
+        self.key = key
+        self._predicate = None  # type: Optional[Callable[[Product], bool]]
+
+    def __eq__(self, other):
+        return isinstance(other, FilterPlan) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "{}{}".format(type(self).__name__, self.key[1:])
+
+    @property
+    def predicate(self) -> Callable[[Product], bool]:
+        """
+        :return: callable which returns True for the products matching the plan, built on first use
+        """
+        if self._predicate is None:
+            self._predicate = self._build_predicate()
+        return self._predicate
+
+    def _build_predicate(self) -> Callable[[Product], bool]:
+        raise NotImplementedError()
+
+    def mask(self, indexes, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        :param indexes: CatalogIndexes of a catalog snapshot, with the columns of the catalog
+        :param positions: (optional) positions to check, defaults to all products
+        :return: boolean array, True for the products (at positions) matching the plan
+        """
+        raise NotImplementedError()
+
+    def select(self, indexes, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        :param indexes: CatalogIndexes of a catalog snapshot
+        :param positions: (optional) positions to select from, defaults to all products
+        :return: ascending positions of the matching products (in the order of positions if provided)
+        """
+        if self.filter_by is not None:
+            return indexes.select(self.filter_by, positions)
+        mask = self.mask(indexes, positions)
+        return np.flatnonzero(mask) if positions is None else positions[mask]
+
+    def filter(self, products: Iterable[Product]) -> List[Product]:
+        """
+        :return: list of the products matching the plan
+        """
+        return list(filter(self.predicate, products))
+
+    def combine(self, filter_by: Dict[str, Any]) -> "FilterPlan":
+        """
+        :param filter_by: dict of filter items as expected by datasource.filter()
+        :return: plan matching the products which match this plan and filter_by
+        """
+        if not filter_by:
+            return self
+        return all_of([self] + [condition(name, value) for name, value in filter_by.items()])
+
+
+class Match(FilterPlan):
+    """
+    attribute equal to one of a set of values
+    """
+
+    def __init__(self, name: str, values: Iterable[Any]):
+        self.name = name
+        self.values = frozenset(values)
+        super().__init__(("match", name, self.values))
+        if len(self.values) == 1:
+            self.filter_by = {name: next(iter(self.values))}
+
+    def _build_predicate(self):
+        get = operator.attrgetter(self.name)
+        if len(self.values) == 1:
+            value = next(iter(self.values))
+            return lambda product: get(product) == value
+        values = self.values
+        return lambda product: get(product) in values
+
+    def mask(self, indexes, positions=None):
+        columns = indexes.columns
+        codes = [code for code in (columns.code(self.name, value) for value in self.values) if code is not None]
+        column = getattr(columns, self.name)
+        column = column if positions is None else column[positions]
+        if not codes:
+            return np.zeros(len(column), dtype=bool)
+        if len(codes) == 1:
+            return column == codes[0]
+        return np.isin(column, codes)
+
+    def select(self, indexes, positions=None):
+        if positions is None and len(self.values) > 1:
+            # union of the index lookups of every value
+            return _union([indexes.select({self.name: value}) for value in self.values])
+        return super().select(indexes, positions)
+
+
+class Between(FilterPlan):
+    """
+    numeric attribute within a Range (both bounds inclusive)
+    """
+
+    def __init__(self, name: str, bounds: Range):
+        self.name = name
+        self.range = bounds
+        super().__init__(("between", name, bounds))
+        self.filter_by = {name: bounds}
+
+    def _build_predicate(self):
+        get, includes = operator.attrgetter(self.name), self.range.includes
+        return lambda product: includes(get(product))
+
+    def mask(self, indexes, positions=None):
+        return indexes.columns.mask(self.filter_by, positions)
+
+
+class Not(FilterPlan):
+    """
+    products not matching a plan
+    """
+
+    def __init__(self, plan: FilterPlan):
+        self.plan = plan
+        super().__init__(("not", plan.key))
+
+    def _build_predicate(self):
+        predicate = self.plan.predicate
+        return lambda product: not predicate(product)
+
+    def mask(self, indexes, positions=None):
+        return ~self.plan.mask(indexes, positions)
+
+
+class AllOf(FilterPlan):
+    """
+    products matching all of several plans
+    """
+
+    def __init__(self, plans: Sequence[FilterPlan]):
+        self.plans = tuple(plans)
+        super().__init__(("and", tuple(plan.key for plan in self.plans)))
+        filter_by = {}
+        for plan in self.plans:
+            if plan.filter_by is None or set(plan.filter_by) & set(filter_by):
+                break
+            filter_by.update(plan.filter_by)
+        else:
+            self.filter_by = filter_by
+
+    def _build_predicate(self):
+        return functools.reduce(_and_predicate, [plan.predicate for plan in reversed(self.plans)])
+
+    def mask(self, indexes, positions=None):
+        return functools.reduce(operator.and_, (plan.mask(indexes, positions) for plan in self.plans))
+
+    def select(self, indexes, positions=None):
+        if self.filter_by is not None or positions is not None:
+            return super().select(indexes, positions)
+        # the conditions which the indexes can answer give the candidates, the others are checked on them only
+        filter_by, rest = {}, []
+        for plan in self.plans:
+            if plan.filter_by is not None and not set(plan.filter_by) & set(filter_by):
+                filter_by.update(plan.filter_by)
+            else:
+                rest.append(plan)
+        selective = [plan for plan in rest if plan.selective]
+        if selective:
+            rest.remove(selective[0])
+            candidates = selective[0].select(indexes)
+            if filter_by:
+                candidates = indexes.select(filter_by, candidates)
+        else:
+            candidates = indexes.select(filter_by) if filter_by else rest.pop(0).select(indexes)
+        if not rest:
+            return candidates
+        return candidates[all_of(rest).mask(indexes, candidates)]
+
+
+class AnyOf(FilterPlan):
+    """
+    products matching at least one of several plans
+    """
+
+    def __init__(self, plans: Sequence[FilterPlan]):
+        self.plans = tuple(plans)
+        super().__init__(("or", tuple(plan.key for plan in self.plans)))
+
+    def _build_predicate(self):
+        return functools.reduce(_or_predicate, [plan.predicate for plan in reversed(self.plans)])
+
+    def mask(self, indexes, positions=None):
+        return functools.reduce(operator.or_, (plan.mask(indexes, positions) for plan in self.plans))
+
+    def select(self, indexes, positions=None):
+        if positions is not None:
+            return super().select(indexes, positions)
+        return _union([plan.select(indexes) for plan in self.plans])
+
+
+def _and_predicate(second: Callable[[Product], bool], first: Callable[[Product], bool]) -> Callable[[Product], bool]:
+    # chained closures short circuit like `and` without a generator per product
+    return lambda product: first(product) and second(product)
+
+
+def _or_predicate(second: Callable[[Product], bool], first: Callable[[Product], bool]) -> Callable[[Product], bool]:
+    return lambda product: first(product) or second(product)
+
+
+def _union(selections: List[np.ndarray]) -> np.ndarray:
+    """
+    :return: ascending positions which are in any of the selections
+    """
+    return np.unique(np.concatenate(selections)) if len(selections) > 1 else selections[0]
+
+
+def condition(name: str, value: Any) -> FilterPlan:
+    """
+    :param name: Product attribute name
+    :param value: value the attribute must be equal to, or Range of values
+    :return: plan of the filter item name: value
+    """
+    return Between(name, value) if isinstance(value, Range) else Match(name, [value])
+
+
+def all_of(plans: Sequence[FilterPlan]) -> FilterPlan:
+    """
+    :return: plan matching all plans. Nested AND are flattened and ranges of the same attribute are intersected,
+    so e.g. "price >= 10 AND price <= 20" can be answered by the price index
+    """
+    flat = []  # type: List[FilterPlan]
+    ranges = {}  # type: Dict[str, int]
+    for plan in plans:
+        for child in (plan.plans if isinstance(plan, AllOf) else [plan]):
+            if isinstance(child, Between) and child.name in ranges:
+                index = ranges[child.name]
+                flat[index] = Between(child.name, _intersect(flat[index].range, child.range))
+            else:
+                if isinstance(child, Between):
+                    ranges[child.name] = len(flat)
+                flat.append(child)
+    return flat[0] if len(flat) == 1 else AllOf(flat)
+
+
+def any_of(plans: Sequence[FilterPlan]) -> FilterPlan:
+    """
+    :return: plan matching any of plans, nested OR are flattened
+    """
+    flat = [child for plan in plans for child in (plan.plans if isinstance(plan, AnyOf) else [plan])]
+    return flat[0] if len(flat) == 1 else AnyOf(flat)
+
+
+def _intersect(first: Range, second: Range) -> Range:
+    lows = [low for low in (first.low, second.low) if low is not None]
+    highs = [high for high in (first.high, second.high) if high is not None]
+    return Range(max(lows) if lows else None, min(highs) if highs else None)
+
+
+class _Parser:
+    """
+    recursive descent parser of the filter grammar:
+        expression  := conjunction ("OR" conjunction)*
+        conjunction := factor ("AND" factor)*
+        factor      := "NOT" factor | "(" expression ")" | comparison
+        comparison  := field ("=" | "!=") value
+                     | field ("<" | "<=" | ">" | ">=") value
+                     | field ["NOT"] "IN" "(" value ("," value)* ")"
+                     | field "BETWEEN" value "AND" value
+    keywords and status values are case insensitive, values with spaces or special characters are quoted
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = []  # type: List[Tuple[str, str, int]]
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _TOKEN.match(text, position)
+            if match is None:
+                raise FilterSyntaxError("Malformed filter argument! Unexpected {!r} at position {}".format(
+                    text[position:].strip()[:1], position))
+            kind = match.lastgroup
+            value, start = match.group(kind), match.start(kind)
+            if kind == "string":
+                value = _ESCAPE.sub(r"\1", value[1:-1])
+            elif kind == "word" and value.lower() in _KEYWORDS:
+                kind, value = "keyword", value.lower()
+            self.tokens.append((kind, value, start))
+            position = match.end()
+        self.index = 0
+
+    def parse(self) -> FilterPlan:
+        if not self.tokens:
+            raise FilterSyntaxError("Malformed filter argument! The expression is empty")
+        plan = self.expression()
+        if self.index < len(self.tokens):
+            self.error("AND, OR or the end of the expression")
+        return plan
+
+    def error(self, expected: str):
+        if self.index < len(self.tokens):
+            _, value, position = self.tokens[self.index]
+            found = "{!r} at position {}".format(value, position)
+        else:
+            found = "the end of the expression"
+        raise FilterSyntaxError("Malformed filter argument! Expected {}, found {}".format(expected, found))
+
+    def peek(self, kind: str, value: Optional[str] = None) -> bool:
+        if self.index >= len(self.tokens):
+            return False
+        token_kind, token_value, _ = self.tokens[self.index]
+        return token_kind == kind and (value is None or token_value == value)
+
+    def accept(self, kind: str, value: Optional[str] = None) -> Optional[str]:
+        if not self.peek(kind, value):
+            return None
+        self.index += 1
+        return self.tokens[self.index - 1][1]
+
+    def expect(self, kind: str, value: Optional[str] = None, expected: Optional[str] = None) -> str:
+        token = self.accept(kind, value)
+        if token is None:
+            self.error(expected or value)
+        return token
+
+    def expression(self) -> FilterPlan:
+        plans = [self.conjunction()]
+        while self.accept("keyword", "or"):
+            plans.append(self.conjunction())
+        return any_of(plans)
+
+    def conjunction(self) -> FilterPlan:
+        plans = [self.factor()]
+        while self.accept("keyword", "and"):
+            plans.append(self.factor())
+        return all_of(plans)
+
+    def factor(self) -> FilterPlan:
+        if self.accept("keyword", "not"):
+            return Not(self.factor())
+        if self.accept("op", "("):
+            plan = self.expression()
+            self.expect("op", ")")
+            return plan
+        return self.comparison()
+
+    def value(self, name: str) -> Any:
+        if self.peek("string") or self.peek("word"):
+            _, text, position = self.tokens[self.index]
+            try:
+                value = FIELDS[name](text)
+            except ValueError:
+                raise FilterSyntaxError("Malformed filter argument! Invalid {} {!r} at position {}".format(
+                    name, text, position))
+            self.index += 1
+            return value
+        self.error("a value")
+
+    def comparison(self) -> FilterPlan:
+        name = self.accept("word")
+        if name not in FIELDS:
+            if name is not None:
+                self.index -= 1
+            self.error("one of {}".format(", ".join(FIELDS)))
+        negate = self.accept("keyword", "not")
+        if negate or self.peek("keyword", "in"):
+            self.expect("keyword", "in")
+            self.expect("op", "(")
+            values = [self.value(name)]
+            while self.accept("op", ","):
+                values.append(self.value(name))
+            self.expect("op", ")")
+            plan = Match(name, values)
+            return Not(plan) if negate else plan
+        if self.accept("keyword", "between"):
+            low = self.value(name)
+            self.expect("keyword", "and")
+            return self.range(name, Range(low, self.value(name)))
+        operator_ = self.expect("op", expected="a comparison operator")
+        if operator_ in ("=", "!="):
+            plan = Match(name, [self.value(name)])
+            return Not(plan) if operator_ == "!=" else plan
+        if operator_ in ("(", ")", ","):
+            self.index -= 1
+            self.error("a comparison operator")
+        value = self.value(name)
+        if operator_ == ">=":
+            return self.range(name, Range(low=value))
+        if operator_ == "<=":
+            return self.range(name, Range(high=value))
+        # strict bounds are the complement of the inclusive ones
+        return Not(self.range(name, Range(low=value) if operator_ == "<" else Range(high=value)))
+
+    def range(self, name: str, bounds: Range) -> FilterPlan:
+        if name not in NUMERIC_FIELDS:
+            self.index -= 1
+            self.error("= or IN, {} is not numeric".format(name))
+        return Between(name, bounds)
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def compile_filter(expression: str) -> FilterPlan:
+    """
+    compiles a filter expression into a plan, e.g.
+    'status = active AND (brand_name IN ("Acme", "Zed") OR price BETWEEN 10 AND 20)'.
+    The plans of the last FILTER_CACHE_SIZE expressions are kept, so a repeated query string is parsed only once
+    :param expression: filter expression, see _Parser for the grammar
+    :return: plan of the expression, raises FilterSyntaxError (a ValueError) for a malformed expression
+    """
+    return _Parser(expression).parse()
@@ -0,0 +1,154 @@
+import threading
+from typing import Dict, Any, Optional, List, Tuple, Callable, TYPE_CHECKING
+
+import numpy as np
+
+from datasource.base import Range
+from datasource.columnar import ColumnarCatalog
+from datasource.expression import FilterPlan
+from models.product import ProductStatus
+
+if TYPE_CHECKING:
+    # the search module imports this one, it is only imported for the annotations
+    from datasource.search import SearchIndex
+
+# Product attributes which have a secondary index
+INDEXED_COLUMNS = ("status", "brand_name", "price")
+
+
+def _bucket_bounds(codes: np.ndarray, ncodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param codes: int array of codes between 0 and ncodes - 1
+    :param ncodes: no of distinct codes
+    :return: positions ordered by code (ascending within a code) and the ncodes + 1 bounds of every code in them
+    """
+    order = np.argsort(codes, kind="stable")
+    return order, np.searchsorted(codes[order], np.arange(ncodes + 1))
+
+
+def _buckets(order: np.ndarray, bounds: np.ndarray) -> List[np.ndarray]:
+    """
+    :return: list with the ascending positions of every code, indexed by code. The buckets are views of order
+    """
+    return [order[bounds[code]:bounds[code + 1]] for code in range(len(bounds) - 1)]
+
+
+class CatalogIndexes:
+    """
+    secondary indexes over the columns of a catalog snapshot: status buckets, a brand_name hash index and a sorted
+    price index. Filters look up the smallest candidate set in the indexes and check the remaining conditions only
+    on those candidates, so the cost is proportional to the no of candidates instead of the catalog size.
+    The search index of the brand and product names is built (or loaded) on the first search. The positions of the
+    broad search terms are kept in broad_terms, see datasource/search.py.
+    """
+    # numpy arrays the indexes consist of
+    ARRAYS = ("status_order", "status_bounds", "brand_name_order", "brand_name_bounds", "price_order", "sorted_price")
+
+    def __init__(self, columns: ColumnarCatalog, broad_terms: Optional[Dict[str, np.ndarray]] = None):
+        """
+        :param columns: columns of the snapshot
+        :param broad_terms: (optional) positions of broad search terms, e.g. carried over from the previous snapshot
+        """
+        self.columns = columns
+        self.broad_terms = {} if broad_terms is None else broad_terms
+        self._load_search = None  # type: Optional[Callable[[CatalogIndexes], SearchIndex]]
+        self.status_order, self.status_bounds = _bucket_bounds(columns.status,
+                                                               max(status.value for status in ProductStatus) + 1)
+        self.brand_name_order, self.brand_name_bounds = _bucket_bounds(columns.brand_name, len(columns.brand_names))
+        self.price_order = np.argsort(columns.price, kind="stable")
+        self.sorted_price = columns.price[self.price_order]
+        self._init_buckets()
+
+    @classmethod
+    def from_arrays(cls, columns: ColumnarCatalog, search: Optional[Callable[["CatalogIndexes"], "SearchIndex"]] = None,
+                    **arrays: np.ndarray) -> "CatalogIndexes":
+        """
+        creates the indexes out of already computed arrays, e.g. read from a file
+        :param columns: columns the indexes were built on
+        :param search: (optional) callable which loads the search index of the indexes, called on the first search
+        instead of building it
+        :param arrays: the arrays named in ARRAYS
+        :return: catalog indexes
+        """
+        indexes = cls.__new__(cls)
+        indexes.columns = columns
+        indexes.broad_terms = {}
+        indexes._load_search = search
+        for name in cls.ARRAYS:
+            setattr(indexes, name, arrays[name])
+        indexes._init_buckets()
+        return indexes
+
+    def _init_buckets(self):
+        self.status = _buckets(self.status_order, self.status_bounds)
+        self.brand_name = _buckets(self.brand_name_order, self.brand_name_bounds)
+        self._search = None
+        self._search_lock = threading.Lock()
+
+    @property
+    def search(self) -> "SearchIndex":
+        """
+        :return: inverted index of the brand and product names, built once on first use
+        """
+        if self._search is None:
+            # the search module builds on these indexes
+            from datasource.search import SearchIndex
+
+            with self._search_lock:
+                if self._search is None:
+                    self._search = SearchIndex(self) if self._load_search is None else self._load_search(self)
+        return self._search
+
+    def peek_search(self) -> Optional["SearchIndex"]:
+        """
+        :return: the search index if it was built or loaded already, else None
+        """
+        return self._search
+
+    def _candidates(self, name: str, value: Any) -> Optional[Tuple[np.ndarray, bool]]:
+        """
+        :return: positions which can match name == value and whether they are already in ascending order,
+        None if name has no index
+        """
+        if name not in INDEXED_COLUMNS:
+            return None
+        code = self.columns.code(name, value)
+        if code is None:
+            return np.empty(0, dtype=np.intp), True
+        if name != "price":
+            return getattr(self, name)[code], True
+        if not isinstance(code, Range):
+            code = Range(code, code)
+        low = 0 if code.low is None else np.searchsorted(self.sorted_price, code.low, side="left")
+        high = len(self.sorted_price) if code.high is None else np.searchsorted(self.sorted_price, code.high,
+                                                                                 side="right")
+        return self.price_order[low:high], False
+
+    def select(self, filter_by: Dict[str, Any], positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        :param filter_by: dict of Product attribute names and the values they must be equal to (or Range of values),
+        or a compiled FilterPlan
+        :param positions: (optional) positions to select from, defaults to all products
+        :return: ascending positions of the matching products (in the order of positions if provided)
+        """
+        if isinstance(filter_by, FilterPlan):
+            return filter_by.select(self, positions)
+        if positions is not None:
+            # a subset of the catalog is already smaller than any index bucket worth intersecting with
+            return self.columns.select(filter_by, positions)
+
+        best = best_name = None
+        for name, value in filter_by.items():
+            candidates = self._candidates(name, value)
+            if candidates is not None and (best is None or len(candidates[0]) < len(best[0])):
+                best, best_name = candidates, name
+        if best is None:
+            return self.columns.select(filter_by)
+
+        candidates, ordered = best
+        if not ordered:
+            candidates = np.sort(candidates)
+        rest = {name: value for name, value in filter_by.items() if name != best_name}
+        if not rest:
+            return candidates
+        return candidates[self.columns.mask(rest, candidates)]
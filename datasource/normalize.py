@@ -0,0 +1,88 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from typing import Dict, Any, Optional, Tuple
+
+from models.product import Product, ProductStatus
+
+
+def to_cents(price: float) -> int:
+    """
+    :param price: price in dollars with at most two decimals, e.g. Product.price
+    :return: exact price in integer cents
+    """
+    return int(round(price * 100))
+
+
+def parse_cents(price: str) -> int:
+    """
+    :param price: price as sent by the upstream, e.g. "$1,234.50"
+    :return: price in integer cents, fractions of cents are rounded half to even. Raises ValueError if it is not a
+    finite price
+    """
+    try:
+        amount = Decimal(price.replace("$", "").replace(",", "")) * 100
+    except InvalidOperation as exc:
+        raise ValueError("Invalid price {!r}".format(price)) from exc
+    if not amount.is_finite():
+        # NaN and infinity have no integer cents, nor a JSON number for the exports
+        raise ValueError("Invalid price {!r}".format(price))
+    return int(amount.to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+class ProductNormalizer:
+    """
+    converts the items of the upstream product list to products, with a symbol table of the catalog snapshot:
+    * every distinct price string is parsed once, into exact integer cents, and all products with that price share
+      one float object
+    * equal brand and product names share one string object instead of one per product
+    The tables of the previous snapshot are taken over, so unchanged names keep their objects across refreshes.
+    """
+
+    def __init__(self, previous: Optional["ProductNormalizer"] = None, nproducts: Optional[int] = None):
+        """
+        :param previous: (optional) normalizer of the previous snapshot
+        :param nproducts: (optional) no of distinct products of the previous snapshot. Each of them needs at most two
+        names and one price, a taken over table with more than twice the entries they can need (e.g. because many
+        products were removed or repriced) is started empty again, so the tables do not keep every name and price
+        ever seen
+        """
+        self.prices = {}  # type: Dict[str, Tuple[int, float]]
+        self.symbols = {}  # type: Dict[str, str]
+        if previous is not None:
+            if nproducts is None or len(previous.prices) <= 2 * nproducts:
+                self.prices = dict(previous.prices)
+            if nproducts is None or len(previous.symbols) <= 2 * 2 * nproducts:
+                self.symbols = dict(previous.symbols)
+
+    def price(self, text: str) -> Tuple[int, float]:
+        """
+        :param text: price as sent by the upstream
+        :return: exact price in cents and the shared float of the price in dollars
+        """
+        try:
+            return self.prices[text]
+        except KeyError:
+            cents = parse_cents(text)
+            price = self.prices[text] = (cents, cents / 100)
+            return price
+
+    def product(self, item: Dict[str, Any]) -> Product:
+        """
+        converts one item of the upstream product list to a Product. If the product is deleted we need not bother
+        about whether it is hidden or not
+        :param item: product dict as returned by the upstream
+        :return: product object, raises ValueError if the price of the item is invalid
+        """
+        status = ProductStatus.ACTIVE
+        if item["deleted"]:
+            status = ProductStatus.DELETED
+        elif item["hidden"]:
+            status = ProductStatus.HIDDEN
+        symbols = self.symbols
+        brand_name, product_name = item["brand_name"], item["product_name"]
+        return Product(
+            item["id"],
+            self.price(item["price"])[1],
+            symbols.setdefault(brand_name, brand_name),
+            symbols.setdefault(product_name, product_name),
+            status,
+        )
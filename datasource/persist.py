@@ -0,0 +1,224 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+
+from datasource.columnar import ColumnarCatalog
+from datasource.indexes import CatalogIndexes
+from datasource.search import SearchIndex, NameIndex
+from datasource.snapshot import CatalogSnapshot, CatalogBuilder, LazyProducts, ProductView
+
+# file layout: MAGIC, format version and header size (little endian uint32), JSON header, then the arrays, each one
+# starting at a multiple of ALIGNMENT. Arrays of the indexes are optional, their names start with INDEX_PREFIX, the
+# ones of the search index with SEARCH_PREFIX
+MAGIC = b"BLCATSNP"
+FORMAT_VERSION = 3
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sII")
+INDEX_PREFIX = "indexes."
+SEARCH_PREFIX = "search."
+
+
+class SnapshotFormatError(Exception):
+    """
+    raised when a snapshot file is not a snapshot or was written by an incompatible version
+    """
+
+
+class MappedSnapshot(CatalogSnapshot):
+    """
+    snapshot restored from a snapshot file. Its columns are read-only views of the mapped file, the product objects
+    (distinct and raw products) are only created out of the columns when they are first needed
+    """
+
+    def __init__(self, columns: ColumnarCatalog, raw_positions: np.ndarray, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None):
+        """
+        :param columns: columns of the distinct products
+        :param raw_positions: position of every raw product in the distinct products
+        :param etag: ETag of the upstream response
+        :param last_modified: Last-Modified of the upstream response
+        """
+        raw_products = LazyProducts(lambda: columns.objects[raw_positions].tolist(), len(raw_positions))
+        super().__init__(raw_products, etag=etag, last_modified=last_modified)
+        self.raw_positions = raw_positions
+        self.derive("columns", lambda: columns)
+
+    @property
+    def distinct(self) -> CatalogBuilder:
+        return self.derive("distinct", self._build_distinct)
+
+    @property
+    def products(self) -> ProductView:
+        """
+        :return: view of the distinct products, only the products which are read are created
+        """
+        return self.derive("products", lambda: ProductView(self, None))
+
+    def _build_distinct(self) -> CatalogBuilder:
+        distinct = CatalogBuilder()
+        distinct.products = self.columns.objects.tolist()
+        distinct.counts = self.columns.counts.tolist()
+        distinct.positions = dict(zip(distinct.products, range(len(distinct.products))))
+        distinct.raw_products = self.raw_products
+        return distinct
+
+
+def _encode_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: int64 array of the offsets of the strings (len(strings) + 1 of them) and uint8 array of their utf-8 bytes
+    """
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _decode_strings(offsets: np.ndarray, data: np.ndarray, intern: bool = False) -> List[str]:
+    """
+    :return: strings encoded by _encode_strings(), interned if intern is True
+    """
+    blob = data.tobytes()
+    bounds = offsets.tolist()
+    text = blob.decode()
+    if len(text) == len(blob):
+        # plain ascii, the byte offsets are character offsets
+        strings = [text[start:end] for start, end in zip(bounds, bounds[1:])]
+    else:
+        strings = [blob[start:end].decode() for start, end in zip(bounds, bounds[1:])]
+    return list(map(sys.intern, strings)) if intern else strings
+
+
+def _snapshot_arrays(snapshot: CatalogSnapshot) -> Dict[str, np.ndarray]:
+    """
+    :return: all arrays needed to restore the snapshot: its columns, the position of every raw product and the
+    indexes and search index if they were built
+    """
+    columns = snapshot.columns
+    arrays = {name: np.ascontiguousarray(getattr(columns, name)) for name in ColumnarCatalog.ARRAYS}
+    for name in ("brand_names", "product_names"):
+        names = getattr(columns, name)
+        if names and names[0] is None:
+            # a missing name is the first category, it is stored as a flag instead of a string
+            arrays[name + "_null"] = np.ones(1, dtype=np.int8)
+            names = names[1:]
+        arrays[name + "_offsets"], arrays[name + "_data"] = _encode_strings(names)
+    # raw products are the distinct product objects, so they can be found by identity
+    position_of = {id(product): position for position, product in enumerate(snapshot.distinct.products)}
+    arrays["raw_positions"] = np.fromiter((position_of[id(product)] for product in snapshot.raw_products),
+                                          dtype=np.int64, count=len(snapshot.raw_products))
+    indexes = snapshot.peek("indexes")
+    if indexes is not None:
+        for name in CatalogIndexes.ARRAYS:
+            arrays[INDEX_PREFIX + name] = np.ascontiguousarray(getattr(indexes, name))
+        search = indexes.peek_search()
+        if search is not None:
+            for column in SearchIndex.COLUMNS:
+                prefix = "{}{}.".format(SEARCH_PREFIX, column)
+                name_index = getattr(search, column)
+                for name in NameIndex.ARRAYS:
+                    arrays[prefix + name] = np.ascontiguousarray(getattr(name_index, name))
+                for name in NameIndex.STRINGS:
+                    arrays[prefix + name + "_offsets"], arrays[prefix + name + "_data"] = _encode_strings(
+                        getattr(name_index, name))
+    return arrays
+
+
+def _load_search(indexes: CatalogIndexes, arrays: Dict[str, np.ndarray]) -> SearchIndex:
+    """
+    :param indexes: indexes restored from the file
+    :param arrays: mapped arrays of the search index, without SEARCH_PREFIX
+    :return: search index whose arrays are views of the mapped file, only the words and n-grams are decoded
+    """
+    name_indexes = {}
+    for column in SearchIndex.COLUMNS:
+        prefix = column + "."
+        column_arrays = {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+        strings = {name: _decode_strings(column_arrays.pop(name + "_offsets"), column_arrays.pop(name + "_data"))
+                   for name in NameIndex.STRINGS}
+        name_indexes[column] = NameIndex.from_arrays(**strings, **column_arrays)
+    return SearchIndex.from_name_indexes(indexes, **name_indexes)
+
+
+def save_snapshot(snapshot: CatalogSnapshot, path: str):
+    """
+    writes the snapshot to path in a columnar binary format which can be memory mapped. The indexes and the search
+    index are written too if the snapshot has built them. The file is replaced atomically, readers see either the old
+    or the new file.
+    :param snapshot: snapshot to save
+    :param path: path of the file
+    """
+    arrays = _snapshot_arrays(snapshot)
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "offset": offset, "length": len(array)}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({
+        "etag": snapshot.etag,
+        "last_modified": snapshot.last_modified,
+        "fetched_at": snapshot.fetched_at,
+        "digest": snapshot.digest,
+        "arrays": layout,
+    }).encode()
+    start = -(-(_PREFIX.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as file:
+        file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(start + layout[name]["offset"])
+            file.write(array.tobytes())
+        file.truncate(start + offset)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> CatalogSnapshot:
+    """
+    memory maps a snapshot written by save_snapshot(). The numpy columns are read-only views of the mapped file,
+    only the strings are created in memory. The product objects are created when they are first needed, not while
+    loading. Saved indexes are restored as views as well, a saved search index is restored on the first search.
+    :param path: path of the file
+    :return: snapshot with a new version, its columns are ready to use
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < _PREFIX.size:
+            raise SnapshotFormatError("{} is not a catalog snapshot".format(path))
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, header_size = _PREFIX.unpack_from(mapped)
+    if magic != MAGIC:
+        raise SnapshotFormatError("{} is not a catalog snapshot".format(path))
+    if version != FORMAT_VERSION:
+        raise SnapshotFormatError("{} has format version {}, expected {}".format(path, version, FORMAT_VERSION))
+    try:
+        header = json.loads(mapped[_PREFIX.size:_PREFIX.size + header_size].decode())
+        start = -(-(_PREFIX.size + header_size) // ALIGNMENT) * ALIGNMENT
+        arrays = {name: np.frombuffer(mapped, dtype=np.dtype(spec["dtype"]), count=spec["length"],
+                                      offset=start + spec["offset"])
+                  for name, spec in header["arrays"].items()}
+    except (ValueError, KeyError, TypeError) as exc:
+        raise SnapshotFormatError("{} is damaged: {}".format(path, exc)) from exc
+
+    indexes = {name[len(INDEX_PREFIX):]: arrays.pop(name) for name in list(arrays) if name.startswith(INDEX_PREFIX)}
+    search = {name[len(SEARCH_PREFIX):]: arrays.pop(name) for name in list(arrays) if name.startswith(SEARCH_PREFIX)}
+    brand_names, product_names = (
+        [None] * (arrays.pop(name + "_null", None) is not None) + _decode_strings(
+            arrays.pop(name + "_offsets"), arrays.pop(name + "_data"), intern=name == "brand_names")
+        for name in ("brand_names", "product_names"))
+    columns = ColumnarCatalog.from_arrays(None, brand_names, product_names, **arrays)
+    snapshot = MappedSnapshot(columns, arrays["raw_positions"], etag=header["etag"],
+                              last_modified=header["last_modified"])
+    snapshot.fetched_at = header["fetched_at"]
+    if header.get("digest"):
+        snapshot.derive("digest", lambda: header["digest"])
+    if indexes:
+        load_search = (lambda loaded: _load_search(loaded, search)) if search else None
+        snapshot.derive("indexes", lambda: CatalogIndexes.from_arrays(columns, search=load_search, **indexes))
+    return snapshot
@@ -1,8 +1,27 @@
+import heapq
+import itertools
+import logging
+import operator
+import threading
+import time
+
+import numpy as np
 import requests
-from typing import List, Any, Dict, OrderedDict, Tuple
+from typing import List, Any, Dict, OrderedDict, Tuple, Optional, Iterator
+
+from datasource.base import DataSource, Range, ProductPage, ProductBatches, InvalidPageError, decode_cursor
+from datasource.cache import CatalogCache, CatalogRefresher, QueryCache
+from datasource.delta import DeltaCatalogBuilder
+from datasource.expression import FilterPlan
+from datasource.normalize import ProductNormalizer, to_cents
+from datasource.persist import save_snapshot, load_snapshot
+from datasource.snapshot import CatalogSnapshot, ProductView
+from datasource.stream import iter_json_array
+from datasource.transport import HttpTransport
+from metrics import stage, inc, REGISTRY, UPSTREAM_RESPONSES, UPSTREAM_BYTES
+from models.product import Product
 
-from datasource.base import DataSource
-from models.product import Product, ProductStatus
+logger = logging.getLogger(__name__)
 
 
 class InvalidResponseError(Exception):
@@ -10,53 +29,267 @@ class InvalidResponseError(Exception):
         self.msg = msg
 
 
+class CatalogNotModifiedError(Exception):
+    """
+    raised when the upstream answers a conditional request with 304, the earlier fetched catalog is still valid
+    """
+
+
 class RestDataSource(DataSource):
     data_source_name = "REST"
+    # size of the chunks read from the upstream response in streaming mode
+    stream_chunk_size = 64 * 1024
 
-    def __init__(self, base_url):
+    def __init__(self, base_url, cache_ttl=60.0, stale_ttl=300.0, timeout=(3.05, 30.0), retries=3, stream=False,
+                 query_cache_size=128, pool_maxsize=10, snapshot_path=None, search_index=False):
+        """
+        :param base_url: url of the upstream product list
+        :param cache_ttl: seconds a fetched catalog is served without asking the upstream again
+        :param stale_ttl: seconds after cache_ttl in which the old catalog is served while it is refreshed
+        :param timeout: (connect timeout, read timeout) in seconds for the upstream requests
+        :param retries: max no of retries of a failed upstream request, with exponential backoff
+        :param stream: if True the upstream payload is parsed item by item while it is downloaded, instead of
+        decoding the whole body at once
+        :param query_cache_size: max no of results of get_products() kept for the current catalog, 0 disables it
+        :param pool_maxsize: max no of connections kept alive per upstream host
+        :param snapshot_path: (optional) file the fetched catalog is saved to, so a restarted process can serve it
+        before the upstream answers, see load_persisted_snapshot()
+        :param search_index: if True the search index of every new snapshot is built when it is loaded, instead of
+        on the first search query
+        """
         super().__init__()
         self.response = None
         self.base_url = base_url
+        self.stream = stream
+        # datasources without an upstream (base_url None) need no connection pool
+        self.transport = None if base_url is None else HttpTransport(
+            timeout=timeout, retries=retries, pool_maxsize=pool_maxsize)
+        self.snapshot_path = snapshot_path
+        self.search_index = search_index
+        self.cache = CatalogCache(self._load_and_persist, ttl=cache_ttl, stale_ttl=stale_ttl)
+        self.query_cache = QueryCache(query_cache_size)
+        self.refresher = None  # type: Optional[CatalogRefresher]
+        # thread which saves the latest snapshot to snapshot_path
+        self.saver = None  # type: Optional[threading.Thread]
+        self._save_lock = threading.Lock()
+        self._saved_version = 0
 
-    def _convert_dollar_to_float_format(self, price):
-        return float(price.replace("$", "").replace(",", ""))
+    def _request_catalog(self, etag=None, last_modified=None, stream=False) -> requests.Response:
+        """
+        sends the request for the product list to base_url and checks the response status
+        :return: response with status 200, raises InvalidResponseError or CatalogNotModifiedError otherwise
+        """
+        try:
+            with stage("upstream"):
+                self.response = self.transport.get(self.base_url, etag=etag, last_modified=last_modified,
+                                                   stream=stream)
+        except requests.RequestException as exc:
+            inc(UPSTREAM_RESPONSES, "error")
+            raise InvalidResponseError("Unable to get products from the URL: {}".format(exc)) from exc
+        inc(UPSTREAM_RESPONSES, str(self.response.status_code))
+        if self.response.status_code == 304:
+            raise CatalogNotModifiedError()
+        if self.response.status_code != 200:
+            raise InvalidResponseError("Unable to get products from the URL")
+        return self.response
 
-    def get_data_from_api(self) -> List[Dict[str, Any]]:
+    def get_data_from_api(self, etag=None, last_modified=None) -> List[Dict[str, Any]]:
         """
         connects to the base_url and gets the product list. Change this for connecting to Database
-        :return: products_list json or raises InvalidResponseError if got a wrong response from BASE_URL
+        :param etag: (optional) ETag of the earlier fetched catalog, for a conditional request
+        :param last_modified: (optional) Last-Modified of the earlier fetched catalog, for a conditional request
+        :return: products_list json or raises InvalidResponseError if got a wrong response from BASE_URL.
+        Raises CatalogNotModifiedError if the catalog did not change since the provided etag/last_modified
+        """
+        response = self._request_catalog(etag, last_modified)
+        inc(UPSTREAM_BYTES, amount=len(response.content))
+        data = response.json()["products"]
+        return data
+
+    def iter_data_from_api(self, etag=None, last_modified=None) -> Iterator[Dict[str, Any]]:
+        """
+        same as get_data_from_api() but streams the response and yields the items of the product list one by one
+        while they are downloaded, so the whole body and the whole decoded list are never in memory at once.
+        :return: generator of product dicts
+        """
+        response = self._request_catalog(etag, last_modified, stream=True)
+        chunks = response.iter_content(chunk_size=self.stream_chunk_size)
+        if REGISTRY.enabled:
+            chunks = self._count_bytes(chunks)
+        try:
+            yield from iter_json_array(chunks, "products")
+        except ValueError as exc:
+            raise InvalidResponseError("Unable to parse products from the URL: {}".format(exc)) from exc
+        finally:
+            response.close()
+
+    @staticmethod
+    def _count_bytes(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            inc(UPSTREAM_BYTES, amount=len(chunk))
+            yield chunk
+
+    def _load_snapshot(self, previous: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+        """
+        loader used by the catalog cache, fetches the catalog from the upstream. If there is a previous snapshot
+        the request is conditional, and the previous snapshot is reused when the upstream answers 304. Otherwise
+        only the items which changed since the previous snapshot are converted to new products.
+        :param previous: snapshot that is currently cached, if any
+        :return: new catalog snapshot or previous if it did not change
+        """
+        fetch = self.iter_data_from_api if self.stream else self.get_data_from_api
+        etag, last_modified = (previous.etag, previous.last_modified) if previous is not None else (None, None)
+        normalizer = self._normalizer(previous)
+        builder = DeltaCatalogBuilder(normalizer.product, self._fingerprint, previous)
+        # download (when streaming), parsing and deduplication of the payload
+        with stage("ingest"):
+            try:
+                for item in fetch(etag, last_modified):
+                    # duplicates are removed while ingesting
+                    builder.add_item(item)
+            except CatalogNotModifiedError:
+                if previous is None:
+                    raise
+                return previous
+            headers = self.response.headers if self.response is not None else {}
+            snapshot = builder.build(etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"))
+        snapshot.derive("normalizer", lambda: normalizer)
+        return snapshot
+
+    @staticmethod
+    def _normalizer(previous: Optional[CatalogSnapshot]) -> ProductNormalizer:
+        """
+        :param previous: snapshot that is currently cached, if any
+        :return: normalizer of the next snapshot, taking over the tables of previous unless they grew to more than
+        twice the names and prices the products of previous can need
+        """
+        if previous is None:
+            return ProductNormalizer()
+        return ProductNormalizer(previous.peek("normalizer"), nproducts=len(previous.distinct.products))
+
+    def _load_and_persist(self, previous: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+        """
+        loader of the catalog cache, saves every new snapshot to snapshot_path in a background thread, so the
+        snapshot is served without waiting for the file
+        """
+        snapshot = self._load_snapshot(previous)
+        if self.search_index and snapshot is not previous:
+            with stage("index"):
+                snapshot.indexes.search
+        if self.snapshot_path is not None and snapshot is not previous:
+            self.saver = threading.Thread(target=self._save_snapshot, args=(snapshot,), name="catalog-save",
+                                          daemon=True)
+            self.saver.start()
+        return snapshot
+
+    def _save_snapshot(self, snapshot: CatalogSnapshot):
+        """
+        saves snapshot to snapshot_path, unless a newer snapshot was saved already. A failed save is logged, the
+        snapshot is served anyway
         """
-        self.response = requests.get(url=self.base_url)
-        if self.response.status_code == 200:
-            data = self.response.json()["products"]
-            return data
-        raise InvalidResponseError("Unable to get products from the URL")
+        with self._save_lock:
+            if snapshot.version < self._saved_version:
+                return
+            try:
+                save_snapshot(snapshot, self.snapshot_path)
+                self._saved_version = snapshot.version
+            except Exception:
+                logger.exception("Saving the catalog snapshot to %s failed", self.snapshot_path)
+
+    def load_persisted_snapshot(self) -> Optional[CatalogSnapshot]:
+        """
+        puts the snapshot saved at snapshot_path into the cache, e.g. at startup. It is served at once and
+        revalidated against the upstream like a snapshot fetched at the time it was saved.
+        :return: the restored snapshot, None if there is no snapshot_path or it could not be read
+        """
+        if self.snapshot_path is None:
+            return None
+        try:
+            snapshot = load_snapshot(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception("Loading the catalog snapshot from %s failed", self.snapshot_path)
+            return None
+        self.cache.put(snapshot, age=time.time() - snapshot.fetched_at)
+        return snapshot
+
+    def get_snapshot(self) -> CatalogSnapshot:
+        """
+        :return: current catalog snapshot, fetched from the upstream only when the cached one has expired. While
+        the background refresher runs the cached snapshot is returned as it is, whatever its age
+        """
+        if self.refresher is not None and self.refresher.running:
+            snapshot = self.cache.peek()
+            if snapshot is not None:
+                return snapshot
+        with stage("catalog"):
+            return self.cache.get()
+
+    def get_snapshot_age(self) -> Optional[float]:
+        """
+        :return: seconds since the cached catalog was fetched or revalidated, None if nothing is cached
+        """
+        return self.cache.age()
+
+    def start_refresher(self, interval: float = 30.0, jitter: float = 0.1, warm: bool = True) -> CatalogRefresher:
+        """
+        starts refreshing the catalog in the background, requests then only read the cached catalog
+        :param interval: mean no of seconds between two refreshes
+        :param jitter: max deviation of an interval from the mean, as a fraction of interval
+        :param warm: if True the catalog is loaded before returning, or refreshed at once if a persisted snapshot
+        is cached already
+        :return: the running refresher
+        """
+        self.stop_refresher()
+        self.refresher = CatalogRefresher(self.cache, interval=interval, jitter=jitter).start(warm=warm)
+        return self.refresher
+
+    def stop_refresher(self):
+        """
+        stops the background refresher, requests load the catalog themselves again once it expires
+        """
+        if self.refresher is not None:
+            self.refresher.stop()
+            self.refresher = None
+
+    def invalidate(self):
+        """
+        drops the cached catalog so that the next call fetches it again from the upstream
+        """
+        self.cache.invalidate()
 
     def get_raw_product_data(self) -> List[Product]:
         """
         gets the raw data by connecting to the URL and assign the status as provided. If the product is deleted
         we need not bother about whether it is hidden or not. If deleted, change the status to deleted,
         if hidden then change the status to hidden, else the status will be active.
+        The data is served from the catalog cache while it is fresh.
         :return: list of product objects
         """
-        products = []
-        for item in self.get_data_from_api():
-            item_status = ProductStatus.ACTIVE
-            if item["deleted"]:
-                item_status = ProductStatus.DELETED
-            elif item["hidden"]:
-                item_status = ProductStatus.HIDDEN
-
-            products.append(
-                Product(
-                    item["id"],
-                    self._convert_dollar_to_float_format(item["price"]),
-                    item["brand_name"],
-                    item["product_name"],
-                    item_status,
-                )
-            )
-        return products
+        return self.get_snapshot().raw_products
+
+    def iter_raw_product_data(self) -> Iterator[Product]:
+        """
+        streaming variant of get_raw_product_data(), bypasses the catalog cache
+        :return: generator of product objects, normalized while the upstream payload is downloaded
+        """
+        normalizer = ProductNormalizer()
+        for item in self.iter_data_from_api():
+            try:
+                yield normalizer.product(item)
+            except ValueError as exc:
+                logger.warning("Skipping upstream product %r: %s", item.get("id"), exc)
+
+    @staticmethod
+    def _fingerprint(item: Dict[str, Any]) -> int:
+        """
+        :param item: product dict as returned by the upstream
+        :return: 64-bit digest of the id and content of the item, equal items are converted to equal products. The
+        digest is only compared within the process, it is not persisted
+        """
+        return hash((item["id"], item["price"], item["brand_name"], item["product_name"], item["deleted"],
+                     item["hidden"]))
 
     def get_processed_product_data(self) -> List[Product]:
         """
@@ -64,88 +297,233 @@ class RestDataSource(DataSource):
         :return: distinct list of products
         """
         products = self.get_raw_product_data()
-        # removing duplicates from here itself
-        return list(set(products))
+        with stage("dedupe"):
+            snapshot = self.cache.peek()
+            if snapshot is not None and products is snapshot.raw_products:
+                # distinct products are computed once per cached catalog
+                return snapshot.products
+            # removing duplicates from here itself
+            return list(set(products))
 
     # Filter products
     def filter(self, products, filter_by) -> List[Product]:
         """
-        For now we are filtering the elements based on status only
+        Filters the products on equality of their attributes, or on a Range of values
         :param products: list of products
-        :param filter_by: dict with key as sort param matching with Product class variable and its value for matching
-        :return: list of filtered products, only contains the matched filter criteria. For now only that match with the status value provided.
-        """
-        final_products = []
-        for product in products:
-            for k, v in filter_by.items():
-                if getattr(product, k, None) != v:
-                    break
-            else:
-                final_products.append(product)
-        return final_products
+        :param filter_by: dict with key as sort param matching with Product class variable and its value for matching.
+        The value can be a Range for numeric attributes, e.g. {"status": ProductStatus.ACTIVE, "price": Range(10, 20)}.
+        Or a FilterPlan compiled from a filter expression (datasource.expression.compile_filter())
+        :return: list of filtered products, only contains the matched filter criteria.
+        """
+        with stage("filter"):
+            if isinstance(products, ProductView):
+                # products of the cached catalog are looked up in its secondary indexes
+                indexes = products.snapshot.indexes
+                return ProductView(products.snapshot, indexes.select(filter_by, products.positions))
+            if isinstance(filter_by, FilterPlan):
+                # the predicate of the plan is built once, not looked up per product and condition
+                return filter_by.filter(products)
+            final_products = []
+            for product in products:
+                for k, v in filter_by.items():
+                    value = getattr(product, k, None)
+                    mismatch = not v.includes(value) if isinstance(v, Range) else value != v
+                    if mismatch:
+                        break
+                else:
+                    final_products.append(product)
+            return final_products
 
     # Sort products
     # Ref: https://stackoverflow.com/questions/11206884/how-to-write-sort-key-functions-for-descending-values
     def sort(self, products, sort_by) -> List[Product]:
         """
-        sort the products based on sort_by arg. Make sure you give str keys at last and integer keys at first
+        sort the products based on sort_by arg. Products of the cached catalog are sorted in a single pass on a
+        composite key of the cached ranks of every sort param, ranks work the same for numbers and strings.
+        Other lists are sorted once per run of sort params with the same direction, on a tuple key of those params.
         :param products: list of product objects
         :param sort_by: dict of sort params by which we sort the products
         :return:
         """
-        final_products = list(products)
-        # iterate over the sort items and sort once per key
-        for key, asc in reversed(sort_by.items()):
-            final_products = sorted(final_products, key=lambda x: x[key], reverse=not asc)
-        return final_products
+        with stage("sort"):
+            if isinstance(products, ProductView):
+                # products of the cached catalog are sorted on the cached ranks of its columns
+                columns = products.snapshot.columns
+                return ProductView(products.snapshot, columns.argsort(sort_by, products.positions))
+            final_products = list(products)
+            runs = [
+                (asc, [key for key, _ in items])
+                for asc, items in itertools.groupby(sort_by.items(), key=operator.itemgetter(1))
+            ]
+            # sorting is stable, so the runs are sorted starting with the last one
+            for asc, keys in reversed(runs):
+                final_products.sort(key=self._sort_key_getter(keys), reverse=not asc)
+            return final_products
+
+    @staticmethod
+    def _sort_key_getter(keys):
+        if "status" in keys:
+            # Enum members (the product status) are ordered by their value
+            return lambda x: tuple(x[key].value if key == "status" else x[key] for key in keys)
+        return operator.attrgetter(*keys)
 
     def get_products(
         self,
         filter_by: Dict[str, Any],
         sort_by: OrderedDict[str, bool],
-    ) -> tuple[list[Product], list[Product]]:
+        limit: Optional[int] = None,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        snapshot: Optional[CatalogSnapshot] = None,
+    ) -> Tuple[ProductPage, List[Product]]:
         """
         get the raw product data, remove duplicates and filter them on status col. Finally, Sort the list.
+        Optionally only one page of the sorted list is returned, small pages are selected without sorting the
+        whole list. The page knows the total no of filtered products and the cursor of the next page.
         :param filter_by: dict of filter items by which we filter the list of products
         :param sort_by: dict of sort params by which we sort the products
-        :return: final list of products that are filtered and sorted
+        :param limit: (optional) max no of products to return
+        :param offset: no of products to skip at the start of the sorted list
+        :param cursor: (optional) cursor of a page returned before (ProductPage.next_cursor), overrides offset
+        :param snapshot: (optional) snapshot to query instead of the cached catalog
+        :return: final list of products that are filtered and sorted, and the list of all distinct products
         """
+        offset, end = self._page_bounds(limit, offset, cursor)
         # get unique/distinct products after removing any duplicates
-        org_products = self.get_processed_product_data()
+        org_products = self.get_processed_product_data() if snapshot is None else snapshot.products
+
+        if isinstance(org_products, ProductView):
+            # the same queries are answered from the query cache as long as the catalog does not change. Only the
+            # positions of the page are kept, its products are created for every request, so the cache does not keep
+            # product objects alive (e.g. of a snapshot file, which creates new products for every view)
+            snapshot = org_products.snapshot
+            key = QueryCache.key(filter_by, sort_by, offset, limit)
+            page, total = self.query_cache.get(snapshot.version, key, lambda: self._select_page(
+                org_products, filter_by, sort_by, offset, end))
+            return ProductView(snapshot, page, total=total, offset=offset), org_products
+
         # filter based on status and sort the output list on sort_by items
-        return self.sort(
-            self.filter(org_products, filter_by),
-            sort_by
-        ), org_products
+        filtered_products = self.filter(org_products, filter_by)
+        if end is not None and sort_by and len(set(sort_by.values())) == 1:
+            # heap based top-k selection, same result as sorting and slicing
+            select = heapq.nsmallest if next(iter(sort_by.values())) else heapq.nlargest
+            top = select(end, filtered_products, key=self._sort_key_getter(list(sort_by)))
+            return ProductPage(top[offset:], total=len(filtered_products), offset=offset), org_products
+        sorted_products = self.sort(filtered_products, sort_by)
+        return ProductPage(sorted_products[offset:end], total=len(sorted_products), offset=offset), org_products
 
-    def get_statistics(self, filter_by: Dict[str, Any], org_products=None, filtered_products=None) -> Dict[Any, Any]:
+    def get_product_batches(
+        self,
+        filter_by: Dict[str, Any],
+        sort_by: OrderedDict[str, bool],
+        limit: Optional[int] = None,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        batch_size: int = 1000,
+    ) -> ProductBatches:
+        """
+        same products as get_products(), in batches of batch_size products. Products of the cached catalog are
+        filtered and sorted on the columns and the batches are views of one slice of the sorted positions each, so
+        exporting the whole catalog keeps no more than its sorted positions besides the catalog. The result is not
+        kept in the query cache.
+        :return: batches of the filtered and sorted products, views of the snapshot of the batches
+        """
+        org_products = self.get_processed_product_data()
+        if not isinstance(org_products, ProductView):
+            return super().get_product_batches(filter_by, sort_by, limit, offset, cursor, batch_size)
+        offset, end = self._page_bounds(limit, offset, cursor)
+        snapshot = org_products.snapshot
+        with stage("filter"):
+            positions = snapshot.indexes.select(filter_by, org_products.positions)
+        with stage("sort"):
+            page = snapshot.columns.argsort(sort_by, positions, k=end)[offset:end]
+        batches = ProductBatches((ProductView(snapshot, page[start:start + batch_size])
+                                  for start in range(0, len(page), batch_size)),
+                                 len(page), total=len(positions), offset=offset)
+        batches.snapshot = snapshot
+        return batches
+
+    @staticmethod
+    def _page_bounds(limit: Optional[int], offset: int, cursor: Optional[str]) -> Tuple[int, Optional[int]]:
+        """
+        :return: start and end (None for the end of the list) of the requested page, the cursor overrides offset.
+        Raises InvalidPageError for a malformed cursor or a negative limit or offset
+        """
+        if cursor is not None:
+            offset = decode_cursor(cursor)
+        if offset < 0 or (limit is not None and limit < 0):
+            raise InvalidPageError("limit and offset must not be negative")
+        return offset, None if limit is None else offset + limit
+
+    @staticmethod
+    def _select_page(products: ProductView, filter_by: Dict[str, Any], sort_by: OrderedDict[str, bool], offset: int,
+                     end: Optional[int]) -> Tuple[np.ndarray, int]:
+        """
+        filters and sorts products on the columns of their snapshot, no products are created
+        :return: positions of the products of the page in the snapshot and the no of filtered products
+        """
+        snapshot = products.snapshot
+        with stage("filter"):
+            positions = snapshot.indexes.select(filter_by, products.positions)
+        with stage("sort"):
+            page = snapshot.columns.argsort(sort_by, positions, k=end)[offset:end]
+        return page, len(positions)
+
+    def get_statistics(self, filter_by: Dict[str, Any], org_products=None, filtered_products=None,
+                       snapshot: Optional[CatalogSnapshot] = None) -> Dict[Any, Any]:
         """
         get statistics for both raw product data and sorted_filtered product data
-        :param filtered_products: (optional) can send filtered products for getting stats
+        :param filtered_products: (optional) can send filtered products for getting stats. For no filter or a status
+        filter the stats of products of the cached catalog are read from its aggregates
         :param org_products: (optional) can send original unfiltered products
         :param filter_by: filter by dict by which we filter the raw data. currently we filter only on status
+        :param snapshot: (optional) snapshot to compute the statistics of instead of the cached catalog
         :return: dict containing statistics for both filtered and un-filtered data
         """
-        result = {}
+        with stage("statistics"):
+            result = {}
 
-        # Un-filtered
-        unfiltered_products = org_products if org_products else self.get_raw_product_data()
+            # Un-filtered
+            if org_products:
+                unfiltered_products = org_products
+            else:
+                unfiltered_products = self.get_raw_product_data() if snapshot is None else snapshot.raw_products
+            result["unfiltered"] = self._compute_statistics(unfiltered_products, snapshot)
 
-        result["unfiltered"] = {
-            "nproducts": len(set([product["product_id"] for product in unfiltered_products])),
-            "nbrands": len(set([product["brand_name"] for product in unfiltered_products])),
-            "avg_price": sum([product["price"] for product in unfiltered_products]) / len(unfiltered_products),
-        }
+            # Filtered
+            if filtered_products is not None:
+                products = filtered_products
+            else:
+                products = self.get_processed_product_data() if snapshot is None else snapshot.products
+            aggregate = products.snapshot.aggregates.get(filter_by) if isinstance(products, ProductView) else None
+            if aggregate is not None:
+                # no filter or a status filter, read from the aggregates of the catalog
+                result["filtered"] = aggregate.statistics()
+            else:
+                if filtered_products is None:
+                    filtered_products = self.filter(products, filter_by)
+                result["filtered"] = self._compute_statistics(filtered_products)
 
-        # Filtered
-        filtered_products = filtered_products if filtered_products else self.filter(
-            self.get_processed_product_data(),
-            filter_by,
-        )
-        result["filtered"] = {
-            "nproducts": len(set([product["product_id"] for product in filtered_products])),
-            "nbrands": len(set([product["brand_name"] for product in filtered_products])),
-            "avg_price": sum([product["price"] for product in filtered_products]) / len(filtered_products),
-        }
+            return result
 
-        return result
+    def _compute_statistics(self, products: List[Product],
+                            snapshot: Optional[CatalogSnapshot] = None) -> Dict[str, Any]:
+        """
+        :param products: list of products, views and the raw products of the cached catalog are computed on its columns
+        :param snapshot: (optional) snapshot whose raw products are computed on its columns, defaults to the cached one
+        :return: dict with no of unique products, no of unique brands and average price (None without products)
+        """
+        if isinstance(products, ProductView):
+            if products.positions is None:
+                return products.snapshot.aggregates.distinct.statistics()
+            return products.snapshot.columns.statistics(products.positions)
+        snapshot = self.cache.peek() if snapshot is None else snapshot
+        if snapshot is not None and products is snapshot.raw_products:
+            # raw products are the distinct products, each one weighted with the no of times it occurred
+            return snapshot.aggregates.raw.statistics()
+        return {
+            "nproducts": len(set([product["product_id"] for product in products])),
+            "nbrands": len(set([product["brand_name"] for product in products])),
+            "avg_price": sum([to_cents(product["price"]) for product in products]) / (len(products) * 100)
+            if products else None,
+        }
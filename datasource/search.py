@@ -0,0 +1,347 @@
+import bisect
+import functools
+import itertools
+import re
+from collections import defaultdict
+from typing import List, Optional, Sequence, FrozenSet, Dict, NamedTuple, Iterable
+
+import numpy as np
+
+from datasource.expression import FilterPlan
+from datasource.indexes import CatalogIndexes, _bucket_bounds
+from models.product import Product
+
+# terms shorter than this match the start of a word, longer ones anywhere in a word (via the n-gram index)
+NGRAM_SIZE = 3
+# terms matching at least this share of the products are broad, their positions are kept by the indexes of the
+# snapshot and carried over to the next snapshot of a delta, as long as all of them hold no more positions than
+# BROAD_TERMS_SIZE times the no of products
+BROAD_TERM_SHARE = 1 / 64
+BROAD_TERMS_SIZE = 2
+
+# characters between words, besides white space. The NUL character separates names while indexing them
+_SEPARATORS = re.compile(r"[^\w\s\x00]+")
+_NAME_SEPARATOR = "\x00"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    :return: the lower cased words of text, in the order they occur
+    """
+    return _SEPARATORS.sub(" ", text.lower().replace(_NAME_SEPARATOR, " ")).split()
+
+
+@functools.lru_cache(maxsize=65536)
+def _words(name: Optional[str]) -> FrozenSet[str]:
+    return frozenset(tokenize(name)) if name else frozenset()
+
+
+def _term_matches(term: str, word: str) -> bool:
+    return word.startswith(term) if len(term) < NGRAM_SIZE else term in word
+
+
+def _ngrams(word: str) -> set:
+    return {word[start:start + NGRAM_SIZE] for start in range(len(word) - NGRAM_SIZE + 1)}
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    :return: concatenation of np.arange(start, end) for every start and end, without a python loop
+    """
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.intp)
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+
+
+class NameIndex:
+    """
+    inverted index of the distinct values (names) of a categorical string column: the sorted vocabulary of their
+    words, the postings (name codes) of every word, the n-grams of the words, and the words of every name. Terms are
+    looked up as ids of matching words, which lead to names and through the buckets of the column to products.
+    """
+    # numpy arrays and string lists the index consists of
+    ARRAYS = ("order", "bounds", "words", "word_bounds", "postings", "posting_bounds", "ngram_word_ids",
+              "ngram_bounds")
+    STRINGS = ("vocabulary", "ngram_keys")
+
+    def __init__(self, names: Sequence[str], order: np.ndarray, bounds: np.ndarray):
+        """
+        :param names: sorted categories of the column
+        :param order: positions of the products ordered by their name code
+        :param bounds: bounds of every name code in order
+        """
+        self.order, self.bounds = order, bounds
+        if names and names[0] is None:
+            # a missing name has no words
+            names = [""] + names[1:]
+        # all names are split at once, the words of name i follow the i-th separator
+        text = _NAME_SEPARATOR.join(names)
+        if text.count(_NAME_SEPARATOR) >= len(names):
+            text = _NAME_SEPARATOR.join(name.replace(_NAME_SEPARATOR, " ") for name in names)
+        text = _SEPARATORS.sub(" ", text.lower())
+        words = text.replace(_NAME_SEPARATOR, " {} ".format(_NAME_SEPARATOR)).split() if names else []
+        vocabulary = set(words)
+        vocabulary.discard(_NAME_SEPARATOR)
+        self.vocabulary = sorted(vocabulary)
+        lookup = {word: word_id for word_id, word in enumerate(self.vocabulary)}
+        lookup[_NAME_SEPARATOR] = -1
+        word_ids = np.fromiter(map(lookup.__getitem__, words), dtype=np.int64, count=len(words))
+        separators = word_ids < 0
+        name_codes = np.cumsum(separators, dtype=np.int32)[~separators]
+        # words of every name, the words of name i are words[word_bounds[i]:word_bounds[i + 1]]
+        self.words = word_ids[~separators]
+        self.word_bounds = np.searchsorted(name_codes, np.arange(len(names) + 1))
+        # postings: the names of word i are postings[posting_bounds[i]:posting_bounds[i + 1]]
+        word_order = np.argsort(self.words, kind="stable")
+        self.postings = name_codes[word_order]
+        self.posting_bounds = np.searchsorted(self.words[word_order], np.arange(len(self.vocabulary) + 1))
+        ngrams = defaultdict(list)  # type: Dict[str, List[int]]
+        for word_id, word in enumerate(self.vocabulary):
+            for ngram in _ngrams(word):
+                ngrams[ngram].append(word_id)
+        # n-gram postings: the words of n-gram i are ngram_word_ids[ngram_bounds[i]:ngram_bounds[i + 1]]
+        self.ngram_keys = sorted(ngrams)
+        self.ngram_bounds = np.zeros(len(self.ngram_keys) + 1, dtype=np.int64)
+        np.cumsum([len(ngrams[ngram]) for ngram in self.ngram_keys], out=self.ngram_bounds[1:])
+        self.ngram_word_ids = np.fromiter(itertools.chain.from_iterable(ngrams[ngram] for ngram in self.ngram_keys),
+                                          dtype=np.int64, count=int(self.ngram_bounds[-1]))
+        self._init_ngrams()
+
+    @classmethod
+    def from_arrays(cls, vocabulary: List[str], ngram_keys: List[str], **arrays: np.ndarray) -> "NameIndex":
+        """
+        creates the index out of already computed arrays, e.g. read from a file
+        :param vocabulary: sorted words of the names
+        :param ngram_keys: sorted n-grams of the words
+        :param arrays: the arrays named in ARRAYS
+        :return: name index
+        """
+        index = cls.__new__(cls)
+        index.vocabulary, index.ngram_keys = vocabulary, ngram_keys
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+        index._init_ngrams()
+        return index
+
+    def _init_ngrams(self):
+        bounds = self.ngram_bounds.tolist()
+        self.ngrams = {ngram: self.ngram_word_ids[bounds[i]:bounds[i + 1]] for i, ngram in enumerate(self.ngram_keys)}
+
+    def word_ids(self, term: str) -> np.ndarray:
+        """
+        :param term: lower cased search term
+        :return: ascending ids of the words of the vocabulary matching term
+        """
+        if len(term) < NGRAM_SIZE:
+            # the words starting with term are a range of the sorted vocabulary
+            low = bisect.bisect_left(self.vocabulary, term)
+            high = bisect.bisect_left(self.vocabulary, term + "\U0010ffff", low)
+            return np.arange(low, high)
+        postings = []
+        for ngram in _ngrams(term):
+            word_ids = self.ngrams.get(ngram)
+            if word_ids is None:
+                return np.empty(0, dtype=np.int64)
+            postings.append(word_ids)
+        postings.sort(key=len)
+        word_ids = functools.reduce(lambda first, second: np.intersect1d(first, second, assume_unique=True),
+                                    postings)
+        if len(term) > NGRAM_SIZE and len(word_ids):
+            # all n-grams of the term occur in these words, the term itself need not
+            vocabulary = self.vocabulary
+            word_ids = word_ids[[term in vocabulary[word_id] for word_id in word_ids]]
+        return word_ids
+
+    def estimate(self, word_ids: np.ndarray) -> float:
+        """
+        :return: estimated no of products with one of the words, from the no of names with the words
+        """
+        names = int((self.posting_bounds[word_ids + 1] - self.posting_bounds[word_ids]).sum())
+        return names * len(self.order) / max(len(self.bounds) - 1, 1)
+
+    def positions(self, word_ids: np.ndarray) -> np.ndarray:
+        """
+        :return: unordered positions of the products with a name containing one of the words
+        """
+        codes = np.unique(self.postings[_ranges(self.posting_bounds[word_ids], self.posting_bounds[word_ids + 1])])
+        return self.order[_ranges(self.bounds[codes], self.bounds[codes + 1])]
+
+    def contains(self, word_ids: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        :param word_ids: ascending word ids
+        :param codes: name codes
+        :return: boolean array, True for the codes of names containing one of the words
+        """
+        starts, ends = self.word_bounds[codes], self.word_bounds[codes + 1]
+        words = self.words[_ranges(starts, ends)]
+        found = np.searchsorted(word_ids, words)
+        hits = word_ids[np.minimum(found, max(len(word_ids) - 1, 0))] == words if len(word_ids) else found < 0
+        result = np.zeros(len(codes), dtype=bool)
+        result[np.repeat(np.arange(len(codes)), ends - starts)[hits]] = True
+        return result
+
+
+class TermMatches(NamedTuple):
+    """
+    ids of the words of the brand and product names matching a search term, and an estimate of the no of products
+    matching it
+    """
+    term: str
+    brand_name: np.ndarray
+    product_name: np.ndarray
+    estimate: float
+
+
+class SearchIndex:
+    """
+    search over the brand and product names of a catalog snapshot. A product matches a term if a word of its brand
+    or product name starts with the term (terms shorter than NGRAM_SIZE) or contains it. Terms are looked up among
+    the words of the distinct names, so the cost grows with the no of matching products, not with the catalog size.
+    The positions of broad terms are kept in the broad_terms of the indexes.
+    """
+    # name columns with a NameIndex
+    COLUMNS = ("brand_name", "product_name")
+
+    def __init__(self, indexes: CatalogIndexes):
+        """
+        :param indexes: secondary indexes of the snapshot, their brand_name buckets are reused
+        """
+        columns = indexes.columns
+        self.columns = columns
+        self.broad_terms = indexes.broad_terms
+        self.brand_name = NameIndex(columns.brand_names, indexes.brand_name_order, indexes.brand_name_bounds)
+        self.product_name = NameIndex(columns.product_names,
+                                      *_bucket_bounds(columns.product_name, len(columns.product_names)))
+
+    @classmethod
+    def from_name_indexes(cls, indexes: CatalogIndexes, brand_name: NameIndex,
+                          product_name: NameIndex) -> "SearchIndex":
+        """
+        creates the search index out of already built name indexes, e.g. read from a file
+        """
+        search = cls.__new__(cls)
+        search.columns, search.broad_terms = indexes.columns, indexes.broad_terms
+        search.brand_name, search.product_name = brand_name, product_name
+        return search
+
+    def lookup(self, term: str) -> TermMatches:
+        """
+        :param term: lower cased search term
+        :return: words of the brand and product names matching term
+        """
+        brand_name, product_name = self.brand_name.word_ids(term), self.product_name.word_ids(term)
+        return TermMatches(term, brand_name, product_name,
+                           self.brand_name.estimate(brand_name) + self.product_name.estimate(product_name))
+
+    def select(self, matches: TermMatches) -> np.ndarray:
+        """
+        :return: ascending positions of the products matching a term
+        """
+        positions = self.broad_terms.get(matches.term)
+        if positions is not None:
+            return positions
+        positions = self.product_name.positions(matches.product_name)
+        if len(matches.brand_name):
+            positions = np.concatenate([self.brand_name.positions(matches.brand_name), positions])
+        if len(positions) * 16 > len(self.columns):
+            # marking the positions is cheaper than sorting them if many products match
+            matching = np.zeros(len(self.columns), dtype=bool)
+            matching[positions] = True
+            positions = np.flatnonzero(matching)
+        else:
+            positions = np.unique(positions)
+        if len(positions) >= len(self.columns) * BROAD_TERM_SHARE and (
+                sum(map(len, self.broad_terms.values())) + len(positions) <= len(self.columns) * BROAD_TERMS_SIZE):
+            # shared by all queries of the term, so it must not be changed
+            positions.flags.writeable = False
+            self.broad_terms[matches.term] = positions
+        return positions
+
+    def mask(self, matches: TermMatches, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        :param matches: words matching a term
+        :param positions: (optional) positions to check, defaults to all products
+        :return: boolean array, True for the products (at positions) matching the term
+        """
+        brand_name, product_name = self.columns.brand_name, self.columns.product_name
+        if positions is not None:
+            brand_name, product_name = brand_name[positions], product_name[positions]
+        return (self.brand_name.contains(matches.brand_name, brand_name)
+                | self.product_name.contains(matches.product_name, product_name))
+
+
+class Search(FilterPlan):
+    """
+    products matching all terms of a search query in their brand or product name, see SearchIndex. Runs on the
+    search index of the catalog snapshot
+    """
+    selective = True
+
+    def __init__(self, terms: Sequence[str]):
+        self.terms = tuple(terms)
+        super().__init__(("search", self.terms))
+
+    def _build_predicate(self):
+        terms = self.terms
+
+        def matches(product):
+            words = _words(product.brand_name) | _words(product.product_name)
+            return all(any(_term_matches(term, word) for word in words) for term in terms)
+
+        return matches
+
+    def mask(self, indexes, positions=None):
+        search = indexes.search
+        return functools.reduce(np.logical_and, (search.mask(search.lookup(term), positions) for term in self.terms))
+
+    def select(self, indexes, positions=None):
+        if positions is not None:
+            return super().select(indexes, positions)
+        broad_terms = indexes.broad_terms
+        if all(term in broad_terms for term in self.terms):
+            # answered without the search index, e.g. by the broad terms carried over from the previous snapshot
+            return functools.reduce(lambda first, second: np.intersect1d(first, second, assume_unique=True),
+                                    (broad_terms[term] for term in self.terms))
+        # the products of the term with the fewest matches are the candidates, the other terms are checked on them
+        search = indexes.search
+        matches = sorted((search.lookup(term) for term in self.terms), key=lambda term_matches: term_matches.estimate)
+        candidates = search.select(matches[0])
+        for term_matches in matches[1:]:
+            if not len(candidates):
+                break
+            candidates = candidates[search.mask(term_matches, candidates)]
+        return candidates
+
+
+def apply_delta(broad_terms: Dict[str, np.ndarray], moved: np.ndarray, added: Iterable[Product],
+                added_positions: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    carries the broad terms of a snapshot over to the next snapshot of a delta, without the search index: the
+    positions of the kept products are moved and the added products matching a term are appended
+    :param broad_terms: ascending positions of the broad terms of the previous snapshot
+    :param moved: position in the next snapshot of every product of the previous snapshot, -1 if it was removed
+    :param added: products added by the delta, they follow the kept products
+    :param added_positions: positions of the added products in the next snapshot
+    :return: ascending positions of the broad terms in the next snapshot
+    """
+    added = list(added)
+    result = {}
+    for term, positions in broad_terms.items():
+        positions = moved[positions]
+        matches = Search((term,)).predicate
+        positions = np.concatenate([positions[positions >= 0], added_positions[
+            np.fromiter(map(matches, added), dtype=bool, count=len(added))]])
+        positions.flags.writeable = False
+        result[term] = positions
+    return result
+
+
+def search_plan(query: str) -> Optional[Search]:
+    """
+    :param query: search query, e.g. "acme anv"
+    :return: plan matching the products which match every word of the query, None if the query has no words
+    """
+    terms = sorted(set(tokenize(query)))
+    return Search(terms) if terms else None
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from datasource.cache import CatalogRefresher
+from datasource.persist import load_snapshot
+from datasource.rest import RestDataSource, InvalidResponseError
+from datasource.snapshot import CatalogSnapshot
+
+# tmpfs backing multiprocessing.shared_memory on Linux, files in it live in memory and are shared by all processes
+# which map them
+SHARED_MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def default_shared_path(name: str = "beautylish-catalog") -> str:
+    """
+    :return: path of the shared catalog file name in shared memory
+    """
+    return os.path.join(SHARED_MEMORY_DIR, name)
+
+
+class CatalogPublisher(RestDataSource):
+    """
+    REST datasource which publishes every catalog it fetches, with its indexes and search index, to a file in shared
+    memory (see SharedCatalogDataSource). It is run by a single process, e.g. with start_refresher(), the workers of
+    a prefork server only read the published catalog, so the search index is built once per catalog instead of once
+    per worker.
+    """
+    data_source_name = "REST_PUBLISHER"
+
+    def __init__(self, base_url, shared_path: str, **kwargs):
+        """
+        :param base_url: url of the upstream product list
+        :param shared_path: file the catalog is published to, preferably in SHARED_MEMORY_DIR
+        :param kwargs: other args of RestDataSource
+        """
+        super().__init__(base_url, snapshot_path=shared_path, **kwargs)
+
+    def _load_snapshot(self, previous: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+        snapshot = super()._load_snapshot(previous)
+        # built before publishing, so the workers do not build them each
+        snapshot.indexes.search
+        return snapshot
+
+
+class SharedCatalogDataSource(RestDataSource):
+    """
+    datasource of the worker processes, it attaches to the catalog published by a CatalogPublisher instead of
+    fetching the upstream. The columns and indexes are read-only views of the memory mapped file, so all workers
+    share one copy of them in memory. The file is checked every check_interval seconds (in the background while the
+    current catalog is served), a new version replaces the current snapshot at once. As the publisher replaces the
+    file atomically, a worker maps either the old or the new version completely, and the old mapping stays valid
+    while requests still use it.
+    """
+    data_source_name = "SHARED"
+
+    def __init__(self, shared_path: str, check_interval: float = 1.0, **kwargs):
+        """
+        :param shared_path: file the catalog is published to
+        :param check_interval: seconds between two checks of the file for a new version
+        :param kwargs: other args of RestDataSource, e.g. query_cache_size
+        """
+        kwargs.setdefault("cache_ttl", check_interval)
+        kwargs.setdefault("stale_ttl", float("inf"))
+        super().__init__(None, **kwargs)
+        self.shared_path = shared_path
+        self.check_interval = check_interval
+
+    def start_refresher(self, interval: Optional[float] = None, jitter: float = 0.1,
+                        warm: bool = True) -> CatalogRefresher:
+        """
+        starts checking the file for a new version in the background, see RestDataSource.start_refresher()
+        :param interval: mean no of seconds between two checks, defaults to check_interval
+        """
+        return super().start_refresher(self.check_interval if interval is None else interval, jitter, warm)
+
+    def _file_version(self) -> Tuple[int, int, int]:
+        """
+        :return: key which changes whenever the publisher replaces the file
+        """
+        try:
+            stat = os.stat(self.shared_path)
+        except FileNotFoundError as exc:
+            raise InvalidResponseError("No catalog published at {}".format(self.shared_path)) from exc
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_snapshot(self, previous: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+        """
+        loader used by the catalog cache, attaches to the published file
+        :param previous: snapshot that is currently cached, if any
+        :return: snapshot of the published file, previous if the file did not change
+        """
+        # if the file is replaced between stat and load, the next check just loads it once more
+        version = self._file_version()
+        if previous is not None and previous.peek("file_version") == version:
+            return previous
+        snapshot = load_snapshot(self.shared_path)
+        snapshot.derive("file_version", lambda: version)
+        return snapshot
@@ -0,0 +1,273 @@
+import itertools
+import threading
+import time
+from collections.abc import Sequence
+from typing import List, Optional, Callable, Any, Dict
+
+import numpy as np
+
+from datasource.aggregates import CatalogAggregates
+from datasource.base import ProductPage
+from datasource.columnar import ColumnarCatalog
+from datasource.indexes import CatalogIndexes
+from models.product import Product
+
+# process wide counter so that every accepted catalog gets a distinct version, even after an invalidation
+_versions = itertools.count(1)
+
+
+class CatalogSnapshot:
+    """
+    immutable view of the catalog as it was fetched from the upstream at one point in time.
+    Anything that is derived from the catalog (deduped list, indexes, rendered fragments...) is attached to the
+    snapshot, so it is computed at most once per version and dropped together with it.
+    """
+
+    def __init__(self, raw_products: List[Product], etag: Optional[str] = None,
+                 last_modified: Optional[str] = None, distinct: Optional["CatalogBuilder"] = None):
+        """
+        :param raw_products: products as they occur in the upstream payload, with duplicates
+        :param etag: ETag of the upstream response
+        :param last_modified: Last-Modified of the upstream response
+        :param distinct: (optional) builder which already removed the duplicates of raw_products while ingesting
+        """
+        self.version = next(_versions)
+        self.raw_products = raw_products
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.time()
+        self._derived = {}  # type: Dict[str, Any]
+        self._lock = threading.RLock()
+        if distinct is not None:
+            self._derived["distinct"] = distinct
+
+    @property
+    def distinct(self) -> "CatalogBuilder":
+        """
+        :return: distinct products, in the order they were first seen in the upstream payload, with their counts
+        and positions
+        """
+        return self.derive("distinct", lambda: CatalogBuilder().extend(self.raw_products))
+
+    @property
+    def positions(self) -> Dict[Product, int]:
+        """
+        :return: dict of the distinct products and their position in products
+        """
+        return self.distinct.positions
+
+    @property
+    def columns(self) -> ColumnarCatalog:
+        """
+        :return: columnar copy of the distinct products, used for vectorized filtering, sorting and statistics
+        """
+        return self.derive("columns", lambda: ColumnarCatalog(self.distinct.products, self.distinct.counts))
+
+    @property
+    def digest(self) -> str:
+        """
+        :return: hash of the content of the snapshot, the same for equal catalogs in every process (unlike version)
+        """
+        return self.derive("digest", self.columns.digest)
+
+    @property
+    def indexes(self) -> CatalogIndexes:
+        """
+        :return: secondary indexes on status, brand_name and price of the distinct products
+        """
+        return self.derive("indexes", lambda: CatalogIndexes(self.columns, broad_terms=self.peek("broad_terms")))
+
+    @property
+    def aggregates(self) -> CatalogAggregates:
+        """
+        :return: statistics aggregates of the raw catalog, of all distinct products and of every status
+        """
+        return self.derive("aggregates", lambda: CatalogAggregates.from_columns(self.columns))
+
+    @property
+    def products(self) -> "ProductView":
+        """
+        distinct products of the snapshot, in the order they were first seen in the upstream payload
+        :return: list of products without duplicates
+        """
+        return self.derive("products", lambda: ProductView(self, None, self.distinct.products))
+
+    def derive(self, name: str, builder: Callable[[], Any]) -> Any:
+        """
+        gets a value derived from this snapshot, building it with builder() on first access
+        :param name: unique name of the derived value
+        :param builder: callable without args that builds the value
+        :return: the derived value
+        """
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = builder()
+            return self._derived[name]
+
+    def peek(self, name: str) -> Optional[Any]:
+        """
+        :param name: unique name of the derived value
+        :return: the derived value if it was built already, else None
+        """
+        return self._derived.get(name)
+
+    def __len__(self):
+        return len(self.raw_products)
+
+
+class CatalogBuilder:
+    """
+    collects the products of a catalog while they are ingested and removes duplicates on the fly, in a single pass.
+    Duplicates are replaced by the first equal product, so every distinct product exists only once in memory.
+    """
+
+    def __init__(self):
+        self.raw_products = []  # type: List[Product]
+        self.products = []  # type: List[Product]
+        self.counts = []  # type: List[int]
+        self.positions = {}  # type: Dict[Product, int]
+
+    def add(self, product: Product) -> Product:
+        """
+        :param product: next product of the catalog
+        :return: the product, or the equal product that was added before
+        """
+        position = self.positions.setdefault(product, len(self.products))
+        if position == len(self.products):
+            self.products.append(product)
+            self.counts.append(1)
+        else:
+            product = self.products[position]
+            self.counts[position] += 1
+        self.raw_products.append(product)
+        return product
+
+    def extend(self, products) -> "CatalogBuilder":
+        for product in products:
+            self.add(product)
+        return self
+
+    def build(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> CatalogSnapshot:
+        """
+        :return: snapshot of the collected catalog
+        """
+        return CatalogSnapshot(self.raw_products, etag=etag, last_modified=last_modified, distinct=self)
+
+
+class LazyProducts(Sequence):
+    """
+    read-only sequence of products which are only created on first access, e.g. out of the columns of a snapshot
+    file. Its length is known before. It is not a list subclass, as code which reads python lists directly (json,
+    orjson, numpy) would see the empty list storage instead of the products, convert it with list() if a list is
+    needed.
+    """
+
+    def __init__(self, build: Callable[[], List[Product]], length: int):
+        """
+        :param build: callable without args which creates the products
+        :param length: no of products build() returns
+        """
+        self._build = build
+        self._length = length
+        self._lock = threading.Lock()
+        self._products = None  # type: Optional[List[Product]]
+
+    def materialize(self) -> List[Product]:
+        """
+        creates the products if they were not created yet
+        :return: list of the products, it must not be modified
+        """
+        if self._products is None:
+            with self._lock:
+                if self._products is None:
+                    self._products = self._build()
+                    self._build = None
+        return self._products
+
+    @staticmethod
+    def _as_list(other) -> Optional[list]:
+        if isinstance(other, LazyProducts):
+            return other.materialize()
+        return other if isinstance(other, list) else None
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __reversed__(self):
+        return reversed(self.materialize())
+
+    def __getitem__(self, index):
+        return self.materialize()[index]
+
+    def __contains__(self, product):
+        return product in self.materialize()
+
+    def __eq__(self, other):
+        other = self._as_list(other)
+        return NotImplemented if other is None else self.materialize() == other
+
+    def __ne__(self, other):
+        other = self._as_list(other)
+        return NotImplemented if other is None else self.materialize() != other
+
+    __hash__ = None
+
+    def __add__(self, other):
+        other = self._as_list(other)
+        return NotImplemented if other is None else self.materialize() + other
+
+    def __radd__(self, other):
+        other = self._as_list(other)
+        return NotImplemented if other is None else other + self.materialize()
+
+    def __mul__(self, n):
+        return self.materialize() * n
+
+    def __repr__(self):
+        return repr(self.materialize())
+
+    def index(self, *args):
+        return self.materialize().index(*args)
+
+    def count(self, product):
+        return self.materialize().count(product)
+
+    def copy(self) -> List[Product]:
+        return list(self.materialize())
+
+
+class ProductView(LazyProducts):
+    """
+    list of products of a snapshot which remembers their positions in snapshot.products. filter() and sort() of
+    RestDataSource recognize views and work on the positions with the columnar catalog of the snapshot instead of
+    looping over the products. The products are only taken from the snapshot when the view is first read, so
+    filtering and sorting create no products. A view can be a page of a longer list like a ProductPage.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot, positions: Optional[np.ndarray],
+                 products: Optional[List[Product]] = None, total: Optional[int] = None, offset: int = 0):
+        """
+        :param snapshot: snapshot the products belong to
+        :param positions: positions of the products in snapshot.products, None for all of them
+        :param products: (optional) the products at positions, taken from the snapshot if not provided
+        :param total: (optional) no of products of the whole list, if the view is a page of it
+        :param offset: position of the first product of the page in the whole list
+        """
+        if products is None:
+            length = len(snapshot.columns) if positions is None else len(positions)
+            super().__init__(lambda: snapshot.columns.take(positions), length)
+        else:
+            super().__init__(lambda: products, len(products))
+        self.total = len(self) if total is None else total
+        self.offset = offset
+        self.snapshot = snapshot
+        self.positions = positions
+
+    next_cursor = ProductPage.next_cursor
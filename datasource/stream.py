@@ -0,0 +1,108 @@
+import codecs
+import json
+import re
+from typing import Iterable, Iterator, Any
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonReader:
+    """
+    reads JSON values one after the other from an iterable of byte chunks. Only the part of the document which
+    is not parsed yet is kept in memory.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """
+        appends the next chunk to the buffer and drops the already parsed part
+        :return: False if there are no more chunks
+        """
+        for chunk in self.chunks:
+            text = self.text_decoder.decode(chunk)
+            if text:
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        if not self.eof:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self.text_decoder.decode(b"", final=True)
+            self.pos = 0
+        return False
+
+    def peek(self) -> str:
+        """
+        :return: next non whitespace character, without consuming it
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, char: str):
+        """
+        consumes the next non whitespace character, which must be char
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError("Expected {!r} at position {} but found {!r}".format(char, self.pos, found))
+        self.pos += 1
+
+    def value(self) -> Any:
+        """
+        :return: next complete JSON value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number or literal ending exactly at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """
+    parses a JSON document of the form {..., key: [item, item, ...], ...} incrementally and yields the items of
+    the array one by one, without decoding the whole document first.
+    :param chunks: iterable of utf-8 encoded byte chunks of the document, e.g. response.iter_content()
+    :param key: name of the top level key holding the array
+    :return: generator of the decoded items
+    """
+    reader = _JsonReader(chunks)
+    reader.expect("{")
+    # skip the top level members until key is found
+    while True:
+        if reader.peek() == "}":
+            raise ValueError("Key {!r} not found in JSON document".format(key))
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            break
+        reader.value()
+        if reader.peek() == ",":
+            reader.expect(",")
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == "]":
+            return
+        reader.expect(",")
@@ -0,0 +1,63 @@
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+# idempotent requests are retried on these status codes
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HttpTransport:
+    """
+    pooled keep-alive HTTP client owned by a datasource. All requests share one requests.Session, so the TCP and
+    TLS handshakes are paid once per pooled connection instead of once per fetch.
+    """
+
+    def __init__(self, timeout: Tuple[float, float] = (3.05, 30.0), retries: int = 3, backoff_factor: float = 0.5,
+                 pool_maxsize: int = 10):
+        """
+        :param timeout: (connect timeout, read timeout) in seconds
+        :param retries: max no of retries of a failed GET (connection errors, read errors and RETRY_STATUS_CODES)
+        :param backoff_factor: retries sleep backoff_factor * 2 ** (retry no - 1) seconds
+        :param pool_maxsize: max no of connections kept alive per host
+        """
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(["GET"]),
+            # the last failed response is returned instead of raising, so that the caller can report its status
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # urllib3 advertises (and decodes) brotli only when the brotli package is installed
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+    def get(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+            stream: bool = False) -> requests.Response:
+        """
+        sends a GET request, conditional when the validators of an earlier response are provided
+        :param url: url to get
+        :param etag: ETag of the earlier response, sent as If-None-Match
+        :param last_modified: Last-Modified of the earlier response, sent as If-Modified-Since
+        :param stream: if True the body is not read before returning
+        :return: response, with status code 304 when the resource did not change
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+
+    def close(self):
+        """
+        closes all pooled connections
+        """
+        self.session.close()
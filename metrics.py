@@ -0,0 +1,299 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, Tuple, List, Optional, Callable, Iterable, Iterator, Sequence
+
+# upper bounds in seconds of the latency buckets, from 100us to 10s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+             for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    a metric with a value per combination of label values, rendered in the Prometheus text format
+    """
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, Labels, Sequence[str], float]]:
+        """
+        :return: generator of the name suffix, label names, label values and value of every sample
+        """
+        raise NotImplementedError()
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} {}".format(self.name, self.type_name)]
+        for suffix, names, values, value in self.samples():
+            lines.append("{}{}{} {}".format(self.name, suffix, _format_labels(names, values), _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}  # type: Dict[Labels, float]
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        # copied under the lock, so concurrent updates neither change the dict while it is iterated nor block on
+        # sorting and formatting
+        with self._lock:
+            items = list(self.values.items())
+        for labels, value in sorted(items):
+            yield "", self.labelnames, labels, value
+
+
+class Gauge(Counter):
+    """
+    value which can go up and down, set() at the time it changes or computed by a callback when rendered
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Labels, float]]] = None):
+        """
+        :param callback: (optional) callable returning the current values by label values, called when rendered
+        """
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self.values[labels] = value
+
+    def samples(self):
+        if self.callback is not None:
+            values = dict(self.callback())
+            with self._lock:
+                self.values = values
+        return super().samples()
+
+
+class CallbackCounter(Gauge):
+    """
+    counter whose values are read from elsewhere (e.g. the stats of a cache) when rendered
+    """
+    type_name = "counter"
+
+
+class Histogram(Metric):
+    """
+    distribution of observed values (latencies in seconds) in cumulative buckets, with their sum and count
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # per label values: count of every bucket (not cumulative, the last one is +Inf), sum
+        self.values = {}  # type: Dict[Labels, Tuple[List[int], List[float]]]
+
+    def observe(self, *labels: str, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self.values.get(labels) or self.values.setdefault(
+                labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        counts = self.values.get(labels)
+        return sum(counts[0]) if counts else 0
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        # the bucket counts are updated in place, so they are copied under the lock as well
+        with self._lock:
+            items = [(labels, list(counts), total[0]) for labels, (counts, total) in self.values.items()]
+        for labels, counts, total in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", names, labels + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, labels, total
+            yield "_count", self.labelnames, labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    the metrics of the process. While disabled nothing is recorded and stage() costs a single attribute check.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.metrics = {}  # type: Dict[str, Metric]
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        :return: metric, or the metric registered before under the same name
+        """
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """
+        :return: all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self.metrics.values():
+            if isinstance(metric, (Counter, Histogram)):
+                metric.values = {}
+
+
+REGISTRY = MetricsRegistry()
+# content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "beautylish_stage_duration_seconds", "Time spent in a stage of serving the catalog", ("stage",)))
+UPSTREAM_RESPONSES = REGISTRY.register(Counter(
+    "beautylish_upstream_responses_total", "Responses of the upstream product list by status code", ("status",)))
+UPSTREAM_BYTES = REGISTRY.register(Counter(
+    "beautylish_upstream_response_bytes_total", "Bytes of the upstream product list payloads (decoded)"))
+
+# stage timings of the current request, for the Server-Timing header. None outside of a request
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, time.perf_counter() - self.start)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    """
+    context manager which times a stage, e.g. `with stage("sort"): ...`
+    :param name: name of the stage, the stage label of the histogram and the name in Server-Timing
+    :return: context manager
+    """
+    if not REGISTRY.enabled:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def inc(counter: Counter, *labels: str, amount: float = 1):
+    """
+    increments counter unless the metrics are disabled
+    """
+    if REGISTRY.enabled:
+        counter.inc(*labels, amount=amount)
+
+
+def record_stage(name: str, seconds: float):
+    """
+    records the duration of a stage in the histogram and in the timings of the current request
+    """
+    STAGE_SECONDS.observe(name, value=seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def timed_iter(name: str, iterable: Iterable) -> Iterator:
+    """
+    times a lazily consumed iterable (e.g. a streamed template) as one stage, the time the consumer spends between
+    the items is not counted
+    :param name: name of the stage
+    :param iterable: iterable to time
+    :return: generator of the items of iterable
+    """
+    if not REGISTRY.enabled:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                return
+            seconds += time.perf_counter() - start
+            yield item
+    finally:
+        record_stage(name, seconds)
+
+
+def start_request():
+    """
+    starts collecting the stage timings of the current request
+    """
+    if REGISTRY.enabled:
+        _request_timings.set({})
+
+
+def server_timing() -> Optional[str]:
+    """
+    :return: value of the Server-Timing header with the stages of the current request so far, in milliseconds.
+    None if there are none
+    """
+    timings = _request_timings.get()
+    if not timings:
+        return None
+    return ", ".join("{};dur={:.3f}".format(name, seconds * 1000) for name, seconds in timings.items())
+
+
+def end_request():
+    """
+    stops collecting the stage timings of the current request
+    """
+    _request_timings.set(None)
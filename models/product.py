@@ -8,6 +8,9 @@ class ProductStatus(enum.Enum):
 
 
 class Product:
+    # no per instance __dict__, products are created once per catalog row
+    __slots__ = ("product_id", "price", "brand_name", "product_name", "status")
+
     def __init__(
         self,
         product_id: int,
@@ -23,17 +26,14 @@ class Product:
         self.status = status
 
     def __hash__(self):
-        return hash(
-            (
-                self.product_id,
-                self.price,
-                self.brand_name,
-                self.product_name,
-                self.status,
-            )
-        )
+        # equal products have equal ids, so the id is a valid hash. Unlike a hash of all fields it needs neither a
+        # tuple per call nor an extra int object per product to cache it, and products with different ids (nearly
+        # all of them) are told apart without comparing the other fields
+        return hash(self.product_id)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, type(self)):
             return NotImplementedError()
         return (
@@ -50,12 +50,8 @@ class Product:
         )
 
     def __setitem__(self, key, value):
-        vars(self)[key] = value
-
-    def __getitem__(self, item):
-        """
-        to make the Product object subscriptable
-        :param item: name of the instance var
-        :return: attribute value of the instance var item
-        """
-        return super().__getattribute__(item)
+        setattr(self, key, value)
+
+    # to make the Product object subscriptable, product[item] returns the attribute value of the instance var item.
+    # object.__getattribute__ is used directly, so that sort keys and comprehensions do not pay a python call
+    __getitem__ = object.__getattribute__
@@ -0,0 +1,178 @@
+import enum
+import functools
+import html
+import json
+import re
+from typing import List, Iterable, Iterator, Dict, Any, Callable, Tuple, Optional
+
+from markupsafe import Markup
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional, json is used without it
+    orjson = None
+
+from datasource.snapshot import ProductView
+from models.product import Product, ProductStatus
+from utils import iter_chunks
+
+
+def render_cell(value) -> str:
+    """
+    :param value: attribute value of a product
+    :return: html escaped text of the value, Enum values (the status) are shown by their name
+    """
+    if isinstance(value, str):
+        return html.escape(value)
+    if isinstance(value, (int, float)):
+        # the text of a number has nothing to escape
+        return str(value)
+    return html.escape(value.name if isinstance(value, enum.Enum) else str(value))
+
+
+def render_row(product: Product, col_names: List[str]) -> str:
+    """
+    :param product: product to render
+    :param col_names: names of the product attributes shown in the table, in column order
+    :return: html table row of the product
+    """
+    return "<tr>" + "".join(["<td>" + render_cell(product[col]) + "</td>" for col in col_names]) + "</tr>\n"
+
+
+def get_row_fragments(products: Iterable[Product], col_names: List[str]) -> Iterator[str]:
+    """
+    gets the html table rows of the products. Rows of products of the cached catalog are rendered once per catalog
+    snapshot (and column list) and served from a cache afterwards.
+    :param products: products to render, in table order
+    :param col_names: names of the product attributes shown in the table, in column order
+    :return: generator of html rows
+    """
+    if not isinstance(products, ProductView):
+        return (render_row(product, col_names) for product in products)
+    cache = products.snapshot.derive("row_fragments:" + ",".join(col_names), dict)  # type: Dict[Product, str]
+    return (_cached_row(cache, product, col_names) for product in products)
+
+
+def _cached_row(cache: Dict[Product, str], product: Product, col_names: List[str]) -> str:
+    row = cache.get(product)
+    if row is None:
+        row = cache[product] = render_row(product, col_names)
+    return row
+
+
+def render_rows(products: Iterable[Product], col_names: List[str], chunk_size: int) -> Iterator[Markup]:
+    """
+    :param products: products to render, in table order
+    :param col_names: names of the product attributes shown in the table, in column order
+    :param chunk_size: min no of characters of the returned chunks
+    :return: generator of already escaped chunks of html rows, to be output as they are by the template
+    """
+    return (Markup(chunk) for chunk in iter_chunks(get_row_fragments(products, col_names), chunk_size))
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    :param obj: JSON serializable object
+    :return: compact utf-8 encoded JSON of obj, serialized with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def product_to_dict(product: Product) -> Dict[str, Any]:
+    """
+    :param product: product to serialize
+    :return: JSON serializable dict of the product, the status is given by its name
+    """
+    return {
+        "product_id": product.product_id,
+        "price": product.price,
+        "brand_name": product.brand_name,
+        "product_name": product.product_name,
+        "status": product.status.name,
+    }
+
+
+# columns of the exported products, in the order of product_to_dict()
+EXPORT_COLUMNS = ("product_id", "price", "brand_name", "product_name", "status")
+# one exported line per format, the names are formatted already. A NDJSON line is what dumps(product_to_dict())
+# returns, without building a dict per product
+_CSV_LINE = "%d,%r,%s,%s,%s\n"
+_NDJSON_LINE = '{"product_id":%d,"price":%r,"brand_name":%s,"product_name":%s,"status":"%s"}\n'
+_CSV_SPECIAL = re.compile(r'[",\r\n]')
+_STATUS_NAMES = {status.value: status.name for status in ProductStatus}
+
+
+def csv_cell(text: Optional[str]) -> str:
+    """
+    :return: text as a CSV field, quoted only if it contains a comma, quote or line break (like csv.QUOTE_MINIMAL),
+    an empty field for None
+    """
+    if text is None:
+        return ""
+    return '"' + text.replace('"', '""') + '"' if _CSV_SPECIAL.search(text) else text
+
+
+def _formatted_names(columns, encode: Callable[[str], str]) -> Tuple[List[str], List[str]]:
+    return [encode(name) for name in columns.brand_names], [encode(name) for name in columns.product_names]
+
+
+def _iter_lines(batches: Iterable[List[Product]], export_format: str, line: str,
+                encode: Callable[[str], str]) -> Iterator[str]:
+    """
+    :param batches: lists of products, views of the cached catalog are formatted from its columns with the names
+    formatted once per snapshot
+    :param export_format: name of the format
+    :param line: format of a line, see _CSV_LINE
+    :param encode: function formatting a name
+    :return: generator of the lines of every batch
+    """
+    for batch in batches:
+        if isinstance(batch, ProductView) and batch.positions is not None:
+            columns, positions = batch.snapshot.columns, batch.positions
+            brand_names, product_names = batch.snapshot.derive("export_names:" + export_format, functools.partial(
+                _formatted_names, columns, encode))
+            rows = zip(columns.product_id[positions].tolist(), columns.price[positions].tolist(),
+                       map(brand_names.__getitem__, columns.brand_name[positions].tolist()),
+                       map(product_names.__getitem__, columns.product_name[positions].tolist()),
+                       map(_STATUS_NAMES.__getitem__, columns.status[positions].tolist()))
+        else:
+            rows = ((product.product_id, product.price, encode(product.brand_name), encode(product.product_name),
+                     product.status.name) for product in batch)
+        yield "".join(map(line.__mod__, rows))
+
+
+def iter_csv(batches: Iterable[List[Product]]) -> Iterator[str]:
+    """
+    :param batches: lists of products, e.g. datasource.get_product_batches()
+    :return: generator of a header line with EXPORT_COLUMNS and of the CSV text of every batch
+    """
+    yield ",".join(EXPORT_COLUMNS) + "\n"
+    yield from _iter_lines(batches, "csv", _CSV_LINE, csv_cell)
+
+
+def iter_ndjson(batches: Iterable[List[Product]]) -> Iterator[str]:
+    """
+    :param batches: lists of products, e.g. datasource.get_product_batches()
+    :return: generator of the newline delimited JSON of every batch, one product_to_dict() object per line
+    """
+    return _iter_lines(batches, "ndjson", _NDJSON_LINE, _json_string)
+
+
+def _json_string(text: Optional[str]) -> str:
+    return "null" if text is None else json.encoder.encode_basestring(text)
+
+
+def products_to_dict(page: List[Product]) -> Dict[str, Any]:
+    """
+    :param page: products returned by datasource.get_products()
+    :return: JSON serializable dict of the products and, for pages, the total no of products and the cursor of the
+    next page
+    """
+    return {
+        "products": [product_to_dict(product) for product in page],
+        "total": getattr(page, "total", len(page)),
+        "offset": getattr(page, "offset", 0),
+        "next_cursor": getattr(page, "next_cursor", None),
+    }
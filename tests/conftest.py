@@ -1,6 +1,8 @@
 # contains fixtures used by pytest and automatically used in test classes
 
 import copy
+import random
+
 import pytest
 
 from datasource.rest import RestDataSource
@@ -102,4 +104,45 @@ def get_hidden_prods(get_product_lst):
     """
     return [
         product for product in get_product_lst if product['status'] == ProductStatus.HIDDEN
-    ]
\ No newline at end of file
+    ]
+
+
+@pytest.fixture(scope='function')
+def upstream_server(raw_product_data):
+    """
+    starts a local stand-in for the upstream product list serving raw_product_data
+    :return: running UpstreamServer, stopped after the test
+    """
+    from tests.upstream import UpstreamServer
+
+    with UpstreamServer(raw_product_data) as server:
+        yield server
+
+
+@pytest.fixture(scope='function')
+def random_product_lst():
+    """
+    a few hundred random products with many duplicates and equal prices/names
+    """
+    rnd = random.Random(7)
+    products = [
+        Product(rnd.randint(1, 150), rnd.choice([1.5, 10.0, 123.45, 99.99]), rnd.choice(["Acme", "Hooli", "Zed"]),
+                rnd.choice(["Anvil", "Nucleus", "Widget", "anvil"]), rnd.choice(list(ProductStatus)))
+        for _ in range(400)
+    ]
+    return products + products[:50]
+
+
+@pytest.fixture(scope='function')
+def flask_client(raw_product_data, requests_mock, tmp_path, monkeypatch):
+    """
+    test client of the flask app, whose upstream is mocked to return raw_product_data
+    :return: flask test client
+    """
+    import app
+
+    monkeypatch.setattr(app.datasource, "snapshot_path", str(tmp_path / "catalog.snapshot"))
+    requests_mock.get(app.BEAUTYLISH_REST_API_URL, status_code=200, json={'products': raw_product_data})
+    app.datasource.invalidate()
+    yield app.app.test_client()
+    app.datasource.invalidate()
@@ -0,0 +1,76 @@
+import pytest
+
+from datasource.aggregates import CatalogAggregates, StatisticsAggregate
+from datasource.snapshot import CatalogSnapshot
+from models.product import Product, ProductStatus
+
+
+def approx_statistics(statistics):
+    return dict(statistics, avg_price=pytest.approx(statistics["avg_price"]))
+
+
+class TestAggregates:
+    def test_aggregates_match_statistics_of_columns(self, random_product_lst):
+        snapshot = CatalogSnapshot(random_product_lst)
+        columns, aggregates = snapshot.columns, snapshot.aggregates
+        assert aggregates.raw.statistics() == approx_statistics(columns.statistics(weighted=True))
+        assert aggregates.get({}).statistics() == approx_statistics(columns.statistics())
+        for status in ProductStatus:
+            positions = snapshot.indexes.select({"status": status})
+            assert aggregates.get({"status": status}).statistics() == approx_statistics(
+                columns.statistics(positions))
+        assert aggregates.get({"brand_name": "Acme"}) is None
+
+    def test_add_and_remove_products(self, random_product_lst):
+        distinct = CatalogSnapshot(random_product_lst).distinct
+        half = len(distinct.products) // 2
+        aggregates = CatalogSnapshot(distinct.products[:half]).aggregates.copy()
+        for product, count in zip(distinct.products[half:], distinct.counts[half:]):
+            aggregates.add(product, count)
+        for product in distinct.products[:half]:
+            aggregates.remove(product)
+        for product, count in zip(distinct.products[:half], distinct.counts[:half]):
+            aggregates.add(product, count)
+
+        expected = CatalogSnapshot(random_product_lst).aggregates
+        for received, aggregate in [(aggregates.raw, expected.raw), (aggregates.distinct, expected.distinct)] + [
+                (aggregates.status[status], expected.status[status]) for status in ProductStatus]:
+            assert received.ids == aggregate.ids and received.brands == aggregate.brands
+            assert received.statistics() == approx_statistics(aggregate.statistics())
+
+    def test_counters_are_created_on_first_change(self, random_product_lst):
+        aggregates = CatalogSnapshot(random_product_lst).aggregates
+        statistics = aggregates.raw.statistics()
+        assert aggregates.raw._arrays is not None
+        copy = aggregates.copy()
+        product = Product(10 ** 6, 1.0, "New brand", "Anvil", ProductStatus.ACTIVE)
+        copy.add(product)
+        assert copy.raw._arrays is None and aggregates.raw._arrays is not None
+        assert copy.raw.statistics()["nproducts"] == statistics["nproducts"] + 1
+        assert copy.raw.statistics()["nbrands"] == statistics["nbrands"] + 1
+        copy.remove(product)
+        assert copy.raw.ids == aggregates.raw.ids and copy.raw.brands == aggregates.raw.brands
+        assert copy.raw.statistics() == approx_statistics(statistics)
+
+    def test_statistics_without_products(self):
+        aggregate = StatisticsAggregate()
+        product = Product(1, 9.99, "Acme", "Anvil", ProductStatus.ACTIVE)
+        aggregate.add(product, 2)
+        aggregate.remove(product, 2)
+        assert aggregate.statistics() == {"nproducts": 0, "nbrands": 0, "avg_price": None}
+        assert aggregate.price_cents == 0
+        empty = CatalogAggregates.from_columns(CatalogSnapshot([]).columns)
+        assert empty.raw.statistics() == {"nproducts": 0, "nbrands": 0, "avg_price": None}
+
+    def test_get_statistics_of_empty_filter_result(self, rest_data_source_obj, raw_product_data, requests_mock,
+                                                   mocker):
+        requests_mock.get(rest_data_source_obj.base_url, status_code=200, json={'products': raw_product_data})
+        stats = rest_data_source_obj.get_statistics({'status': ProductStatus.HIDDEN})
+        assert stats["filtered"] == {"nproducts": 0, "nbrands": 0, "avg_price": None}
+        assert stats["unfiltered"]["nproducts"] == 7
+
+        # status filters are answered from the aggregates, without filtering
+        filter_ = mocker.spy(rest_data_source_obj, 'filter')
+        stats = rest_data_source_obj.get_statistics({'status': ProductStatus.ACTIVE})
+        assert stats["filtered"] == {"nproducts": 6, "nbrands": 3, "avg_price": pytest.approx((123.45 * 4 + 20) / 6)}
+        assert filter_.call_count == 0
@@ -0,0 +1,121 @@
+import pytest
+
+import app
+
+
+@pytest.mark.usefixtures("flask_client")
+class TestApp:
+    def test_products_table_is_streamed(self, flask_client):
+        response = flask_client.get('/products?status=active&sort_by=%2bprice')
+        assert response.status_code == 200
+        assert response.is_streamed
+        html = response.get_data(as_text=True)
+        assert html.count('<tr>') == 1 + 6
+        assert html.index('<td>2001</td>') < html.index('<td>1001</td>')
+
+    def test_index_streams_table_in_chunks_before_statistics(self, flask_client, monkeypatch):
+        monkeypatch.setattr(app, 'STREAM_CHUNK_SIZE', 100)
+        response = flask_client.get('/?status=active', buffered=False)
+        chunks = list(response.response)
+        assert len(chunks) > 3
+        html = b''.join(chunks).decode()
+        assert html.index('</table>') < html.index('<dl>')
+        assert 'Total no of Unique Products: 6' in html
+
+    def test_index_with_page_shows_statistics_of_all_filtered_products(self, flask_client):
+        html = flask_client.get('/?status=active&limit=2').get_data(as_text=True)
+        assert html.count('<tr>') == 1 + 2
+        assert 'Products 1 - 2 of 6' in html
+        assert 'Total no of Unique Products: 6' in html
+
+    @pytest.mark.parametrize("path", ['/products?limit=-1', '/products.json?cursor=garbage', '/?offset=-3',
+                                      '/products.json?cursor=b2Zmc2V0Oi0x', '/export?limit=-5'])
+    def test_invalid_page_args(self, flask_client, path):
+        response = flask_client.get(path)
+        assert response.status_code == 400
+        assert response.mimetype == 'text/plain'
+
+    def test_statistics(self, flask_client):
+        html = flask_client.get('/statistics?status=deleted').get_data(as_text=True)
+        assert 'Total no of Unique Products: 1' in html
+
+    def test_products_json(self, flask_client):
+        response = flask_client.get('/products.json?status=active&sort_by=-price,%2bproduct_id&limit=2')
+        assert response.mimetype == 'application/json'
+        data = response.get_json()
+        assert [product['product_id'] for product in data['products']] == [1000, 1001]
+        assert data['products'][0] == {'product_id': 1000, 'price': 123.45, 'brand_name': 'Wonderful Widgets',
+                                       'product_name': 'Widget 3000', 'status': 'ACTIVE'}
+        assert data['total'] == 6 and data['next_cursor'] is not None
+
+    def test_products_json_with_limit_0_has_no_next_cursor(self, flask_client):
+        data = flask_client.get('/products.json?sort_by=%2bbrand_name&limit=0').get_json()
+        assert data['products'] == [] and data['next_cursor'] is None
+
+    def test_products_json_is_serialized_once_per_snapshot(self, flask_client, monkeypatch):
+        calls = []
+        monkeypatch.setattr(app, 'dumps', lambda obj: calls.append(obj) or b'{}')
+        for _ in range(3):
+            flask_client.get('/products.json')
+            flask_client.get('/products.json?status=deleted')
+            flask_client.get('/statistics.json?status=deleted')
+        assert len(calls) == 3
+        app.datasource.invalidate()
+        flask_client.get('/products.json')
+        assert len(calls) == 4
+
+    def test_json_not_modified(self, flask_client, mocker, requests_mock, raw_product_data):
+        response = flask_client.get('/statistics.json?status=deleted')
+        etag = response.headers['ETag']
+        assert not etag.startswith('W/')
+        assert response.get_json()['filtered']['nproducts'] == 1
+
+        get_products = mocker.spy(app.datasource, 'get_products')
+        get_statistics = mocker.spy(app.datasource, 'get_statistics')
+        for url in ('/statistics.json?status=deleted', '/products.json?sort_by=%2bprice'):
+            response = flask_client.get(url, headers={'If-None-Match': etag})
+            assert response.status_code == 304
+            assert response.data == b''
+            assert response.headers['ETag'] == etag
+        assert get_products.call_count == get_statistics.call_count == 0
+
+        # an equal catalog, e.g. fetched by another worker or after a restart, has the same ETag
+        app.datasource.invalidate()
+        response = flask_client.get('/products.json?sort_by=%2bprice', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        requests_mock.get(app.BEAUTYLISH_REST_API_URL, status_code=200, json={'products': raw_product_data[1:]})
+        app.datasource.invalidate()
+        response = flask_client.get('/products.json?sort_by=%2bprice', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_statistics_of_empty_filter_result(self, flask_client):
+        html = flask_client.get('/statistics?status=hidden').get_data(as_text=True)
+        assert 'Total no of Unique Products: 0' in html
+        assert 'Average Price of the Products: -' in html
+        assert flask_client.get('/statistics.json?status=hidden').get_json()['filtered']['avg_price'] is None
+
+    def test_health(self, flask_client):
+        assert flask_client.get('/health').get_json()['status'] == 'loading'
+        flask_client.get('/products')
+        health = flask_client.get('/health').get_json()
+        assert health['status'] == 'ok' and health['products'] == 9
+        assert 0 <= health['catalog_age'] < 60
+
+
+class TestMain:
+    @pytest.mark.parametrize("debug, run_main, started", [
+        (True, None, False), (True, "true", True), (False, None, True)])
+    def test_background_work_runs_in_the_server_process(self, mocker, monkeypatch, debug, run_main, started):
+        monkeypatch.setattr(app, 'DEBUG', debug)
+        if run_main is None:
+            monkeypatch.delenv('WERKZEUG_RUN_MAIN', raising=False)
+        else:
+            monkeypatch.setenv('WERKZEUG_RUN_MAIN', run_main)
+        run = mocker.patch.object(app.app, 'run')
+        load = mocker.patch.object(app.datasource, 'load_persisted_snapshot')
+        start_refresher = mocker.patch.object(app.datasource, 'start_refresher')
+        app.main()
+        assert load.called is started and start_refresher.called is started
+        run.assert_called_once_with(host="0.0.0.0", port=app.PORT, debug=debug)
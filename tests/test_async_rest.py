@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import pytest
+
+from datasource.async_rest import AsyncRestDataSource
+from datasource.rest import RestDataSource, InvalidResponseError
+from models.product import ProductStatus
+
+
+def shard_urls(server, nshards):
+    return [server.url + "shard/{}".format(shard) for shard in range(nshards)]
+
+
+def set_shards(server, raw_product_data, nshards, delay=0.0):
+    """
+    spreads raw_product_data over nshards routes, the first item of every shard is also in the next shard
+    """
+    size = len(raw_product_data) // nshards + 1
+    for shard in range(nshards):
+        server.add_route("/shard/{}".format(shard), {"products": raw_product_data[shard * size:(shard + 1) * size + 1]},
+                         delay=delay)
+
+
+@pytest.mark.usefixtures("upstream_server")
+class TestAsyncRestDataSource:
+    def test_shards_are_merged_and_deduplicated(self, upstream_server, raw_product_data):
+        set_shards(upstream_server, raw_product_data, 3)
+        data_source = AsyncRestDataSource(shard_urls(upstream_server, 3))
+        expected = RestDataSource(upstream_server.url)
+        try:
+            assert data_source.get_processed_product_data() == expected.get_processed_product_data()
+            stats = data_source.get_statistics({'status': ProductStatus.ACTIVE})
+            assert stats["filtered"] == expected.get_statistics({'status': ProductStatus.ACTIVE})["filtered"]
+            assert upstream_server.requests == 3 + 1
+        finally:
+            data_source.close()
+
+    def test_cold_load_takes_as_long_as_the_slowest_shard(self, upstream_server, raw_product_data):
+        set_shards(upstream_server, raw_product_data, 4, delay=0.3)
+        data_source = AsyncRestDataSource(shard_urls(upstream_server, 4), max_concurrency=4)
+        try:
+            start = time.monotonic()
+            page, _ = asyncio.run(data_source.get_products_async(
+                {'status': ProductStatus.ACTIVE}, OrderedDict({'price': True}), limit=2))
+            elapsed = time.monotonic() - start
+            assert [product.price for product in page] == [10.0, 10.0]
+            # sequential fetches would take 4 * 0.3s
+            assert 0.3 <= elapsed < 0.9
+            # at most max_concurrency connections for all shards
+            assert upstream_server.connections <= 4
+        finally:
+            data_source.close()
+
+    def test_concurrency_is_bounded(self, upstream_server, raw_product_data):
+        set_shards(upstream_server, raw_product_data, 4, delay=0.2)
+        data_source = AsyncRestDataSource(shard_urls(upstream_server, 4), max_concurrency=2)
+        try:
+            start = time.monotonic()
+            asyncio.run(data_source.get_snapshot_async())
+            assert time.monotonic() - start >= 0.4
+        finally:
+            data_source.close()
+
+    def test_unchanged_shards_keep_their_products(self, upstream_server, raw_product_data):
+        set_shards(upstream_server, raw_product_data, 3)
+        data_source = AsyncRestDataSource(shard_urls(upstream_server, 3), cache_ttl=0, stale_ttl=0)
+        try:
+            first = data_source.get_snapshot()
+            assert data_source.get_snapshot() is first
+            assert upstream_server.not_modified == 3
+
+            upstream_server.add_route("/shard/2", {"products": raw_product_data[:1]})
+            second = data_source.get_snapshot()
+            assert upstream_server.not_modified == 5
+            assert second is not first
+            assert all(new is old for new, old in zip(second.raw_products[:10], first.raw_products[:10]))
+            assert second.raw_products[10] is first.raw_products[0]
+            assert [product.product_id for product in second.products] == [1001, 2003, 2000, 1000, 2004, 2001, 2002]
+        finally:
+            data_source.close()
+
+    def test_async_methods_query_the_awaited_snapshot(self, upstream_server, raw_product_data):
+        set_shards(upstream_server, raw_product_data, 2)
+        # the cached catalog expires at once, the queries must not load it again inside the event loop
+        data_source = AsyncRestDataSource(shard_urls(upstream_server, 2), cache_ttl=0, stale_ttl=0)
+        expected = RestDataSource(upstream_server.url)
+
+        async def query():
+            page, _ = await data_source.get_products_async({'status': ProductStatus.ACTIVE},
+                                                           OrderedDict({'price': False}), limit=3)
+            return page, await data_source.get_statistics_async({'status': ProductStatus.ACTIVE})
+
+        try:
+            page, stats = asyncio.run(query())
+            assert page == expected.get_products({'status': ProductStatus.ACTIVE}, OrderedDict({'price': False}),
+                                                 limit=3)[0]
+            assert stats["filtered"] == expected.get_statistics({'status': ProductStatus.ACTIVE})["filtered"]
+        finally:
+            data_source.close()
+
+    def test_failed_shard_fails_the_load(self, upstream_server, raw_product_data):
+        set_shards(upstream_server, raw_product_data, 2)
+        data_source = AsyncRestDataSource(shard_urls(upstream_server, 3), retries=0)
+        try:
+            with pytest.raises(InvalidResponseError):
+                asyncio.run(data_source.get_statistics_async({}))
+        finally:
+            data_source.close()
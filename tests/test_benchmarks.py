@@ -0,0 +1,91 @@
+import collections
+import copy
+import json
+
+from benchmarks.catalog import generate_catalog, iter_catalog, write_catalog
+from benchmarks.run import run, compare, main, environment_mismatch, BASELINE_PATH, ENVIRONMENT
+from datasource.normalize import ProductNormalizer
+
+
+class TestCatalogGenerator:
+    def test_seeded(self):
+        assert generate_catalog(500, seed=1) == generate_catalog(500, seed=1)
+        assert generate_catalog(500, seed=1) != generate_catalog(500, seed=2)
+
+    def test_distributions(self):
+        items = generate_catalog(20000, duplicate_rate=0.2)
+        assert len(items) == 20000
+        assert abs(len({item["id"] for item in items}) / len(items) - 0.8) < 0.02
+        brands = collections.Counter(item["brand_name"] for item in items).most_common()
+        assert brands[0][1] > 10 * brands[-1][1]
+        products = list(map(ProductNormalizer().product, items))
+        statuses = collections.Counter(product.status.name for product in products)
+        assert statuses["ACTIVE"] > statuses["HIDDEN"] > statuses["DELETED"] > 0
+        prices = sorted(product.price for product in products)
+        assert 1 <= prices[0] and 15 < prices[len(prices) // 2] < 40 and prices[-1] > 500
+
+    def test_duplicates_are_equal_rows(self):
+        rows = collections.defaultdict(list)
+        for item in iter_catalog(5000):
+            rows[item["id"]].append(item)
+        assert all(row == same[0] for same in rows.values() for row in same)
+
+    def test_write_catalog(self, tmp_path):
+        path = tmp_path / "catalog.json"
+        write_catalog(str(path), 300, seed=4)
+        assert json.loads(path.read_text())["products"] == generate_catalog(300, seed=4)
+
+
+class TestBenchmarkRunner:
+    def test_run(self):
+        results = run(sizes=[200], repeat=1, min_time=0)
+        names = {result["benchmark"] for result in results["results"].values()}
+        assert {"get_raw_product_data", "get_processed_product_data", "filter", "sort", "get_statistics",
+                "parse_sort_by_arg", "compile_filter", "filter.expression", "search", "export.csv", "app./",
+                "app./products", "app./statistics", "app./export"} <= names
+        assert all(result["min"] > 0 for result in results["results"].values())
+        assert results["meta"]["sizes"] == [200]
+
+    def test_compare(self):
+        baseline = {"results": {
+            "sort[1000]": {"min": 0.010}, "filter[1000]": {"min": 0.010}, "noise[1000]": {"min": 1e-7}}}
+        results = copy.deepcopy(baseline)
+        results["results"]["sort[1000]"]["min"] = 0.020
+        results["results"]["filter[1000]"]["min"] = 0.012
+        results["results"]["noise[1000]"]["min"] = 1e-6
+        results["results"]["new[1000]"] = {"min": 1.0, "size": 1000}
+        assert compare(results, baseline, tolerance=0.5) == [("sort[1000]", 0.010, 0.020), ("new[1000]", None, 1.0)]
+        # sizes the baseline was not run with are not compared
+        baseline["meta"] = {"sizes": [1000]}
+        results["results"]["new[10000]"] = {"min": 1.0, "size": 10000}
+        assert compare(results, baseline, tolerance=0.5)[1:] == [("new[1000]", None, 1.0)]
+
+    def test_main_fails_on_regression(self, tmp_path, mocker):
+        results = {"meta": {}, "results": {"sort[1000]": {"min": 0.020, "median": 0.020}}}
+        mocker.patch("benchmarks.run.run", return_value=results)
+        baseline = str(tmp_path / "baseline.json")
+        output = str(tmp_path / "results.json")
+        assert main(["--baseline", baseline, "--save-baseline"]) == 0
+        assert main(["--baseline", baseline, "--output", output]) == 0
+        results["results"]["sort[1000]"]["min"] = 0.040
+        assert main(["--baseline", baseline, "--output", output]) == 1
+        # a benchmark without baseline fails as well
+        results["results"]["sort[1000]"]["min"] = 0.020
+        results["results"]["new[1000]"] = {"min": 0.020, "median": 0.020, "size": 1000}
+        assert main(["--baseline", baseline, "--output", output]) == 1
+
+    def test_baseline_of_other_environment_is_not_compared(self, tmp_path, mocker):
+        results = {"meta": {"python": "3.11.7", "numpy": "1.22.4"}, "results": {"sort[1000]": {"min": 0.020}}}
+        baseline = {"meta": {"python": "3.11.7", "numpy": "2.4.6"}, "results": {"sort[1000]": {"min": 0.010}}}
+        assert environment_mismatch(results, baseline) == [("numpy", "2.4.6", "1.22.4")]
+        assert environment_mismatch(results, {"results": {}}) == [("python", None, "3.11.7"), ("numpy", None, "1.22.4")]
+        path = tmp_path / "baseline.json"
+        path.write_text(json.dumps(baseline))
+        compare_ = mocker.patch("benchmarks.run.compare")
+        mocker.patch("benchmarks.run.run", return_value=results)
+        assert main(["--baseline", str(path)]) == 2
+        assert compare_.call_count == 0
+        # the checked in baseline records its environment
+        with open(BASELINE_PATH) as file:
+            meta = json.load(file)["meta"]
+        assert all(meta.get(name) for name in ENVIRONMENT)
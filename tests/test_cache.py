@@ -0,0 +1,266 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from datasource.base import Range
+from datasource.cache import CatalogCache, CatalogRefresher, QueryCache
+from datasource.rest import RestDataSource
+from datasource.snapshot import CatalogSnapshot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope='function')
+def fake_clock():
+    return FakeClock()
+
+
+@pytest.fixture(scope='function')
+def counting_loader(get_product_lst):
+    """
+    loader that builds a new snapshot on every call and remembers how often it was called
+    """
+    def loader(previous):
+        loader.calls += 1
+        return CatalogSnapshot(list(get_product_lst))
+
+    loader.calls = 0
+    return loader
+
+
+class TestCatalogCache:
+    def test_get_serves_cached_snapshot_while_fresh(self, counting_loader, fake_clock):
+        cache = CatalogCache(counting_loader, ttl=10, stale_ttl=10, clock=fake_clock)
+        first = cache.get()
+        fake_clock.now = 9
+        assert cache.get() is first
+        assert counting_loader.calls == 1
+
+    def test_get_serves_stale_snapshot_and_refreshes_in_background(self, get_product_lst, fake_clock):
+        loaded = threading.Event()
+
+        def loader(previous):
+            snapshot = CatalogSnapshot(list(get_product_lst))
+            if previous is not None:
+                loaded.set()
+            return snapshot
+
+        cache = CatalogCache(loader, ttl=10, stale_ttl=10, clock=fake_clock)
+        first = cache.get()
+        fake_clock.now = 15
+        # stale snapshot is returned immediately
+        assert cache.get() is first
+        assert loaded.wait(5)
+        # wait for the background thread to store the new snapshot
+        for _ in range(100):
+            if cache.peek() is not first:
+                break
+            threading.Event().wait(0.01)
+        assert cache.peek() is not first
+        assert cache.peek().version > first.version
+
+    def test_get_loads_synchronously_when_expired(self, counting_loader, fake_clock):
+        cache = CatalogCache(counting_loader, ttl=10, stale_ttl=10, clock=fake_clock)
+        first = cache.get()
+        fake_clock.now = 25
+        second = cache.get()
+        assert second is not first
+        assert counting_loader.calls == 2
+
+    def test_invalidate_forces_a_new_load(self, counting_loader, fake_clock):
+        cache = CatalogCache(counting_loader, ttl=10, stale_ttl=10, clock=fake_clock)
+        first = cache.get()
+        cache.invalidate()
+        assert cache.peek() is None
+        second = cache.get()
+        assert counting_loader.calls == 2
+        assert second.version > first.version
+
+    def test_failed_background_refresh_keeps_stale_snapshot(self, get_product_lst, fake_clock):
+        failed = threading.Event()
+
+        def loader(previous):
+            if previous is not None:
+                failed.set()
+                raise RuntimeError("upstream down")
+            return CatalogSnapshot(list(get_product_lst))
+
+        cache = CatalogCache(loader, ttl=10, stale_ttl=10, clock=fake_clock)
+        first = cache.get()
+        fake_clock.now = 15
+        assert cache.get() is first
+        assert failed.wait(5)
+        assert cache.peek() is first
+
+
+class TestCatalogSnapshot:
+    def test_products_removes_duplicates_and_keeps_order(self, get_product_lst):
+        snapshot = CatalogSnapshot(get_product_lst)
+        assert snapshot.products == list(dict.fromkeys(get_product_lst))
+        assert set(snapshot.products) == set(get_product_lst)
+        # derived values are built once per snapshot
+        assert snapshot.products is snapshot.products
+
+
+class TestQueryCache:
+    def test_equivalent_queries_share_an_entry(self):
+        first = QueryCache.key({'status': 1, 'price': Range(10, None)}, OrderedDict([('price', True)]), 0, None)
+        second = QueryCache.key({'price': Range(10.0, None), 'status': 1}, OrderedDict([('price', True)]), 0, None)
+        assert first == second and hash(first) == hash(second)
+        other = QueryCache.key({'status': 1}, OrderedDict([('price', True), ('brand_name', True)]), 0, None)
+        assert other != QueryCache.key({'status': 1}, OrderedDict([('brand_name', True), ('price', True)]), 0, None)
+
+    def test_hits_misses_and_evictions(self):
+        cache = QueryCache(maxsize=2)
+        assert cache.get(1, 'a', lambda: 'A') == 'A'
+        assert cache.get(1, 'b', lambda: 'B') == 'B'
+        assert cache.get(1, 'a', lambda: 'X') == 'A'
+        # b is the least recently used entry
+        assert cache.get(1, 'c', lambda: 'C') == 'C'
+        assert cache.get(1, 'b', lambda: 'B2') == 'B2'
+        assert cache.stats() == {'hits': 1, 'misses': 4, 'evictions': 2, 'size': 2, 'maxsize': 2}
+
+    def test_new_version_drops_entries(self):
+        cache = QueryCache()
+        cache.get(1, 'a', lambda: 'A')
+        assert cache.get(2, 'a', lambda: 'A2') == 'A2'
+        # a slow request of the old version neither sees nor replaces the new entries
+        assert cache.get(1, 'a', lambda: 'A') == 'A'
+        assert cache.get(2, 'a', lambda: 'X') == 'A2'
+        assert cache.stats()['hits'] == 1
+
+    def test_unhashable_keys_are_not_cached(self):
+        cache = QueryCache()
+        assert cache.get(1, ('a', ['b']), lambda: 'A') == 'A'
+        assert cache.stats()['size'] == 0
+
+
+class TestCatalogRefresher:
+    def test_start_warms_the_cache_and_refreshes_in_background(self, counting_loader):
+        cache = CatalogCache(counting_loader, ttl=60, stale_ttl=60)
+        refresher = CatalogRefresher(cache, interval=0.01).start()
+        try:
+            assert counting_loader.calls >= 1 and cache.peek() is not None
+            first = cache.peek()
+            deadline = time.monotonic() + 5
+            while counting_loader.calls < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert counting_loader.calls >= 3
+            assert cache.peek().version > first.version
+        finally:
+            refresher.stop()
+        assert not refresher.running
+
+    def test_intervals_are_jittered(self, counting_loader):
+        refresher = CatalogRefresher(CatalogCache(counting_loader), interval=10, jitter=0.2, rng=random.Random(1))
+        intervals = [refresher.next_interval() for _ in range(100)]
+        assert all(8 <= interval <= 12 for interval in intervals)
+        assert len(set(intervals)) == 100
+
+    def test_failed_refresh_keeps_the_snapshot(self, get_product_lst):
+        def loader(previous):
+            loader.calls += 1
+            if previous is not None:
+                raise RuntimeError("upstream down")
+            return CatalogSnapshot(list(get_product_lst))
+        loader.calls = 0
+
+        cache = CatalogCache(loader)
+        refresher = CatalogRefresher(cache, interval=0.01).start()
+        first = cache.peek()
+        deadline = time.monotonic() + 5
+        while loader.calls < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        refresher.stop()
+        assert loader.calls >= 3
+        assert cache.peek() is first
+
+    def test_requests_read_the_cached_snapshot_while_refresher_runs(self, rest_data_source_obj, get_product_lst,
+                                                                     fake_clock, mocker):
+        snapshot = CatalogSnapshot(list(get_product_lst))
+        load = mocker.patch.object(rest_data_source_obj, '_load_snapshot', return_value=snapshot)
+        rest_data_source_obj.cache = CatalogCache(rest_data_source_obj._load_snapshot, ttl=10, stale_ttl=10,
+                                                  clock=fake_clock)
+        rest_data_source_obj.start_refresher(interval=3600)
+        try:
+            assert load.call_count == 1
+            # long expired, but the refresher takes care of it
+            fake_clock.now = 1000
+            assert rest_data_source_obj.get_snapshot() is snapshot
+            assert rest_data_source_obj.get_snapshot_age() == 1000
+            assert load.call_count == 1
+        finally:
+            rest_data_source_obj.stop_refresher()
+        rest_data_source_obj.get_snapshot()
+        assert load.call_count == 2
+
+
+class TestSingleFlight:
+    def test_burst_of_requests_on_cold_cache_fetches_once(self, upstream_server, raw_product_data):
+        # the slow upstream keeps the first fetch in flight while all other requests arrive
+        upstream_server.delay = 0.2
+        upstream_server.set_products(raw_product_data)
+        data_source = RestDataSource(upstream_server.url)
+        barrier = threading.Barrier(100)
+        snapshots = []
+
+        def request():
+            barrier.wait()
+            snapshots.append(data_source.get_processed_product_data().snapshot)
+
+        threads = [threading.Thread(target=request) for _ in range(100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert len(snapshots) == 100
+        assert all(snapshot is snapshots[0] for snapshot in snapshots)
+        assert upstream_server.requests == 1
+
+    def test_waiting_callers_share_the_error(self, get_product_lst):
+        started, release = threading.Event(), threading.Event()
+
+        def loader(previous):
+            loader.calls += 1
+            started.set()
+            release.wait(5)
+            raise RuntimeError("upstream down")
+        loader.calls = 0
+
+        cache = CatalogCache(loader)
+        errors = []
+
+        def get():
+            try:
+                cache.get()
+            except RuntimeError as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=get) for _ in range(10)]
+        threads[0].start()
+        assert started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # give the followers time to find the load in flight
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert loader.calls == 1
+        assert len(errors) == 10 and all(error is errors[0] for error in errors)
+
+        # the next caller after the failure loads again
+        loader.calls, release = 0, threading.Event()
+        release.set()
+        with pytest.raises(RuntimeError):
+            cache.get()
+        assert loader.calls == 1
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from datasource.snapshot import CatalogSnapshot, ProductView
+from models.product import Product, ProductStatus
+from rendering import dumps, products_to_dict
+
+
+def product_ids(products):
+    return [(product.product_id, product.price, product.product_name) for product in products]
+
+
+@pytest.mark.usefixtures("rest_data_source_obj", "random_product_lst")
+class TestColumnarCatalog:
+    @pytest.mark.parametrize("filter_by", [
+        {}, {'status': ProductStatus.ACTIVE}, {'status': ProductStatus.HIDDEN}, {'brand_name': 'Acme'},
+        {'brand_name': 'Missing'}, {'status': 'ACTIVE'}, {'price': 10.0, 'status': ProductStatus.DELETED},
+        {'product_id': 7}, {'unknown': 1},
+    ])
+    def test_filter_on_view_matches_list_filter(self, rest_data_source_obj, random_product_lst, filter_by):
+        view = CatalogSnapshot(random_product_lst).products
+        expected = rest_data_source_obj.filter(list(view), filter_by)
+        received = rest_data_source_obj.filter(view, filter_by)
+        assert isinstance(received, ProductView)
+        assert product_ids(received) == product_ids(expected)
+
+    @pytest.mark.parametrize("sort_by", [
+        OrderedDict({'price': True}), OrderedDict({'price': False, 'product_name': True}),
+        OrderedDict({'brand_name': False, 'product_name': False, 'product_id': True}),
+        OrderedDict({'product_name': True, 'price': False}), OrderedDict(),
+    ])
+    def test_sort_on_view_matches_list_sort(self, rest_data_source_obj, random_product_lst, sort_by):
+        view = CatalogSnapshot(random_product_lst).products
+        filtered = rest_data_source_obj.filter(view, {'status': ProductStatus.ACTIVE})
+        expected = rest_data_source_obj.sort(list(filtered), sort_by)
+        received = rest_data_source_obj.sort(filtered, sort_by)
+        assert isinstance(received, ProductView)
+        assert product_ids(received) == product_ids(expected)
+
+    def test_statistics_on_columns_match_list_statistics(self, rest_data_source_obj, random_product_lst):
+        snapshot = CatalogSnapshot(random_product_lst)
+        columns = snapshot.columns
+        filtered = rest_data_source_obj.filter(snapshot.products, {'status': ProductStatus.ACTIVE})
+        expected = rest_data_source_obj._compute_statistics(list(filtered))
+        received = columns.statistics(filtered.positions)
+        assert received == pytest.approx(expected)
+        # weighted statistics of the distinct products are the statistics of the raw products
+        expected = rest_data_source_obj._compute_statistics(list(random_product_lst))
+        assert columns.statistics(weighted=True) == pytest.approx(expected)
+
+    def test_get_products_and_statistics_use_cached_catalog(self, rest_data_source_obj, raw_product_data, mocker):
+        mocker.patch('datasource.rest.RestDataSource.get_data_from_api', return_value=raw_product_data)
+        products, org_products = rest_data_source_obj.get_products({'status': ProductStatus.ACTIVE},
+                                                                   OrderedDict({'price': False}))
+        assert isinstance(products, ProductView) and org_products is products.snapshot.products
+        assert [product.price for product in products] == sorted([product.price for product in products],
+                                                                 reverse=True)
+        stats = rest_data_source_obj.get_statistics({'status': ProductStatus.ACTIVE})
+        assert stats["unfiltered"]["nproducts"] == 7
+        assert stats["unfiltered"]["avg_price"] == pytest.approx((123.45 * 6 + 10 * 3) / 9)
+        assert stats["filtered"] == {"nproducts": 6, "nbrands": 3, "avg_price": pytest.approx((123.45 * 4 + 20) / 6)}
+
+    def test_digest_depends_on_content_only(self, random_product_lst):
+        snapshot = CatalogSnapshot(random_product_lst)
+        assert snapshot.digest == CatalogSnapshot(list(random_product_lst)).digest
+        changed = list(random_product_lst)
+        product = changed[0]
+        changed[0] = Product(product.product_id, product.price + 1, product.brand_name, product.product_name,
+                             product.status)
+        assert CatalogSnapshot(changed).digest != snapshot.digest
+        assert CatalogSnapshot(random_product_lst[::-1]).digest != snapshot.digest
+        assert CatalogSnapshot(random_product_lst + random_product_lst[:1]).digest != snapshot.digest
+
+    def test_null_names(self, rest_data_source_obj):
+        products = [Product(1, 5.0, None, "Anvil", ProductStatus.ACTIVE),
+                    Product(2, 7.0, "Acme", None, ProductStatus.ACTIVE),
+                    Product(3, 9.0, "Acme", "Anvil", ProductStatus.HIDDEN)]
+        snapshot = CatalogSnapshot(products)
+        columns = snapshot.columns
+        assert columns.brand_names == [None, "Acme"] and columns.product_names == [None, "Anvil"]
+        assert [product.product_id for product in rest_data_source_obj.filter(
+            snapshot.products, {'brand_name': None})] == [1]
+        assert [product.product_id for product in rest_data_source_obj.filter(
+            snapshot.products, {'brand_name': 'Acme'})] == [2, 3]
+        assert columns.statistics()["nbrands"] == 2
+        # missing names sort first
+        assert [product.product_id for product in rest_data_source_obj.sort(
+            snapshot.products, OrderedDict({'brand_name': True, 'product_id': True}))] == [1, 2, 3]
+        added = [Product(4, 1.0, None, None, ProductStatus.ACTIVE),
+                 Product(5, 1.0, "Zed", "Bolt", ProductStatus.ACTIVE)]
+        changed = columns.apply(np.array([False, True, True]), added, [1, 1, 1, 1])
+        assert changed.brand_names == [None, "Acme", "Zed"] and changed.product_names == [None, "Anvil", "Bolt"]
+        assert changed.build_products() == products[1:] + added
+
+    def test_unread_view_is_not_serialized_as_empty_list(self, rest_data_source_obj, random_product_lst):
+        snapshot = CatalogSnapshot(random_product_lst)
+        view = rest_data_source_obj.sort(snapshot.products, OrderedDict({'price': True}))
+        page = ProductView(snapshot, view.positions[:10], total=len(view))
+        assert page._products is None and not isinstance(page, list)
+        # serializers which read python lists directly must not see an empty list
+        with pytest.raises(TypeError):
+            dumps(page)
+        data = products_to_dict(ProductView(snapshot, view.positions[:10], total=len(view)))
+        assert [product["product_id"] for product in data["products"]] == [product.product_id for product in view[:10]]
+        assert data["total"] == len(view) and data["offset"] == 0
+
+
+def sort_once_per_key(products, sort_by):
+    # reference implementation: one stable sort per key, starting with the last key
+    final_products = list(products)
+    for key, asc in reversed(list(sort_by.items())):
+        final_products = sorted(final_products, key=lambda x: x[key], reverse=not asc)
+    return final_products
+
+
+@pytest.mark.usefixtures("rest_data_source_obj", "random_product_lst")
+class TestCompositeSort:
+    @pytest.mark.parametrize("sort_by", [
+        OrderedDict({'brand_name': False, 'price': True}),
+        OrderedDict({'product_name': False, 'brand_name': True, 'product_id': False}),
+        OrderedDict({'price': False, 'product_name': False}),
+    ])
+    def test_list_sort_matches_sorting_once_per_key(self, rest_data_source_obj, random_product_lst, sort_by):
+        expected = sort_once_per_key(random_product_lst, sort_by)
+        received = rest_data_source_obj.sort(random_product_lst, sort_by)
+        assert product_ids(received) == product_ids(expected)
+
+    def test_list_sort_on_status_uses_enum_value(self, rest_data_source_obj, get_product_lst):
+        received = rest_data_source_obj.sort(get_product_lst, OrderedDict({'status': False}))
+        assert [product.status for product in received][0] == ProductStatus.DELETED
+
+    def test_ranks_are_cached_per_snapshot(self, random_product_lst):
+        columns = CatalogSnapshot(random_product_lst).columns
+        ranks, nranks = columns.rank('price')
+        assert columns.rank('price')[0] is ranks
+        assert nranks == 4 and ranks.min() == 0 and ranks.max() == 3
+
+    def test_sort_falls_back_to_lexsort_when_key_overflows(self, rest_data_source_obj, random_product_lst,
+                                                           mocker):
+        view = CatalogSnapshot(random_product_lst).products
+        sort_by = OrderedDict({'brand_name': False, 'product_name': True, 'price': False})
+        expected = rest_data_source_obj.sort(view, sort_by)
+        mocker.patch('datasource.columnar.MAX_COMPOSITE_KEY', 10)
+        assert view.snapshot.columns.sort_key(sort_by) is None
+        received = rest_data_source_obj.sort(view, sort_by)
+        assert product_ids(received) == product_ids(expected) == product_ids(sort_once_per_key(view, sort_by))
@@ -0,0 +1,128 @@
+import copy
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from datasource.aggregates import CatalogAggregates
+from datasource.columnar import ColumnarCatalog
+from datasource.delta import DeltaCatalogBuilder
+from datasource.normalize import ProductNormalizer
+from datasource.rest import RestDataSource
+from datasource.search import search_plan
+from models.product import ProductStatus
+
+
+def ingest(rest_data_source_obj, items, previous=None):
+    builder = DeltaCatalogBuilder(rest_data_source_obj._normalizer(previous).product, rest_data_source_obj._fingerprint,
+                                  previous)
+    for item in items:
+        builder.add_item(item)
+    return builder.build(), builder.delta
+
+
+def assert_columns_match_products(columns, products, counts):
+    expected = ColumnarCatalog(products, counts)
+    for name in ("product_id", "price", "status", "counts", "product_ids", "product_id_code"):
+        assert np.array_equal(getattr(columns, name), getattr(expected, name)), name
+    for name in ("brand_name", "product_name"):
+        categories = getattr(columns, name + "s")
+        assert categories == sorted(set(categories))
+        assert [categories[code] for code in getattr(columns, name)] == [product[name] for product in products]
+
+
+@pytest.fixture(scope='function')
+def changed_product_data(raw_product_data):
+    """
+    raw_product_data with a changed price, a hidden product, a removed product and a new product
+    """
+    items = copy.deepcopy(raw_product_data)
+    items[0]["price"] = "$99.00"
+    items[4]["price"] = "$99.00"
+    items[2]["hidden"] = True
+    del items[8]
+    items.append({"deleted": False, "price": "$5.00", "brand_name": "Zed", "id": 3000, "hidden": False,
+                  "product_name": "Zeppelin"})
+    return items
+
+
+class TestDeltaIngestion:
+    def test_unchanged_refresh_reuses_products(self, rest_data_source_obj, raw_product_data, mocker):
+        first, _ = ingest(rest_data_source_obj, raw_product_data)
+        first.columns, first.aggregates
+        build_product = mocker.spy(ProductNormalizer, 'product')
+        second, delta = ingest(rest_data_source_obj, copy.deepcopy(raw_product_data), first)
+        assert build_product.call_count == 0
+        assert len(delta) == 0
+        assert all(new is old for new, old in zip(second.raw_products, first.raw_products))
+        assert second.peek("columns") is not None and second.peek("aggregates") is not None
+        assert_columns_match_products(second.columns, second.distinct.products, second.distinct.counts)
+
+    def test_changes_are_applied(self, rest_data_source_obj, raw_product_data, changed_product_data, mocker):
+        first, _ = ingest(rest_data_source_obj, raw_product_data)
+        first.columns, first.aggregates
+        build_product = mocker.spy(ProductNormalizer, 'product')
+        second, delta = ingest(rest_data_source_obj, changed_product_data, first)
+        # the changed items and the new one, the duplicate of the changed product is built only once
+        assert build_product.call_count == 3
+        assert sorted(product.product_id for product in delta.added) == [1001, 2000, 3000]
+        assert sorted(product.product_id for product in delta.removed) == [1001, 2000, 2002]
+        assert delta.changed == {1001, 2000}
+
+        # kept products keep their positions, new products follow them
+        assert [product.product_id for product in second.products] == [2003, 1000, 2004, 2001, 1001, 2000, 3000]
+        assert second.distinct.counts == [1, 1, 2, 1, 2, 1, 1]
+        assert {product: position for position, product in enumerate(second.products)} == second.positions
+        assert_columns_match_products(second.columns, second.distinct.products, second.distinct.counts)
+
+        assert second.digest == ColumnarCatalog(second.distinct.products, second.distinct.counts).digest()
+        expected = CatalogAggregates.from_columns(ColumnarCatalog(second.distinct.products, second.distinct.counts))
+        for received, aggregate in [(second.aggregates.raw, expected.raw),
+                                    (second.aggregates.distinct, expected.distinct)] + [
+                (second.aggregates.status[status], expected.status[status]) for status in ProductStatus]:
+            assert received.ids == aggregate.ids and received.brands == aggregate.brands
+            assert received.statistics() == dict(aggregate.statistics(),
+                                                  avg_price=pytest.approx(aggregate.statistics()["avg_price"]))
+
+    def test_fingerprints_follow_closed_gaps(self, rest_data_source_obj, raw_product_data, changed_product_data,
+                                             mocker):
+        first, _ = ingest(rest_data_source_obj, raw_product_data)
+        second, _ = ingest(rest_data_source_obj, changed_product_data, first)
+        digests, positions = second.peek("fingerprints")
+        assert digests.dtype == np.int64 and len(digests) == len(positions)
+        assert sorted(positions.tolist()) == list(range(len(second.products)))
+        build_product = mocker.spy(ProductNormalizer, 'product')
+        third, delta = ingest(rest_data_source_obj, copy.deepcopy(changed_product_data), second)
+        assert build_product.call_count == 0 and len(delta) == 0
+        assert all(new is old for new, old in zip(third.raw_products, second.raw_products))
+
+    def test_broad_terms_are_carried_over(self, rest_data_source_obj, raw_product_data, changed_product_data):
+        first, _ = ingest(rest_data_source_obj, raw_product_data)
+        plans = [search_plan(query) for query in ("widget", "anvil", "acme anvil")]
+        for plan in plans:
+            first.indexes.select(plan)
+        items = changed_product_data + [{"deleted": False, "price": "$7.00", "brand_name": "Zed", "id": 3001,
+                                         "hidden": False, "product_name": "Widget Mini"}]
+        second, _ = ingest(rest_data_source_obj, items, first)
+        assert sorted(second.peek("broad_terms")) == ["acme", "anvil", "widget"]
+        for plan in plans:
+            expected = [position for position, product in enumerate(second.distinct.products)
+                        if plan.predicate(product)]
+            assert list(second.indexes.select(plan)) == expected
+        # answered from the carried over terms
+        assert second.indexes.peek_search() is None
+
+    def test_refresh_through_data_source(self, raw_product_data, changed_product_data, requests_mock):
+        # every call fetches the catalog again
+        data_source = RestDataSource('mock://test.com', cache_ttl=0, stale_ttl=0)
+        requests_mock.get('mock://test.com', status_code=200, json={'products': raw_product_data})
+        data_source.get_statistics({'status': ProductStatus.ACTIVE})
+        data_source.get_products({'status': ProductStatus.ACTIVE}, OrderedDict({'price': True}))
+        requests_mock.get('mock://test.com', status_code=200, json={'products': changed_product_data})
+
+        page, _ = data_source.get_products({'status': ProductStatus.HIDDEN}, OrderedDict({'price': True}))
+        assert [product.product_id for product in page] == [2000]
+        stats = data_source.get_statistics({'status': ProductStatus.ACTIVE})
+        assert stats["filtered"] == {"nproducts": 5, "nbrands": 4,
+                                     "avg_price": pytest.approx((99 + 123.45 * 2 + 10 + 5) / 5)}
+        assert stats["unfiltered"]["nproducts"] == 7
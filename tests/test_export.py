@@ -0,0 +1,146 @@
+import csv
+import gzip
+import io
+import json
+
+import numpy as np
+import pytest
+
+from datasource.base import ProductBatches
+from datasource.snapshot import CatalogSnapshot, ProductView
+from models.product import Product, ProductStatus
+from rendering import iter_csv, iter_ndjson, product_to_dict, EXPORT_COLUMNS
+from utils import iter_gzip
+
+
+class TestExportFormats:
+    products = [Product(1, 19.99, 'Acme "Co"', "Anvil, large\nor small", ProductStatus.HIDDEN),
+                Product(2, 5.0, "Zéd", "Widget", ProductStatus.ACTIVE)]
+
+    def test_csv(self):
+        chunks = list(iter_csv([self.products[:1], self.products[1:]]))
+        assert len(chunks) == 3
+        rows = list(csv.reader(io.StringIO("".join(chunks))))
+        assert rows == [list(EXPORT_COLUMNS), ["1", "19.99", 'Acme "Co"', "Anvil, large\nor small", "HIDDEN"],
+                        ["2", "5.0", "Zéd", "Widget", "ACTIVE"]]
+        assert list(iter_csv([])) == [",".join(EXPORT_COLUMNS) + "\n"]
+
+    def test_ndjson(self):
+        lines = "".join(iter_ndjson([self.products[:1], [], self.products[1:]])).splitlines()
+        assert [json.loads(line) for line in lines] == [product_to_dict(product) for product in self.products]
+
+    def test_views_formatted_like_lists(self):
+        snapshot = CatalogSnapshot(self.products + [Product(3, 0.1, "Acme", "Anvil\r", ProductStatus.DELETED)])
+        views = [ProductView(snapshot, np.array([2, 0])), ProductView(snapshot, np.array([1]))]
+        for write in (iter_csv, iter_ndjson):
+            assert list(write(views)) == list(write([list(view) for view in views]))
+        assert snapshot.peek("export_names:csv") is not None
+
+    def test_gzip(self):
+        chunks = [b"a" * 100000, b"", "é".encode() * 10]
+        assert gzip.decompress(b"".join(iter_gzip(chunks, level=1))) == b"".join(chunks)
+        assert gzip.decompress(b"".join(iter_gzip([]))) == b""
+
+
+@pytest.mark.usefixtures("rest_data_source_obj", "random_product_lst")
+class TestProductBatches:
+    @pytest.fixture
+    def data_source(self, rest_data_source_obj, random_product_lst, mocker):
+        mocker.patch.object(rest_data_source_obj, "get_raw_product_data", return_value=random_product_lst)
+        snapshot = CatalogSnapshot(random_product_lst)
+        mocker.patch.object(rest_data_source_obj, "get_processed_product_data", return_value=snapshot.products)
+        return rest_data_source_obj
+
+    @pytest.mark.parametrize("filter_by, sort_by, page_args", [
+        ({}, {}, {}),
+        ({"status": ProductStatus.ACTIVE}, {"price": False, "product_id": True}, {}),
+        ({"brand_name": "Acme"}, {"product_name": True}, {"offset": 7, "limit": 25}),
+        ({}, {"price": True}, {"offset": 1000}),
+    ])
+    def test_same_products_as_get_products(self, data_source, filter_by, sort_by, page_args):
+        page, _ = data_source.get_products(filter_by, sort_by, **page_args)
+        batches = data_source.get_product_batches(filter_by, sort_by, batch_size=10, **page_args)
+        assert (batches.count, batches.total, batches.offset, batches.next_cursor) == (
+            len(page), page.total, page.offset, page.next_cursor)
+        received = list(batches)
+        assert all(len(batch) == 10 for batch in received[:-1])
+        assert [product for batch in received for product in batch] == list(page)
+
+    def test_batches_of_a_list(self, rest_data_source_obj, random_product_lst, mocker):
+        mocker.patch.object(rest_data_source_obj, "get_processed_product_data",
+                            return_value=list(CatalogSnapshot(random_product_lst).products))
+        page, _ = rest_data_source_obj.get_products({}, {"price": True}, limit=30)
+        batches = rest_data_source_obj.get_product_batches({}, {"price": True}, limit=30, batch_size=8)
+        assert isinstance(batches, ProductBatches) and not hasattr(batches, "snapshot")
+        assert [len(batch) for batch in batches] == [8, 8, 8, 6]
+        assert batches.next_cursor == page.next_cursor
+
+    def test_resume_from_cursor(self, data_source):
+        sort_by = {"price": False, "product_id": True}
+        first = data_source.get_product_batches({}, sort_by, limit=40)
+        received = [product for batch in first for product in batch]
+        rest = data_source.get_product_batches({}, sort_by, cursor=first.next_cursor)
+        received += [product for batch in rest for product in batch]
+        assert received == list(data_source.get_products({}, sort_by)[0])
+        assert rest.next_cursor is None
+
+    def test_negative_offset(self, data_source):
+        with pytest.raises(ValueError):
+            data_source.get_product_batches({}, {}, offset=-1)
+
+
+@pytest.mark.usefixtures("flask_client")
+class TestAppExport:
+    def test_csv_export(self, flask_client):
+        response = flask_client.get('/export', query_string={'status': 'active', 'sort_by': '-price,+product_id'})
+        assert response.status_code == 200
+        assert response.mimetype == "text/csv"
+        assert response.headers["X-Total-Count"] == "6" and "Link" not in response.headers
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert [int(row["product_id"]) for row in rows] == [1000, 1001, 2000, 2004, 2001, 2002]
+        assert {row["status"] for row in rows} == {"ACTIVE"}
+
+    def test_ndjson_export_matches_products_json(self, flask_client):
+        args = {'filter': 'brand_name in (Acme, Hooli)', 'sort_by': '+product_id'}
+        response = flask_client.get('/export', query_string=dict(args, format='ndjson'))
+        assert response.mimetype == "application/x-ndjson"
+        products = json.loads(flask_client.get('/products.json', query_string=args).data)["products"]
+        assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == products
+
+    def test_gzip(self, flask_client):
+        plain = flask_client.get('/export', query_string={'format': 'ndjson'})
+        response = flask_client.get('/export', query_string={'format': 'ndjson'},
+                                    headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert gzip.decompress(response.data) == plain.data
+        assert "Content-Encoding" not in plain.headers
+        # strong ETags differ between the representations
+        assert response.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+        resumed = flask_client.get('/export', query_string={'format': 'ndjson', 'offset': 1},
+                                   headers={'Accept-Encoding': 'gzip', 'If-Match': response.headers["ETag"]})
+        assert resumed.status_code == 200
+
+    def test_resume(self, flask_client):
+        full = flask_client.get('/export', query_string={'sort_by': '+price,+product_id', 'format': 'ndjson'})
+        lines = full.get_data(as_text=True).splitlines()
+        first = flask_client.get('/export', query_string={'sort_by': '+price,+product_id', 'format': 'ndjson',
+                                                          'limit': 2})
+        assert first.get_data(as_text=True).splitlines() == lines[:2]
+        next_url = first.headers["Link"].split(">")[0].lstrip("<")
+        rest = flask_client.get(next_url, headers={'If-Match': first.headers["ETag"]})
+        assert rest.status_code == 200
+        # the next page keeps the limit
+        assert rest.get_data(as_text=True).splitlines() == lines[2:4]
+        resumed = flask_client.get('/export', query_string={'sort_by': '+price,+product_id', 'format': 'ndjson',
+                                                            'offset': 3})
+        assert resumed.get_data(as_text=True).splitlines() == lines[3:]
+
+    def test_changed_catalog(self, flask_client):
+        response = flask_client.get('/export', query_string={'offset': 3}, headers={'If-Match': '"catalog-0"'})
+        assert response.status_code == 412
+
+    def test_unknown_format(self, flask_client):
+        response = flask_client.get('/export', query_string={'format': 'xml'})
+        assert response.status_code == 400
+        assert b"xml" in response.data
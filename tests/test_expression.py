@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from datasource.base import Range
+from datasource.expression import compile_filter, FilterSyntaxError, Match, Between, Not, AllOf, AnyOf
+from datasource.snapshot import CatalogSnapshot
+from models.product import ProductStatus
+
+
+def product_keys(products):
+    return [(product.product_id, product.price, product.product_name) for product in products]
+
+
+class TestCompileFilter:
+    @pytest.mark.parametrize("expression, filter_by", [
+        ("status = active", {"status": ProductStatus.ACTIVE}),
+        ("status = Hidden AND brand_name = 'Acme Co'", {"status": ProductStatus.HIDDEN, "brand_name": "Acme Co"}),
+        ("price >= 10 AND price <= 20", {"price": Range(10, 20)}),
+        ("price BETWEEN 10 AND 20 and price >= 15", {"price": Range(15, 20)}),
+        ('product_name = "say \\"hi\\"" and product_id = 7', {"product_name": 'say "hi"', "product_id": 7}),
+        ('price = "$1,019.99"', {"price": 1019.99}),
+    ])
+    def test_plans_reduced_to_filter_dicts(self, expression, filter_by):
+        assert compile_filter(expression).filter_by == filter_by
+
+    def test_plan_tree(self):
+        plan = compile_filter("status != deleted AND (brand_name IN (Acme, Zed) OR price < 10)")
+        assert plan == AllOf([
+            Not(Match("status", [ProductStatus.DELETED])),
+            AnyOf([Match("brand_name", ["Zed", "Acme"]), Not(Between("price", Range(low=10.0)))]),
+        ])
+        assert plan.filter_by is None
+        assert compile_filter("product_id = 1 or (product_id = 2 or product_id = 3)") == AnyOf(
+            [Match("product_id", [1]), Match("product_id", [2]), Match("product_id", [3])])
+
+    @pytest.mark.parametrize("expression", [
+        "", "status", "status = unknown", "color = red", "brand_name > Acme", "price = 1 and", "(price = 1",
+        "price = 1)", "price 1", '"Acme', "price in ()", "product_id = 1.5", "price BETWEEN 1 OR 2",
+    ])
+    def test_malformed_expressions(self, expression):
+        with pytest.raises(FilterSyntaxError):
+            compile_filter(expression)
+
+    def test_plans_are_cached(self):
+        compile_filter.cache_clear()
+        first = compile_filter("brand_name in (Acme, Hooli)")
+        assert compile_filter("brand_name in (Acme, Hooli)") is first
+        assert compile_filter.cache_info().hits == 1
+
+    def test_combine(self):
+        plan = compile_filter("brand_name = Acme or brand_name = Zed")
+        assert plan.combine({}) is plan
+        combined = plan.combine({"price": Range(high=10)})
+        assert combined == AllOf([plan, Between("price", Range(high=10))])
+        assert compile_filter("price >= 5").combine({"price": Range(high=10)}).filter_by == {"price": Range(5, 10)}
+
+
+@pytest.mark.usefixtures("rest_data_source_obj", "random_product_lst")
+class TestFilterPlans:
+    @pytest.mark.parametrize("expression", [
+        "status = active", "brand_name in (Acme, Zed)", "brand_name in (Acme, Missing)", "status not in (hidden)",
+        "price > 10 and price < 123.45", "not (brand_name = Hooli or price <= 10)",
+        "status = deleted or brand_name = Zed and product_name = anvil",
+        "product_id between 20 and 60 and (price = 99.99 or product_name in (Widget, Nucleus))",
+        "brand_name = Missing or product_name = Missing", "product_id >= 100 and status in (active, hidden)",
+    ])
+    def test_plan_on_columns_matches_predicate(self, rest_data_source_obj, random_product_lst, expression):
+        plan = compile_filter(expression)
+        view = CatalogSnapshot(random_product_lst).products
+        expected = [product for product in view if plan.predicate(product)]
+        assert product_keys(rest_data_source_obj.filter(list(view), plan)) == product_keys(expected)
+        assert product_keys(rest_data_source_obj.filter(view, plan)) == product_keys(expected)
+        # on a subset of the catalog, e.g. a sorted list
+        subset = rest_data_source_obj.sort(view, {"price": False})
+        assert product_keys(rest_data_source_obj.filter(subset, plan)) == product_keys(
+            [product for product in subset if plan.predicate(product)])
+
+    def test_conditions_checked_on_index_candidates(self, random_product_lst, mocker):
+        snapshot = CatalogSnapshot(random_product_lst)
+        mask = mocker.spy(snapshot.columns, "mask")
+        plan = compile_filter("brand_name = Acme and (status = active or price < 10)")
+        positions = snapshot.indexes.select(plan)
+        acme = snapshot.indexes.brand_name[snapshot.columns.brand_names.index("Acme")]
+        assert set(positions) <= set(acme)
+        assert all(len(call.args[1]) == len(acme) for call in mask.call_args_list)
+
+    def test_get_products_caches_plan_queries(self, rest_data_source_obj, random_product_lst, mocker):
+        mocker.patch.object(rest_data_source_obj, "get_raw_product_data", return_value=random_product_lst)
+        snapshot = CatalogSnapshot(random_product_lst)
+        mocker.patch.object(rest_data_source_obj, "get_processed_product_data", return_value=snapshot.products)
+        sort_by = {"price": True}
+        first, _ = rest_data_source_obj.get_products(compile_filter("brand_name in (Zed, Acme)"), sort_by, limit=5)
+        second, _ = rest_data_source_obj.get_products(compile_filter("brand_name in (Acme, Zed)"), sort_by, limit=5)
+        assert second == first and rest_data_source_obj.query_cache.stats()["misses"] == 1
+        assert rest_data_source_obj.query_cache.stats()["hits"] == 1
+
+
+@pytest.mark.usefixtures("flask_client")
+class TestAppFilter:
+    def test_filter_arg(self, flask_client):
+        response = flask_client.get('/products.json', query_string={
+            'filter': 'status = active and (brand_name = "Wonderful Widgets" or price <= 10)', 'sort_by': '+price'})
+        assert response.status_code == 200
+        products = json.loads(response.data)["products"]
+        assert products and all(product["status"] == "ACTIVE" for product in products)
+        assert {(product["product_id"], product["brand_name"]) for product in products} == {
+            (2001, "Acme"), (2002, "Acme"), (1000, "Wonderful Widgets"), (1001, "Wonderful Widgets")}
+
+    def test_filter_combined_with_status_arg(self, flask_client):
+        unfiltered = json.loads(flask_client.get('/statistics.json').data)["unfiltered"]
+        response = flask_client.get('/statistics.json', query_string={'filter': 'price >= 0', 'status': 'deleted'})
+        expected = flask_client.get('/statistics.json', query_string={'status': 'deleted'})
+        assert json.loads(response.data) == json.loads(expected.data)
+        assert json.loads(response.data)["unfiltered"] == unfiltered
+
+    def test_malformed_filter(self, flask_client):
+        response = flask_client.get('/products', query_string={'filter': 'status = sold'})
+        assert response.status_code == 400
+        assert b"Invalid status 'sold'" in response.data
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from datasource.base import Range
+from datasource.snapshot import CatalogSnapshot
+from models.product import ProductStatus
+
+
+def product_keys(products):
+    return [(product.product_id, product.price, product.product_name) for product in products]
+
+
+@pytest.mark.usefixtures("rest_data_source_obj", "random_product_lst")
+class TestCatalogIndexes:
+    @pytest.mark.parametrize("filter_by", [
+        {'status': ProductStatus.ACTIVE}, {'brand_name': 'Hooli'}, {'brand_name': 'Missing'},
+        {'price': Range(10, 99.99)}, {'price': Range(low=99.99)}, {'price': Range(high=1.5)}, {'price': 123.45},
+        {'price': Range(1000, 2000)}, {'status': ProductStatus.HIDDEN, 'brand_name': 'Acme'},
+        {'status': ProductStatus.DELETED, 'price': Range(10, 123.45), 'product_name': 'Anvil'},
+        {'brand_name': 'Zed', 'product_id': 7}, {'product_name': 'Widget'},
+    ])
+    def test_indexed_filter_matches_list_filter(self, rest_data_source_obj, random_product_lst, filter_by):
+        view = CatalogSnapshot(random_product_lst).products
+        expected = rest_data_source_obj.filter(list(view), filter_by)
+        received = rest_data_source_obj.filter(view, filter_by)
+        assert product_keys(received) == product_keys(expected)
+
+    def test_filter_checks_only_the_smallest_candidate_set(self, random_product_lst, mocker):
+        snapshot = CatalogSnapshot(random_product_lst)
+        indexes = snapshot.indexes
+        mask = mocker.spy(snapshot.columns, "mask")
+        acme = indexes.brand_name[snapshot.columns.brand_names.index("Acme")]
+        active = indexes.status[ProductStatus.ACTIVE.value]
+        indexes.select({'status': ProductStatus.ACTIVE, 'brand_name': 'Acme'})
+        # the remaining condition is checked on the smaller bucket only, never on the whole catalog
+        mask.assert_called_once()
+        assert len(mask.call_args.args[1]) == min(len(acme), len(active))
+
+    def test_buckets_hold_ascending_positions(self, random_product_lst):
+        snapshot = CatalogSnapshot(random_product_lst)
+        for bucket in snapshot.indexes.status + snapshot.indexes.brand_name:
+            assert np.all(np.diff(bucket) > 0)
+        assert sum(len(bucket) for bucket in snapshot.indexes.status) == len(snapshot.products)
+
+    def test_list_filter_supports_price_range(self, rest_data_source_obj, get_product_lst):
+        received = rest_data_source_obj.filter(get_product_lst, {'price': Range(5, 20)})
+        assert {product.product_id for product in received} == {2001, 2002, 2003}
@@ -0,0 +1,130 @@
+import re
+import threading
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, Gauge, MetricsRegistry
+
+
+def parse_server_timing(header):
+    return {name: float(duration) for name, duration in re.findall(r"(\w+);dur=([\d.]+)", header)}
+
+
+def sample(text, name):
+    match = re.search(r"^{} (\S+)$".format(re.escape(name)), text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+class TestMetrics:
+    def test_histogram(self):
+        histogram = Histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe("sort", value=value)
+        assert histogram.render() == [
+            "# HELP latency_seconds Latency",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{stage="sort",le="0.1"} 2',
+            'latency_seconds_bucket{stage="sort",le="1.0"} 3',
+            'latency_seconds_bucket{stage="sort",le="+Inf"} 4',
+            'latency_seconds_sum{stage="sort"} 3.65',
+            'latency_seconds_count{stage="sort"} 4',
+        ]
+
+    def test_counter_and_gauge(self):
+        registry = MetricsRegistry()
+        counter = registry.register(Counter("responses_total", "Responses", ("status",)))
+        counter.inc("200")
+        counter.inc("200", amount=2)
+        counter.inc('a"b')
+        registry.register(Gauge("size", "Size", callback=lambda: {(): 7}))
+        assert registry.register(Counter("responses_total", "Other")) is counter
+        text = registry.render()
+        assert 'responses_total{status="200"} 3' in text
+        assert 'responses_total{status="a\\"b"} 1' in text
+        assert "# TYPE size gauge\nsize 7\n" in text
+
+    def test_render_while_updated(self):
+        counter = Counter("requests_total", "Requests", ("path",))
+        histogram = Histogram("latency_seconds", "Latency", ("path",))
+
+        def update():
+            # new label values grow the dicts while they are rendered
+            for i in range(20000):
+                counter.inc(str(i))
+                histogram.observe(str(i), value=0.01)
+
+        thread = threading.Thread(target=update)
+        thread.start()
+        try:
+            while thread.is_alive():
+                counter.render()
+                histogram.render()
+        finally:
+            thread.join()
+        assert counter.get("19999") == 1
+
+    def test_stage(self, monkeypatch):
+        count = metrics.STAGE_SECONDS.count("test_stage")
+        metrics.start_request()
+        with metrics.stage("test_stage"):
+            pass
+        assert list(metrics.timed_iter("test_stage", [1, 2])) == [1, 2]
+        assert metrics.STAGE_SECONDS.count("test_stage") == count + 2
+        assert list(parse_server_timing(metrics.server_timing())) == ["test_stage"]
+        metrics.end_request()
+        assert metrics.server_timing() is None
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(metrics.REGISTRY, "enabled", False)
+        count = metrics.STAGE_SECONDS.count("test_stage")
+        with metrics.stage("test_stage"):
+            pass
+        assert list(metrics.timed_iter("test_stage", [1])) == [1]
+        metrics.inc(metrics.UPSTREAM_RESPONSES, "test")
+        assert metrics.STAGE_SECONDS.count("test_stage") == count
+        assert metrics.UPSTREAM_RESPONSES.get("test") == 0
+        assert metrics.stage("a") is metrics.stage("b")
+
+
+@pytest.mark.usefixtures("flask_client")
+class TestAppMetrics:
+    def test_server_timing(self, flask_client):
+        response = flask_client.get('/statistics?status=active')
+        timings = parse_server_timing(response.headers['Server-Timing'])
+        assert {"catalog", "upstream", "ingest", "statistics", "render", "total"} <= set(timings)
+        assert timings["total"] >= timings["catalog"] >= timings["ingest"]
+
+        response = flask_client.get('/products?status=active&sort_by=-price')
+        timings = parse_server_timing(response.headers['Server-Timing'])
+        assert {"dedupe", "filter", "sort", "total"} <= set(timings)
+        assert "upstream" not in timings
+
+    def test_metrics_endpoint(self, flask_client, raw_product_data):
+        before = flask_client.get('/metrics').get_data(as_text=True)
+        flask_client.get('/products?status=active')
+        flask_client.get('/products?status=active')
+        response = flask_client.get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        text = response.get_data(as_text=True)
+
+        def delta(name):
+            return sample(text, name) - (sample(before, name) or 0)
+
+        assert delta('beautylish_upstream_responses_total{status="200"}') == 1
+        assert delta('beautylish_upstream_response_bytes_total') > 0
+        assert delta('beautylish_http_requests_total{endpoint="get_products",status="200"}') == 2
+        assert delta('beautylish_query_cache_requests_total{result="hit"}') == 1
+        assert delta('beautylish_catalog_cache_requests_total{result="miss"}') == 1
+        assert sample(text, 'beautylish_catalog_products{kind="raw"}') == len(raw_product_data)
+        assert sample(text, 'beautylish_catalog_products{kind="distinct"}') == 7
+        assert sample(text, 'beautylish_stage_duration_seconds_count{stage="filter"}') > 0
+        assert 'beautylish_http_request_duration_seconds_bucket{endpoint="get_products",le="+Inf"}' in text
+
+    def test_disabled(self, flask_client, monkeypatch):
+        monkeypatch.setattr(metrics.REGISTRY, "enabled", False)
+        response = flask_client.get('/statistics')
+        assert response.status_code == 200
+        assert 'Server-Timing' not in response.headers
+        assert flask_client.get('/metrics').status_code == 404
@@ -0,0 +1,119 @@
+import copy
+
+import pytest
+
+from datasource.base import Range
+from datasource.normalize import ProductNormalizer, parse_cents, to_cents
+from datasource.rest import RestDataSource
+from models.product import Product, ProductStatus
+
+
+def item(product_id, price, brand_name="Acme", product_name="Anvil", deleted=False, hidden=False):
+    return {"id": product_id, "price": price, "brand_name": brand_name, "product_name": product_name,
+            "deleted": deleted, "hidden": hidden}
+
+
+class TestPrices:
+    @pytest.mark.parametrize("price, cents", [
+        ("$0.10", 10), ("$1,234.50", 123450), ("$7", 700), ("12.3", 1230), ("$0.00", 0), ("$19.99", 1999)])
+    def test_parse_cents(self, price, cents):
+        assert parse_cents(price) == cents
+
+    @pytest.mark.parametrize("price, cents", [
+        ("$0.125", 12), ("$0.135", 14), ("$1.005", 100), ("$2.999", 300), ("$0.001", 0)])
+    def test_fractions_of_cents_are_rounded_half_to_even(self, price, cents):
+        assert parse_cents(price) == cents
+
+    @pytest.mark.parametrize("price", ["$", "$abc", "", "nan", "$NaN", "sNaN", "$inf", "-Infinity"])
+    def test_invalid_prices(self, price):
+        with pytest.raises(ValueError):
+            parse_cents(price)
+
+    def test_to_cents(self):
+        assert [to_cents(price) for price in (0.1, 0.29, 19.99, 1234.5)] == [10, 29, 1999, 123450]
+
+
+class TestProductNormalizer:
+    def test_product(self):
+        normalizer = ProductNormalizer()
+        rows = (item(1, "$1,019.99"), item(2, "$5.00", hidden=True), item(3, "$5.00", deleted=True, hidden=True))
+        assert [normalizer.product(row) for row in rows] == [
+            Product(1, 1019.99, "Acme", "Anvil", ProductStatus.ACTIVE),
+            Product(2, 5.0, "Acme", "Anvil", ProductStatus.HIDDEN),
+            Product(3, 5.0, "Acme", "Anvil", ProductStatus.DELETED)]
+
+    def test_prices_and_names_are_shared(self):
+        normalizer = ProductNormalizer()
+        first = normalizer.product(item(1, "$19.99", "".join(["Ac", "me"]), "".join(["An", "vil"])))
+        second = normalizer.product(item(2, "$19.99", "".join(["Ac", "me"]), "".join(["An", "vil"])))
+        assert first.price is second.price
+        assert first.brand_name is second.brand_name and first.product_name is second.product_name
+        assert normalizer.price("$19.99") == (1999, 19.99)
+
+    def test_symbols_are_carried_over(self):
+        previous = ProductNormalizer()
+        brand_name = previous.product(item(1, "$1.00", "".join(["Ac", "me"]))).brand_name
+        normalizer = ProductNormalizer(previous)
+        assert normalizer.product(item(1, "$1.00", "".join(["Ac", "me"]))).brand_name is brand_name
+        normalizer.product(item(2, "$2.00", "Zed"))
+        assert "Zed" not in previous.symbols and "$2.00" not in previous.prices
+
+    def test_tables_are_bounded_by_the_products(self):
+        previous = ProductNormalizer()
+        for i in range(10):
+            previous.product(item(i, "${}.00".format(i), "Brand {}".format(i), "Product {}".format(i)))
+        # 10 products can need up to 20 names and 10 prices, twice that is taken over
+        kept = ProductNormalizer(previous, nproducts=5)
+        assert len(kept.symbols) == 20 and len(kept.prices) == 10
+        reset = ProductNormalizer(previous, nproducts=4)
+        assert reset.symbols == {} and reset.prices == {}
+
+
+class TestExactStatistics:
+    def test_average_of_cents_is_exact(self):
+        products = [Product(i, price, "Acme", "Anvil", ProductStatus.ACTIVE) for i, price in
+                    enumerate([0.1, 0.2, 0.3] * 1000)]
+        data_source = RestDataSource("https://example.com")
+        assert sum(product.price for product in products) / len(products) != 0.2
+        assert data_source._compute_statistics(products)["avg_price"] == 0.2
+
+    def test_snapshot_statistics(self, upstream_server):
+        rows = [item(i, ["$0.10", "$0.20", "$0.30"][i % 3], "Brand {}".format(i % 5)) for i in range(3000)]
+        upstream_server.set_products(rows)
+        data_source = RestDataSource(upstream_server.url)
+        statistics = data_source.get_statistics({"status": ProductStatus.ACTIVE})
+        assert statistics["unfiltered"]["avg_price"] == 0.2
+        assert statistics["filtered"]["avg_price"] == 0.2
+        # answered from the columns instead of the aggregates
+        assert data_source.get_statistics({"price": Range(0, 1)})["filtered"]["avg_price"] == 0.2
+        snapshot = data_source.get_snapshot()
+        assert snapshot.columns.price_cents.tolist()[:3] == [10, 20, 30]
+        assert snapshot.aggregates.raw.price_cents == 60000
+
+    def test_items_with_invalid_prices_are_skipped(self, upstream_server, caplog):
+        rows = [item(1, "$0.125"), item(2, "NaN"), item(3, "$2.50"), item(4, "$abc"), item(5, "$inf")]
+        upstream_server.set_products(rows)
+        data_source = RestDataSource(upstream_server.url)
+        snapshot = data_source.get_snapshot()
+        assert [(product.product_id, product.price) for product in snapshot.raw_products] == [(1, 0.12), (3, 2.5)]
+        assert snapshot.columns.price_cents.tolist() == [12, 250]
+        assert [record.levelname for record in caplog.records].count("WARNING") == 3
+        products, _ = data_source.get_products({}, {"price": False})
+        assert [product.product_id for product in products] == [3, 1]
+        assert [product.product_id for product in data_source.iter_raw_product_data()] == [1, 3]
+
+    def test_refresh_reuses_symbols(self, upstream_server):
+        rows = [item(i, "$2.50", "Brand {}".format(i % 5)) for i in range(50)]
+        upstream_server.set_products(rows)
+        data_source = RestDataSource(upstream_server.url)
+        first = data_source.get_snapshot()
+        changed = copy.deepcopy(rows)
+        changed[0]["price"] = "$3.50"
+        upstream_server.set_products(changed)
+        second = data_source._load_snapshot(first)
+        assert second is not first
+        # the changed product is a new object, its brand name is the one of the previous snapshot
+        changed_product = second.products[-1]
+        assert changed_product.product_id == 0 and changed_product is not first.products[0]
+        assert changed_product.brand_name is first.products[0].brand_name
+        assert second.peek("normalizer").prices["$3.50"] == (350, 3.5)
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from datasource.base import encode_cursor, decode_cursor
+from datasource.snapshot import ProductView, CatalogSnapshot
+from models.product import ProductStatus
+
+
+def product_keys(products):
+    return [(product.product_id, product.price, product.product_name) for product in products]
+
+
+@pytest.fixture(scope='function')
+def cached_data_source(rest_data_source_obj, random_product_lst, mocker):
+    """
+    data source whose catalog cache holds a snapshot of random_product_lst
+    """
+    snapshot = CatalogSnapshot(random_product_lst)
+    mocker.patch.object(rest_data_source_obj.cache, 'get', return_value=snapshot)
+    mocker.patch.object(rest_data_source_obj.cache, 'peek', return_value=snapshot)
+    return rest_data_source_obj
+
+
+@pytest.mark.usefixtures("cached_data_source")
+class TestPagination:
+    @pytest.mark.parametrize("sort_by", [
+        OrderedDict(), OrderedDict({'price': True}), OrderedDict({'price': False, 'product_name': True}),
+        OrderedDict({'brand_name': False, 'product_id': False}),
+    ])
+    @pytest.mark.parametrize("offset, limit", [(0, 1), (0, 10), (5, 20), (0, 1000), (250, 100), (500, 10)])
+    def test_page_matches_slice_of_sorted_products(self, cached_data_source, sort_by, offset, limit):
+        filter_by = {'status': ProductStatus.ACTIVE}
+        expected, _ = cached_data_source.get_products(filter_by, sort_by)
+        page, org_products = cached_data_source.get_products(filter_by, sort_by, limit=limit, offset=offset)
+        assert isinstance(page, ProductView)
+        assert product_keys(page) == product_keys(expected[offset:offset + limit])
+        assert page.total == len(expected)
+        assert page.offset == offset
+
+    @pytest.mark.parametrize("sort_by", [
+        OrderedDict({'price': True, 'product_name': True}), OrderedDict({'brand_name': False, 'price': False}),
+        OrderedDict({'price': False, 'product_name': True}), OrderedDict(),
+    ])
+    def test_heap_page_of_plain_list_matches_slice(self, rest_data_source_obj, random_product_lst, mocker,
+                                                   sort_by):
+        mocker.patch('datasource.rest.RestDataSource.get_processed_product_data',
+                     return_value=list(set(random_product_lst)))
+        expected, _ = rest_data_source_obj.get_products({}, sort_by)
+        page, _ = rest_data_source_obj.get_products({}, sort_by, limit=15, offset=3)
+        assert product_keys(page) == product_keys(expected[3:18])
+        assert page.total == len(expected)
+
+    def test_cursor_walks_through_all_pages(self, cached_data_source):
+        sort_by = OrderedDict({'price': False, 'product_id': True})
+        expected, _ = cached_data_source.get_products({}, sort_by)
+        received, cursor = [], None
+        while True:
+            page, _ = cached_data_source.get_products({}, sort_by, limit=40, cursor=cursor)
+            received.extend(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert product_keys(received) == product_keys(expected)
+
+    def test_unpaged_products_have_no_next_cursor(self, cached_data_source):
+        products, _ = cached_data_source.get_products({}, OrderedDict())
+        assert products.total == len(products)
+        assert products.next_cursor is None
+
+    def test_empty_page_has_no_next_cursor(self, cached_data_source):
+        page, _ = cached_data_source.get_products({}, OrderedDict({'brand_name': True}), limit=0)
+        assert len(page) == 0 and page.total > 0
+        assert page.next_cursor is None
+
+    def test_equal_queries_are_answered_from_the_query_cache(self, cached_data_source, mocker):
+        select_page = mocker.spy(cached_data_source, '_select_page')
+        sort_by = OrderedDict({'price': False, 'product_id': True})
+        first, _ = cached_data_source.get_products({'status': ProductStatus.ACTIVE}, sort_by, limit=10)
+        second, _ = cached_data_source.get_products({'status': ProductStatus.ACTIVE}, OrderedDict(sort_by), limit=10)
+        assert list(second) == list(first) and second.total == first.total
+        # only the positions of the page are cached, not its products
+        assert second is not first
+        assert all(isinstance(page, np.ndarray) for page, _ in cached_data_source.query_cache._entries.values())
+        cached_data_source.get_products({'status': ProductStatus.ACTIVE}, sort_by, limit=10, offset=10)
+        assert select_page.call_count == 2
+        assert cached_data_source.query_cache.stats()['hits'] == 1
+
+    def test_cursor_round_trip(self):
+        assert decode_cursor(encode_cursor(1234)) == 1234
+
+    @pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor(1)[:-2] + "!!", "b2Zmc2V0Oi0x"])
+    def test_malformed_cursor_raises_value_error(self, cursor):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
@@ -0,0 +1,168 @@
+import struct
+import time
+
+import numpy as np
+import pytest
+
+from datasource.persist import save_snapshot, load_snapshot, SnapshotFormatError, MAGIC, FORMAT_VERSION
+from datasource.rest import RestDataSource
+from datasource.search import search_plan
+from datasource.snapshot import CatalogBuilder
+from models.product import Product, ProductStatus
+from rendering import iter_csv, iter_ndjson
+
+
+@pytest.fixture(scope='function')
+def saved_snapshot(random_product_lst, tmp_path):
+    """
+    snapshot of random_product_lst, saved to a file
+    :return: snapshot and the path of its file
+    """
+    snapshot = CatalogBuilder().extend(random_product_lst).build(etag='"v1"', last_modified="Wed, 01 Jun 2022")
+    path = str(tmp_path / "catalog.snapshot")
+    save_snapshot(snapshot, path)
+    return snapshot, path
+
+
+class TestSnapshotFile:
+    def test_round_trip(self, saved_snapshot):
+        snapshot, path = saved_snapshot
+        loaded = load_snapshot(path)
+        assert loaded.version > snapshot.version
+        assert (loaded.etag, loaded.last_modified, loaded.fetched_at) == \
+               (snapshot.etag, snapshot.last_modified, snapshot.fetched_at)
+        assert loaded.raw_products == snapshot.raw_products
+        assert loaded.distinct.products == snapshot.distinct.products
+        assert loaded.distinct.counts == snapshot.distinct.counts
+        assert loaded.peek("digest") == snapshot.digest
+        # duplicates are restored as the same object
+        assert len({id(product) for product in loaded.raw_products}) == len(loaded.distinct.products)
+        assert loaded.aggregates.distinct.statistics() == snapshot.aggregates.distinct.statistics()
+        assert loaded.aggregates.raw.statistics() == snapshot.aggregates.raw.statistics()
+
+    def test_products_are_created_on_first_access(self, saved_snapshot):
+        snapshot, path = saved_snapshot
+        loaded = load_snapshot(path)
+        assert loaded.columns._objects is None and loaded.peek("distinct") is None
+        assert len(loaded) == len(snapshot) and len(loaded.raw_products) == len(snapshot.raw_products)
+        assert loaded.aggregates.raw.statistics() == snapshot.aggregates.raw.statistics()
+        # the statistics are counted on the mapped columns, without products or counters
+        assert loaded.columns._objects is None and loaded.aggregates.raw._arrays is not None
+        assert loaded.raw_products[:3] == snapshot.raw_products[:3]
+        assert [] + loaded.raw_products == loaded.raw_products + [] == snapshot.raw_products
+        # raw and distinct products are the same objects
+        assert loaded.distinct.products[0] is loaded.columns.objects[0]
+        assert loaded.raw_products[0] is loaded.distinct.products[loaded.positions[loaded.raw_products[0]]]
+
+    def test_columns_are_memory_mapped(self, saved_snapshot):
+        snapshot, path = saved_snapshot
+        loaded = load_snapshot(path)
+        columns = loaded.peek("columns")
+        assert columns is not None
+        for name in ("product_id", "price", "status", "brand_name", "product_name", "counts"):
+            array = getattr(columns, name)
+            assert not array.flags.writeable
+            assert np.array_equal(array, getattr(snapshot.columns, name)), name
+        assert columns.brand_names == snapshot.columns.brand_names
+        assert list(loaded.indexes.select({"brand_name": "Acme"})) == \
+               list(snapshot.indexes.select({"brand_name": "Acme"}))
+
+    def test_search_index_is_memory_mapped(self, random_product_lst, tmp_path):
+        snapshot = CatalogBuilder().extend(random_product_lst).build()
+        plan = search_plan("acme anv")
+        expected = snapshot.indexes.select(plan)
+        path = str(tmp_path / "catalog.snapshot")
+        save_snapshot(snapshot, path)
+        loaded = load_snapshot(path)
+        # restored on the first search, from the file instead of building it
+        assert loaded.indexes.peek_search() is None
+        assert list(loaded.indexes.select(plan)) == list(expected)
+        search = loaded.indexes.peek_search()
+        assert search is not None and not search.product_name.postings.flags.writeable
+        assert search.product_name.vocabulary == snapshot.indexes.search.product_name.vocabulary
+
+    def test_null_names(self, tmp_path):
+        products = [Product(1, 5.0, None, "Anvil", ProductStatus.ACTIVE),
+                    Product(2, 7.0, "Acme", None, ProductStatus.ACTIVE)]
+        snapshot = CatalogBuilder().extend(products).build()
+        snapshot.indexes.search
+        path = str(tmp_path / "catalog.snapshot")
+        save_snapshot(snapshot, path)
+        loaded = load_snapshot(path)
+        assert loaded.raw_products == products
+        assert list(loaded.indexes.select(search_plan("anvil"))) == [0]
+        assert "".join(iter_ndjson([loaded.products])).splitlines()[0] == (
+            '{"product_id":1,"price":5.0,"brand_name":null,"product_name":"Anvil","status":"ACTIVE"}')
+        assert "".join(iter_csv([loaded.products])).splitlines()[2] == "2,7.0,Acme,,ACTIVE"
+
+    def test_empty_catalog(self, tmp_path):
+        path = str(tmp_path / "catalog.snapshot")
+        save_snapshot(CatalogBuilder().build(), path)
+        loaded = load_snapshot(path)
+        assert loaded.raw_products == [] and len(loaded.columns) == 0
+
+    def test_save_replaces_file(self, saved_snapshot, get_product_lst, tmp_path):
+        _, path = saved_snapshot
+        save_snapshot(CatalogBuilder().extend(get_product_lst).build(), path)
+        assert load_snapshot(path).raw_products == get_product_lst
+        assert [file.name for file in tmp_path.iterdir()] == ["catalog.snapshot"]
+
+    @pytest.mark.parametrize("prefix", [b"", b"NOTASNAPSHOT....", struct.pack("<8sII", MAGIC, FORMAT_VERSION + 1, 0)])
+    def test_invalid_file(self, tmp_path, prefix):
+        path = tmp_path / "catalog.snapshot"
+        path.write_bytes(prefix)
+        with pytest.raises(SnapshotFormatError):
+            load_snapshot(str(path))
+
+
+class TestWarmStart:
+    def test_new_snapshots_are_saved(self, upstream_server, tmp_path, get_product_lst):
+        path = str(tmp_path / "catalog.snapshot")
+        data_source = RestDataSource(upstream_server.url, snapshot_path=path)
+        data_source.get_snapshot()
+        # saved in the background
+        data_source.saver.join()
+        assert load_snapshot(path).raw_products == get_product_lst
+
+    def test_older_snapshot_is_not_saved_over_newer(self, tmp_path, get_product_lst, random_product_lst):
+        path = str(tmp_path / "catalog.snapshot")
+        data_source = RestDataSource("http://127.0.0.1:1/", snapshot_path=path)
+        older = CatalogBuilder().extend(random_product_lst).build()
+        newer = CatalogBuilder().extend(get_product_lst).build()
+        data_source._save_snapshot(newer)
+        data_source._save_snapshot(older)
+        assert load_snapshot(path).raw_products == get_product_lst
+
+    def test_missing_or_damaged_file(self, tmp_path):
+        path = tmp_path / "catalog.snapshot"
+        data_source = RestDataSource("http://127.0.0.1:1/", snapshot_path=str(path))
+        assert data_source.load_persisted_snapshot() is None
+        path.write_bytes(b"garbage")
+        assert data_source.load_persisted_snapshot() is None
+        assert data_source.cache.peek() is None
+
+    def test_persisted_snapshot_is_served_then_refreshed(self, upstream_server, tmp_path, random_product_lst):
+        path = str(tmp_path / "catalog.snapshot")
+        save_snapshot(CatalogBuilder().extend(random_product_lst).build(), path)
+        upstream_server.delay = 0.3
+        upstream_server.set_products([
+            {"deleted": False, "price": "$1.00", "brand_name": "Zed", "id": 1, "hidden": False,
+             "product_name": "Zeppelin"}])
+        data_source = RestDataSource(upstream_server.url, snapshot_path=path, cache_ttl=60)
+        restored = data_source.load_persisted_snapshot()
+        assert data_source.get_snapshot_age() < 60
+
+        data_source.start_refresher(interval=60)
+        try:
+            # served without waiting for the upstream
+            assert data_source.get_snapshot() is restored
+            assert data_source.get_raw_product_data() is restored.raw_products
+            deadline = time.time() + 5
+            while data_source.cache.peek() is restored and time.time() < deadline:
+                time.sleep(0.02)
+            assert [product.product_id for product in data_source.get_snapshot().raw_products] == [1]
+            assert upstream_server.requests == 1
+        finally:
+            data_source.stop_refresher()
+        data_source.saver.join()
+        assert load_snapshot(path).raw_products == data_source.get_snapshot().raw_products
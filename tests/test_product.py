@@ -0,0 +1,44 @@
+import pytest
+
+from datasource.snapshot import CatalogBuilder
+from models.product import Product, ProductStatus
+
+
+class TestProduct:
+    def test_product_has_no_instance_dict(self):
+        product = Product(1, 10.0, "Acme", "Anvil", ProductStatus.ACTIVE)
+        assert not hasattr(product, "__dict__")
+        with pytest.raises(AttributeError):
+            product.color = "red"
+
+    def test_subscript_returns_attribute(self):
+        product = Product(1, 10.0, "Acme", "Anvil", ProductStatus.ACTIVE)
+        assert [product[key] for key in ("product_id", "price", "brand_name", "product_name", "status")] == [
+            1, 10.0, "Acme", "Anvil", ProductStatus.ACTIVE
+        ]
+        with pytest.raises(AttributeError):
+            product["missing"]
+
+    def test_equal_products_have_equal_hash(self):
+        first = Product(1, 10.0, "Acme", "Anvil", ProductStatus.ACTIVE)
+        second = Product(1, 10.0, "Acme", "Anvil", ProductStatus.ACTIVE)
+        assert first == second and hash(first) == hash(second)
+        assert first != Product(1, 10.0, "Acme", "Anvil", ProductStatus.HIDDEN)
+
+    def test_setitem_sets_attribute(self):
+        product = Product(1, 10.0, "Acme", "Anvil", ProductStatus.ACTIVE)
+        product["price"] = 12.5
+        assert product.price == 12.5
+        assert product == Product(1, 12.5, "Acme", "Anvil", ProductStatus.ACTIVE)
+
+
+class TestCatalogBuilder:
+    def test_duplicates_are_removed_while_ingesting(self, raw_product_data, get_product_lst):
+        builder = CatalogBuilder().extend(Product(p.product_id, p.price, p.brand_name, p.product_name, p.status)
+                                          for p in get_product_lst)
+        assert builder.raw_products == get_product_lst
+        assert builder.products == list(dict.fromkeys(get_product_lst))
+        assert sum(builder.counts) == len(get_product_lst)
+        # duplicates are the same object as the first equal product
+        assert builder.raw_products[4] is builder.raw_products[0]
+        assert builder.counts[builder.positions[builder.raw_products[0]]] == 2
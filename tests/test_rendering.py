@@ -0,0 +1,39 @@
+import json
+
+from datasource.snapshot import CatalogSnapshot
+from models.product import Product, ProductStatus
+from rendering import render_row, get_row_fragments, render_rows, dumps, products_to_dict
+
+COL_NAMES = ["product_id", "price", "product_name", "brand_name", "status"]
+
+
+class TestRendering:
+    def test_render_row_escapes_values(self):
+        product = Product(1, 9.5, "<b>Acme</b>", "Tom & Jerry", ProductStatus.HIDDEN)
+        row = render_row(product, ["product_id", "brand_name", "product_name", "status"])
+        assert row == ("<tr><td>1</td><td>&lt;b&gt;Acme&lt;/b&gt;</td><td>Tom &amp; Jerry</td>"
+                       "<td>HIDDEN</td></tr>\n")
+
+    def test_rows_are_rendered_once_per_snapshot(self, get_product_lst, monkeypatch):
+        snapshot = CatalogSnapshot(get_product_lst)
+        calls = []
+        monkeypatch.setattr("rendering.render_row", lambda product, cols: calls.append(product) or "<tr/>")
+        assert len(list(get_row_fragments(snapshot.products, COL_NAMES))) == len(snapshot.products)
+        assert len(list(get_row_fragments(snapshot.products, COL_NAMES))) == len(snapshot.products)
+        assert len(calls) == len(snapshot.products)
+        # a new snapshot, or other columns, render again
+        list(get_row_fragments(CatalogSnapshot(get_product_lst).products, COL_NAMES))
+        list(get_row_fragments(snapshot.products, COL_NAMES[:2]))
+        assert len(calls) == 3 * len(snapshot.products)
+
+    def test_render_rows_keeps_view_order(self, get_product_lst):
+        products = list(reversed(get_product_lst))
+        html = "".join(render_rows(products, ["product_id"], 50))
+        assert html == "".join("<tr><td>{}</td></tr>\n".format(product.product_id) for product in products)
+
+    def test_dumps_without_orjson(self, get_product_lst, monkeypatch):
+        data = products_to_dict(get_product_lst[:2])
+        fast = dumps(data)
+        monkeypatch.setattr("rendering.orjson", None)
+        assert json.loads(dumps(data)) == json.loads(fast) == data
+        assert data["total"] == 2 and data["next_cursor"] is None
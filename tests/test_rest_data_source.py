@@ -169,3 +169,15 @@ class TestRestDataSource:
         received_response = rest_data_source_obj.get_statistics({'status': ProductStatus.ACTIVE})
 
         assert expected_result == received_response
+
+    def test_get_statistics_fetches_upstream_once_while_cached(self, rest_data_source_obj,
+                                                                raw_product_data, requests_mock):
+        rest_data_source_obj.base_url = 'mock://test.com'
+        requests_mock.get('mock://test.com', status_code=200, json={'products': raw_product_data})
+        rest_data_source_obj.get_statistics({'status': ProductStatus.ACTIVE})
+        rest_data_source_obj.get_products({'status': ProductStatus.ACTIVE}, {'price': True})
+        assert requests_mock.call_count == 1
+        # after an explicit invalidation the catalog is fetched again
+        rest_data_source_obj.invalidate()
+        rest_data_source_obj.get_processed_product_data()
+        assert requests_mock.call_count == 2
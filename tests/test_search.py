@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from datasource.expression import compile_filter, all_of
+from datasource.search import tokenize, search_plan, Search
+from datasource.snapshot import CatalogSnapshot
+from models.product import Product, ProductStatus
+
+
+def product_ids(products):
+    return [product.product_id for product in products]
+
+
+def catalog(names):
+    return [Product(i, 10.0, brand_name, product_name, ProductStatus.ACTIVE)
+            for i, (brand_name, product_name) in enumerate(names)]
+
+
+class TestSearchPlan:
+    def test_tokenize(self):
+        assert tokenize("Anvil - Two-Pack, 3000!") == ["anvil", "two", "pack", "3000"]
+        assert tokenize("  ") == []
+
+    def test_search_plan(self):
+        assert search_plan("Anvil acme anvil") == Search(["acme", "anvil"])
+        assert search_plan(" - ") is None
+        assert search_plan("acme").filter_by is None
+
+    @pytest.mark.parametrize("query, expected", [
+        ("ac", [0, 1]), ("me", []), ("cme", [0, 1]), ("anv", [0, 2]), ("acme anvil", [0]), ("acme ANVIL", [0]),
+        ("pack", [1, 3]), ("two pack", [1]), ("3000", [3]), ("30", [3]), ("00", []), ("zzz", []),
+    ])
+    def test_terms(self, query, expected):
+        products = catalog([("Acme", "Anvil"), ("Acme", "Two-Pack"), ("Hooli", "Anvils"), ("Zed", "Pack 3000")])
+        plan = search_plan(query)
+        assert [product.product_id for product in products if plan.predicate(product)] == expected
+        assert list(CatalogSnapshot(products).indexes.select(plan)) == expected
+
+    def test_separator_in_name(self):
+        products = catalog([("Ac\x00me", "Anvil"), ("Acme", "Widget\x00Anvil")])
+        indexes = CatalogSnapshot(products).indexes
+        assert list(indexes.select(search_plan("me"))) == [0]
+        assert list(indexes.select(search_plan("acme anvil"))) == [1]
+
+
+@pytest.mark.usefixtures("rest_data_source_obj", "random_product_lst")
+class TestSearchIndex:
+    @pytest.mark.parametrize("query", ["acme", "anv", "an", "nucleus hooli", "zed widget", "e", "missing", "acme z"])
+    def test_index_matches_predicate(self, rest_data_source_obj, random_product_lst, query):
+        plan = search_plan(query)
+        view = CatalogSnapshot(random_product_lst).products
+        expected = [product for product in view if plan.predicate(product)]
+        assert product_ids(rest_data_source_obj.filter(view, plan)) == product_ids(expected)
+        assert product_ids(rest_data_source_obj.filter(list(view), plan)) == product_ids(expected)
+        subset = rest_data_source_obj.sort(view, {"price": False})
+        assert product_ids(rest_data_source_obj.filter(subset, plan)) == product_ids(
+            [product for product in subset if plan.predicate(product)])
+
+    def test_combined_with_filters(self, rest_data_source_obj, random_product_lst):
+        view = CatalogSnapshot(random_product_lst).products
+        plan = all_of([compile_filter("status = active or price < 10"), search_plan("anvil")]).combine(
+            {"brand_name": "Acme"})
+        expected = [product for product in view if plan.predicate(product)]
+        assert expected
+        assert product_ids(rest_data_source_obj.filter(view, plan)) == product_ids(expected)
+
+    def test_index_built_once(self, random_product_lst):
+        snapshot = CatalogSnapshot(random_product_lst)
+        assert snapshot.indexes.search is snapshot.indexes.search
+
+    def test_broad_terms_are_kept(self, random_product_lst):
+        indexes = CatalogSnapshot(random_product_lst).indexes
+        plan = search_plan("acme")
+        positions = indexes.select(plan)
+        assert indexes.broad_terms["acme"] is positions and not positions.flags.writeable
+        assert indexes.select(plan) is positions
+        assert "zzz" not in indexes.broad_terms and not len(indexes.select(search_plan("zzz")))
+
+    def test_get_products_with_status_and_sort(self, rest_data_source_obj, random_product_lst, mocker):
+        mocker.patch.object(rest_data_source_obj, "get_raw_product_data", return_value=random_product_lst)
+        snapshot = CatalogSnapshot(random_product_lst)
+        mocker.patch.object(rest_data_source_obj, "get_processed_product_data", return_value=snapshot.products)
+        plan = search_plan("anvil").combine({"status": ProductStatus.ACTIVE})
+        sort_by = {"price": False, "product_id": True}
+        products, _ = rest_data_source_obj.get_products(plan, sort_by, limit=10)
+        expected = rest_data_source_obj.sort(
+            [product for product in snapshot.products if plan.predicate(product)], sort_by)[:10]
+        assert products == expected
+        assert products and all(product.status == ProductStatus.ACTIVE for product in products)
+
+    def test_built_when_loaded(self, upstream_server):
+        from datasource.rest import RestDataSource
+
+        snapshot = RestDataSource(upstream_server.url, search_index=True).get_snapshot()
+        assert snapshot.indexes._search is not None
+        assert RestDataSource(upstream_server.url).get_snapshot().indexes._search is None
+
+
+@pytest.mark.usefixtures("flask_client")
+class TestAppSearch:
+    def test_q_arg(self, flask_client):
+        response = flask_client.get('/products.json', query_string={'q': 'anvil', 'status': 'active',
+                                                                      'sort_by': '-price,+product_id'})
+        assert response.status_code == 200
+        products = json.loads(response.data)["products"]
+        assert [product["product_id"] for product in products] == [2000, 2001, 2002]
+
+    def test_q_with_filter(self, flask_client):
+        response = flask_client.get('/products.json', query_string={'q': 'wid', 'filter': 'product_id != 1000'})
+        assert [product["product_id"] for product in json.loads(response.data)["products"]] == [1001]
+
+    def test_empty_q(self, flask_client):
+        everything = json.loads(flask_client.get('/products.json').data)
+        assert json.loads(flask_client.get('/products.json', query_string={'q': ' '}).data) == everything
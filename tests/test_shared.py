@@ -0,0 +1,115 @@
+import copy
+import multiprocessing
+from collections import OrderedDict
+
+import pytest
+
+from datasource.rest import InvalidResponseError
+from datasource.shared import CatalogPublisher, SharedCatalogDataSource
+from models.product import ProductStatus
+
+
+def count_active_products(shared_path, queue):
+    # runs in a worker process
+    data_source = SharedCatalogDataSource(shared_path)
+    page, _ = data_source.get_products({"status": ProductStatus.ACTIVE}, OrderedDict())
+    queue.put(page.total)
+
+
+@pytest.fixture(scope='function')
+def publisher(upstream_server, tmp_path):
+    """
+    publisher of the catalog of upstream_server
+    """
+    return CatalogPublisher(upstream_server.url, str(tmp_path / "catalog.shared"))
+
+
+def publish(publisher, force=False):
+    """
+    loads the catalog of publisher and waits until it is published
+    :return: the published snapshot
+    """
+    snapshot = publisher.cache.refresh(force=True) if force else publisher.get_snapshot()
+    publisher.saver.join()
+    return snapshot
+
+
+class TestSharedCatalog:
+    def test_workers_attach_read_only(self, publisher, upstream_server, get_product_lst):
+        published = publish(publisher)
+        assert published.peek("indexes") is not None
+        worker = SharedCatalogDataSource(publisher.snapshot_path)
+        snapshot = worker.get_snapshot()
+        assert snapshot.raw_products == get_product_lst
+        indexes = snapshot.peek("indexes")
+        assert indexes is not None
+        assert not indexes.price_order.flags.writeable and not snapshot.columns.price.flags.writeable
+        # published with the search index, the workers map it
+        assert published.indexes.peek_search() is not None
+        assert not indexes.search.brand_name.ngram_word_ids.flags.writeable
+        page, products = worker.get_products({"status": ProductStatus.ACTIVE}, OrderedDict([("price", False)]))
+        expected_page, expected = publisher.get_products({"status": ProductStatus.ACTIVE},
+                                                         OrderedDict([("price", False)]))
+        assert products == expected and page.total == expected_page.total
+        assert upstream_server.requests == 1
+
+    def test_queries_create_only_the_products_of_the_page(self, publisher):
+        publish(publisher)
+        worker = SharedCatalogDataSource(publisher.snapshot_path)
+        assert worker.transport is None
+        page, products = worker.get_products({"status": ProductStatus.ACTIVE}, OrderedDict([("price", False)]),
+                                             limit=2)
+        stats = worker.get_statistics({"status": ProductStatus.ACTIVE}, worker.get_raw_product_data(),
+                                      worker.filter(products, {"status": ProductStatus.ACTIVE}))
+        expected_page, _ = publisher.get_products({"status": ProductStatus.ACTIVE}, OrderedDict([("price", False)]),
+                                                  limit=2)
+        assert page == expected_page and stats["filtered"]["nproducts"] == page.total
+        snapshot = worker.get_snapshot()
+        assert len(products) == len(snapshot.columns)
+        assert snapshot.columns._objects is None and snapshot.peek("distinct") is None
+
+    def test_refresher_checks_every_check_interval(self, publisher):
+        publish(publisher)
+        worker = SharedCatalogDataSource(publisher.snapshot_path, check_interval=0.5)
+        try:
+            assert worker.start_refresher().interval == 0.5
+        finally:
+            worker.stop_refresher()
+
+    def test_unchanged_file_keeps_snapshot(self, publisher):
+        publish(publisher)
+        worker = SharedCatalogDataSource(publisher.snapshot_path, check_interval=0)
+        first = worker.get_snapshot()
+        assert worker.cache.refresh(force=True) is first
+
+    def test_new_version_is_swapped_in(self, publisher, upstream_server, raw_product_data):
+        publish(publisher)
+        worker = SharedCatalogDataSource(publisher.snapshot_path, check_interval=0)
+        old = worker.get_snapshot()
+        items = copy.deepcopy(raw_product_data)
+        items[0]["hidden"] = True
+        upstream_server.set_products(items)
+        publish(publisher, force=True)
+
+        new = worker.cache.refresh(force=True)
+        assert new is not old and new.version > old.version
+        assert new.raw_products[0].status == ProductStatus.HIDDEN
+        # requests holding the old snapshot still read its mapping
+        assert old.raw_products[0].status == ProductStatus.ACTIVE
+        assert old.columns.status[0] == ProductStatus.ACTIVE.value
+
+    def test_nothing_published(self, tmp_path):
+        worker = SharedCatalogDataSource(str(tmp_path / "catalog.shared"))
+        with pytest.raises(InvalidResponseError):
+            worker.get_snapshot()
+
+    def test_worker_process(self, publisher, get_active_prods):
+        publish(publisher)
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=count_active_products, args=(publisher.snapshot_path, queue))
+        process.start()
+        try:
+            assert queue.get(timeout=30) == len(set(get_active_prods))
+        finally:
+            process.join(30)
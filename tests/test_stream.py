@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from datasource.rest import RestDataSource
+from datasource.stream import iter_json_array
+
+
+def split_into_chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterJsonArray:
+    @pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 100000])
+    def test_items_are_parsed_across_chunk_boundaries(self, raw_product_data, chunk_size):
+        document = json.dumps({"count": 12345, "meta": {"a": [1, 2, {"b": "}]"}]},
+                               "products": raw_product_data, "next": None}).encode()
+        items = iter_json_array(split_into_chunks(document, chunk_size), "products")
+        assert list(items) == raw_product_data
+
+    def test_numbers_and_multibyte_characters_split_between_chunks(self):
+        document = json.dumps({"products": [123456789, -1.5e10, "Crème brûlée ✓", True, None]},
+                              ensure_ascii=False).encode()
+        assert list(iter_json_array(split_into_chunks(document, 3), "products")) == [
+            123456789, -1.5e10, "Crème brûlée ✓", True, None
+        ]
+
+    def test_empty_array(self):
+        assert list(iter_json_array([b'{"products" : [ ] }'], "products")) == []
+
+    def test_items_are_yielded_before_the_document_is_complete(self):
+        def chunks():
+            yield b'{"products": [{"id": 1}, '
+            raise AssertionError("read too far")
+
+        assert next(iter_json_array(chunks(), "products")) == {"id": 1}
+
+    @pytest.mark.parametrize("document", [b'{"items": []}', b'{"products": [1, 2', b'[1, 2]'])
+    def test_missing_key_or_truncated_document_raises_value_error(self, document):
+        with pytest.raises(ValueError):
+            list(iter_json_array(split_into_chunks(document, 4), "products"))
+
+
+@pytest.mark.usefixtures("upstream_server")
+class TestStreamingRestDataSource:
+    def test_streamed_catalog_matches_decoded_catalog(self, upstream_server):
+        streaming = RestDataSource(upstream_server.url, stream=True)
+        streaming.stream_chunk_size = 16
+        buffered = RestDataSource(upstream_server.url)
+        assert streaming.get_raw_product_data() == buffered.get_raw_product_data()
+        assert set(streaming.get_processed_product_data()) == set(buffered.get_processed_product_data())
+
+    def test_iter_raw_product_data_is_a_generator(self, upstream_server, get_product_lst):
+        data_source = RestDataSource(upstream_server.url, stream=True)
+        products = data_source.iter_raw_product_data()
+        assert next(products) == get_product_lst[0]
+        assert [product.product_id for product in products] == [
+            product.product_id for product in get_product_lst[1:]
+        ]
+
+    def test_streamed_snapshot_is_reused_on_not_modified(self, upstream_server):
+        data_source = RestDataSource(upstream_server.url, cache_ttl=0, stale_ttl=0, stream=True)
+        first = data_source.get_snapshot()
+        assert data_source.get_snapshot() is first
+        assert upstream_server.not_modified == 1
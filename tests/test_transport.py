@@ -0,0 +1,57 @@
+import pytest
+
+from datasource.rest import RestDataSource, InvalidResponseError
+
+
+@pytest.mark.usefixtures("upstream_server")
+class TestHttpTransport:
+    def test_fetches_reuse_one_pooled_connection(self, upstream_server):
+        data_source = RestDataSource(upstream_server.url, cache_ttl=0, stale_ttl=0)
+        for _ in range(5):
+            data_source.get_data_from_api()
+        assert upstream_server.requests == 5
+        # only one TCP handshake for all requests
+        assert upstream_server.connections == 1
+
+    def test_not_modified_catalog_reuses_parsed_snapshot(self, upstream_server):
+        data_source = RestDataSource(upstream_server.url, cache_ttl=0, stale_ttl=0)
+        first = data_source.get_snapshot()
+        second = data_source.get_snapshot()
+        assert upstream_server.requests == 2
+        assert upstream_server.not_modified == 1
+        assert second is first
+        assert second.etag is not None
+
+    def test_changed_catalog_creates_new_snapshot(self, upstream_server, raw_product_data):
+        data_source = RestDataSource(upstream_server.url, cache_ttl=0, stale_ttl=0)
+        first = data_source.get_snapshot()
+        upstream_server.set_products(raw_product_data[:3])
+        second = data_source.get_snapshot()
+        assert second.version > first.version
+        assert len(second.raw_products) == 3
+
+    def test_compressed_body_is_decoded(self, upstream_server, raw_product_data):
+        data_source = RestDataSource(upstream_server.url)
+        assert data_source.get_data_from_api() == raw_product_data
+        assert upstream_server.encodings[-1] in ("gzip", "br")
+
+    def test_retries_server_errors_with_backoff(self, upstream_server, raw_product_data):
+        upstream_server.fail_next = [503, 502]
+        data_source = RestDataSource(upstream_server.url, retries=2)
+        data_source.transport.session.get_adapter(upstream_server.url).max_retries.backoff_factor = 0
+        assert data_source.get_data_from_api() == raw_product_data
+        assert upstream_server.requests == 3
+
+    def test_gives_up_after_bounded_retries(self, upstream_server):
+        upstream_server.fail_next = [503, 503, 503]
+        data_source = RestDataSource(upstream_server.url, retries=1)
+        data_source.transport.session.get_adapter(upstream_server.url).max_retries.backoff_factor = 0
+        with pytest.raises(InvalidResponseError):
+            data_source.get_data_from_api()
+        assert upstream_server.requests == 2
+
+    def test_read_timeout_raises_invalid_response(self, upstream_server):
+        upstream_server.add_route("/", {"products": []}, delay=0.5)
+        data_source = RestDataSource(upstream_server.url, timeout=(1, 0.1), retries=0)
+        with pytest.raises(InvalidResponseError):
+            data_source.get_data_from_api()
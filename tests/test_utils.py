@@ -1,7 +1,7 @@
 import pytest
 from collections import OrderedDict
 
-from utils import parse_sort_by_arg
+from utils import parse_sort_by_arg, iter_chunks
 
 
 class TestUtils:
@@ -21,4 +21,12 @@ class TestUtils:
         sort_by_arg = "%2bprice,-brand_name"
         with pytest.raises(ValueError) as exception_context:
             parse_sort_by_arg(sort_by_arg)
-            
\ No newline at end of file
+            
+    @pytest.mark.parametrize("strings, chunk_size, expected_response", [
+        (["ab", "c", "def", "g"], 3, ["abc", "def", "g"]),
+        (["abcdef"], 2, ["abcdef"]),
+        ([], 5, []),
+        (["a", "b"], 10, ["ab"]),
+    ])
+    def test_iter_chunks(self, strings, chunk_size, expected_response):
+        assert list(iter_chunks(strings, chunk_size)) == expected_response
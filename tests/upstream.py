@@ -0,0 +1,148 @@
+# local stand-in for the upstream product list, used by tests which need a real HTTP server
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+class UpstreamServer:
+    """
+    serves {"products": [...]} on http://127.0.0.1:<port>/ with keep-alive, ETag/Last-Modified validators and
+    gzip/brotli compression. It counts the accepted connections (handshakes) and the received requests.
+    Paths can be given their own products with add_route(), e.g. for shards or pages.
+    """
+    last_modified = "Wed, 01 Jun 2022 10:00:00 GMT"
+
+    def __init__(self, products=None, delay=0.0):
+        self.routes = {}
+        self.delay = delay
+        self.fail_next = []  # status codes returned (and consumed) before the real response
+        self.connections = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.encodings = []
+        self.compressed = {}  # (body, encoding) -> compressed body, compressed once like a static file
+        self.lock = threading.Lock()
+        if products is not None:
+            self.set_products(products)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/".format(self.httpd.server_address[1])
+
+    def set_products(self, products, path="/"):
+        self.add_route(path, {"products": products})
+
+    def add_route(self, path, payload, delay=None):
+        body = json.dumps(payload).encode()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        self.routes[path] = (body, etag, self.delay if delay is None else delay)
+
+    def add_file_route(self, path, file_path, delay=None):
+        """
+        serves the JSON payload in file_path on path. The file is streamed uncompressed on every request instead of
+        being kept in memory, e.g. for catalogs of millions of products
+        """
+        digest = hashlib.sha1()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        self.routes[path] = (file_path, '"{}"'.format(digest.hexdigest()), self.delay if delay is None else delay)
+
+    def compress(self, body, encoding):
+        key = (body, encoding)
+        if key not in self.compressed:
+            self.compressed[key] = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body)
+        return self.compressed[key]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    status = server.fail_next.pop(0) if server.fail_next else None
+                route = server.routes.get(self.path.split("?")[0])
+                if route is None:
+                    status = 404
+                if status is not None:
+                    return self._send(status, b"")
+                body, etag, delay = route
+                if delay:
+                    time.sleep(delay)
+                if self.headers.get("If-None-Match") == etag:
+                    with server.lock:
+                        server.not_modified += 1
+                    return self._send(304, b"", {"ETag": etag})
+                headers = {"ETag": etag, "Last-Modified": server.last_modified, "Content-Type": "application/json"}
+                if isinstance(body, str):
+                    return self._send_file(body, headers)
+                accept = self.headers.get("Accept-Encoding", "")
+                if "br" in accept and brotli is not None:
+                    body, headers["Content-Encoding"] = server.compress(body, "br"), "br"
+                elif "gzip" in accept:
+                    body, headers["Content-Encoding"] = server.compress(body, "gzip"), "gzip"
+                server.encodings.append(headers.get("Content-Encoding"))
+                self._send(200, body, headers)
+
+            def _send_file(self, file_path, headers):
+                with open(file_path, "rb") as file:
+                    self._send(200, b"", dict(headers, **{"Content-Length": str(os.fstat(file.fileno()).st_size)}))
+                    try:
+                        shutil.copyfileobj(file, self.wfile, 1 << 20)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if status != 304 and "Content-Length" not in (headers or {}):
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    try:
+                        self.wfile.write(body)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # the client gave up waiting, e.g. after a read timeout
+                        pass
+
+        return Handler
@@ -1,7 +1,42 @@
-from typing import Dict, Any
+import zlib
+from typing import Dict, Any, Iterable, Iterator
 from collections import OrderedDict
 
 
+def iter_chunks(strings: Iterable[str], chunk_size: int) -> Iterator[str]:
+    """
+    joins many small strings (e.g. the output of a streamed template) into chunks of at least chunk_size characters
+    :param strings: iterable of strings
+    :param chunk_size: min no of characters of a chunk, the last chunk can be shorter
+    :return: generator of chunks
+    """
+    buffer, size = [], 0
+    for string in strings:
+        buffer.append(string)
+        size += len(string)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_gzip(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    compresses a stream on the fly, e.g. the body of a streamed response, without holding more than a chunk
+    :param chunks: iterable of bytes
+    :param level: zlib compression level, 1 is the fastest and 9 the smallest
+    :return: generator of the gzip stream of the concatenated chunks
+    """
+    # wbits 16 + 15 writes the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
 # Ref: https://www.moesif.com/blog/technical/api-design/REST-API-Design-Filtering-Sorting-and-Pagination/#multi-column-sort
 # Example: GET /users?sort_by=+email and GET /users?sort_by=-email
 # Don't forget to encode plus sign in html request